@@ -0,0 +1,147 @@
+# Command line tool for .cdb files, runs without IDA and Qt: python -m classy <command> ...
+import sys
+import time
+import argparse
+
+import classy.export as export
+import classy.jsonl as jsonl
+from classy.offline import OfflineDatabase
+
+
+def load(path):
+    start = time.time()
+    db = OfflineDatabase.load(path)
+    log('Loaded %s: %d classes in %.2fs' % (path, len(db.classes_by_name), time.time() - start))
+    return db
+
+
+def log(txt):
+    sys.stderr.write(txt + '\n')
+
+
+# Mangles everything up front, returns False and prints the failures if any signature cannot be mangled
+def mangle_checked(db):
+    db.mangle_all()
+    for m, e in sorted(db.mangle_errors.items(), key=lambda i: i[0].get_signature()):
+        log('Cannot mangle %s: %s' % (m.get_signature(), e))
+    return not len(db.mangle_errors)
+
+
+def cmd_symbols(args):
+    db = load(args.database)
+    if not mangle_checked(db):
+        return 1
+
+    snapshot = db.snapshot_symbols()
+    if args.mode == 'single':
+        export.write_symbols(args.output, snapshot)
+        log('Exported %d classes to %s' % (len(snapshot), args.output))
+    else:
+        class_hashes, dirty, written = export.write_symbols_incremental(args.output, snapshot, args.mode)
+        log('Exported symbols to %s: %d changed classes, %d files written' % (args.output, len(dirty), written))
+    return 0
+
+
+def cmd_headers(args):
+    db = load(args.database)
+    written, unchanged = export.write_headers(args.output, db.snapshot_definitions(), args.mode)
+    log('Exported headers to %s: %d written, %d unchanged' % (args.output, written, unchanged))
+    return 0
+
+
+def cmd_jsonl(args):
+    db = load(args.database)
+    db.mangle_all()
+    jsonl.write(args.output, jsonl.iter_records(list(db.hierarchy.iter_all()), db.typedefs, db.pure_virtual_vals,
+                                                db.deleted_virtual_vals))
+    log('Exported %s' % args.output)
+    return 0
+
+
+# Mangling failures and methods sharing a mangled name
+def cmd_check(args):
+    db = load(args.database)
+    ok = mangle_checked(db)
+
+    for m, mangled in sorted(db.mangled_index.collisions.items(), key=lambda i: i[1]):
+        log('%s is used by %s and %s' % (mangled, db.mangled_index.find(mangled).get_signature(), m.get_signature()))
+        ok = False
+
+    log('%d methods checked' % len(db.mangled_index))
+    return 0 if ok else 1
+
+
+def cmd_stats(args):
+    db = load(args.database)
+    for key, value in db.stats().items():
+        if isinstance(value, dict):
+            print('%s: %d' % (key, sum(value.values())))
+            for sub_key, sub_value in sorted(value.items()):
+                print('  %s: %d' % (sub_key, sub_value))
+        else:
+            print('%s: %d' % (key, value))
+    return 0
+
+
+def cmd_merge(args):
+    db = load(args.database)
+    other = load(args.other)
+    db.activate()
+
+    added_classes, added_methods, conflicts = db.merge(other)
+    for c in conflicts:
+        log(c)
+
+    db.save(args.output)
+    log('Merged %s into %s: %d classes, %d methods added, %d conflicts' %
+        (args.other, args.output, added_classes, added_methods, len(conflicts)))
+    return 0 if not len(conflicts) else 2
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m classy', description='Work with Classy databases without IDA')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    p = commands.add_parser('symbols', help='export the linker script')
+    p.add_argument('database')
+    p.add_argument('-o', '--output', required=True)
+    p.add_argument('--mode', choices=export.SYMBOL_EXPORT_MODES, default='single')
+    p.set_defaults(fn=cmd_symbols)
+
+    p = commands.add_parser('headers', help='export C++ headers, without struct members')
+    p.add_argument('database')
+    p.add_argument('-o', '--output', required=True, help='output directory')
+    p.add_argument('--mode', choices=export.HEADER_EXPORT_MODES, default='class')
+    p.set_defaults(fn=cmd_headers)
+
+    p = commands.add_parser('jsonl', help='export JSON Lines')
+    p.add_argument('database')
+    p.add_argument('-o', '--output', required=True)
+    p.set_defaults(fn=cmd_jsonl)
+
+    p = commands.add_parser('check', help='check that all signatures mangle to unique names')
+    p.add_argument('database')
+    p.set_defaults(fn=cmd_check)
+
+    p = commands.add_parser('stats', help='print statistics')
+    p.add_argument('database')
+    p.set_defaults(fn=cmd_stats)
+
+    p = commands.add_parser('merge', help='add the classes and methods of another database')
+    p.add_argument('database')
+    p.add_argument('other')
+    p.add_argument('-o', '--output', required=True)
+    p.set_defaults(fn=cmd_merge)
+
+    args = parser.parse_args(argv)
+
+    try:
+        return args.fn(args)
+    except (IOError, ValueError) as e:
+        log('Error: %s' % str(e))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+# Applies a Classy database to the open IDB without any UI, for use with idat, e.g.
+#   idat -A -L classy.log -S"classy_batch.py game.cdb" game.elf
+# Exits IDA with 0 if everything was applied, 1 if some entries could not be applied and 2 if the database could not
+# be applied at all.
+import os
+import time
+import argparse
+import traceback
+
+import idc
+import ida_auto
+import ida_funcs
+
+import classy.database as database
+import classy.database_entries as database_entries
+import classy.struct_layout as struct_layout
+import classy.vtable_types as vtable_types
+from classy.util import log
+
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_ERROR = 2
+
+
+class BatchReport(object):
+    def __init__(self):
+        self.timings = []
+        self.failures = []
+
+
+    def run_phase(self, title, fn, *args):
+        start = time.time()
+        ret = fn(*args)
+        self.timings.append((title, time.time() - start))
+        return ret
+
+
+    def fail(self, txt):
+        self.failures.append(txt)
+
+
+    def write(self):
+        for title, duration in self.timings:
+            log('%-32s %8.2fs' % (title, duration))
+        log('%-32s %8.2fs' % ('Total', sum(duration for _, duration in self.timings)))
+        for txt in self.failures:
+            log('Failed: %s' % txt)
+        log('%d failures' % len(self.failures))
+
+
+
+# Replaces an instance that is already there, e.g. of the plugin, it is closed without saving
+def open_database(path):
+    if not os.path.isfile(path):
+        raise ValueError('%s does not exist' % path)
+
+    try:
+        database.get().close()
+        database.destroy_instance()
+        log('Replaced the existing Classy database instance')
+    except ValueError:
+        pass
+
+    db = database.create_instance()
+    db.path = path
+    db.open()
+    return db
+
+
+def create_functions(db, report):
+    for m in db.iter_methods():
+        if m.ea == idc.BADADDR or ida_funcs.get_func(m.ea) is not None:
+            continue
+        if not ida_funcs.add_func(m.ea):
+            report.fail('Cannot create a function at 0x%X for %s' % (m.ea, m.get_signature()))
+
+
+def apply_vtables(db, report):
+    for c in db.hierarchy.iter_all():
+        for idx, dst in c.apply_vtable_data():
+            report.fail('VTable entry %d of %s points to 0x%X, which is not %s' %
+                        (idx, c.name, dst, c.vmethods[idx].get_signature()))
+
+
+# Struct ids are only valid in the IDB they were created in. Classes are relinked to the struct with their name,
+# which is created empty if it doesn't exist.
+def link_structs(db, report):
+    classes_by_struct_id = {}
+    for c in db.hierarchy.iter_all():
+        if c.struct_id == idc.BADADDR:
+            continue
+
+        struct_id = idc.get_struc_id(c.safe_name())
+        if struct_id == idc.BADADDR:
+            struct_id = idc.add_struc(-1, c.safe_name(), 0)
+        if struct_id == idc.BADADDR or struct_id in classes_by_struct_id:
+            report.fail('Cannot create the struct %s' % c.safe_name())
+            c.struct_id = idc.BADADDR
+            continue
+
+        c.struct_id = struct_id
+        classes_by_struct_id[struct_id] = c
+
+    db.classes_by_struct_id = classes_by_struct_id
+    db.vcall_index.clear()
+    struct_layout.cache.clear()
+
+
+def apply_names(db, report):
+    for _ in database_entries.iter_refresh_all():
+        pass
+
+
+def check_names(db, report):
+    for m in db.iter_methods():
+        if m.ea == idc.BADADDR:
+            continue
+        mangled = db.mangled_index.get_mangled(m)
+        if mangled is None:
+            report.fail('Cannot mangle %s' % m.get_signature())
+        elif db.mangled_index.is_collided(m):
+            report.fail('%s has the same mangled name as %s' % (m.get_signature(), db.find_method_by_mangled(mangled).get_signature()))
+        elif idc.get_name(m.ea) != mangled:
+            report.fail('Cannot name 0x%X %s' % (m.ea, mangled))
+
+
+def apply_vtable_types(db, report):
+    updated, failed = vtable_types.update_vtable_types(True)
+    for name in failed:
+        report.fail('The VTable type of %s has untyped entries' % name)
+
+
+def run(args, report):
+    report.run_phase('Waiting for auto analysis', ida_auto.auto_wait)
+
+    db = report.run_phase('Loading database', open_database, args.database)
+    log('Applying %s: %d classes' % (args.database, len(db.classes_by_name)))
+
+    report.run_phase('Creating functions', create_functions, db, report)
+    report.run_phase('Applying vtables', apply_vtables, db, report)
+    report.run_phase('Linking structs', link_structs, db, report)
+    report.run_phase('Applying names and comments', apply_names, db, report)
+    report.run_phase('Checking names', check_names, db, report)
+    if not args.no_types:
+        report.run_phase('Updating VTable types', apply_vtable_types, db, report)
+
+    if args.output:
+        report.run_phase('Saving database', db.save_as, args.output)
+    if not args.no_save:
+        report.run_phase('Saving IDB', idc.save_database, '')
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='classy_batch.py', description='Apply a Classy database to the IDB')
+    parser.add_argument('database')
+    parser.add_argument('-o', '--output', help='save the database with the relinked structs to this path')
+    parser.add_argument('--no-types', action='store_true', help='don\'t create the vtable types')
+    parser.add_argument('--no-save', action='store_true', help='don\'t save the IDB')
+
+    report = BatchReport()
+    status = EXIT_OK
+
+    try:
+        args = parser.parse_args(argv)
+        idc.batch(1)
+        run(args, report)
+        if len(report.failures):
+            status = EXIT_FAILURES
+    except SystemExit as e:
+        status = EXIT_ERROR if e.code else EXIT_OK
+    except Exception:
+        log(traceback.format_exc())
+        status = EXIT_ERROR
+
+    report.write()
+    return status
+
+
+def main_and_exit(argv):
+    idc.qexit(main(argv))
@@ -4,7 +4,7 @@ import ida_typeinf
 import ida_kernwin
 from PyQt5 import QtWidgets, QtCore
 
-import classy.util as util
+import classy.widgets as widgets
 import classy.itanium_mangler as itanium_mangler
 
 
@@ -50,7 +50,7 @@ class ChooseStructDialog(QtWidgets.QDialog):
 
         struct_id = idc.get_struc_id(new_name)
         if struct_id != idc.BADADDR:
-            if util.ask_yes_no('The struct "%s" already exists. Do you want to select it anyways?' % new_name):
+            if widgets.ask_yes_no('The struct "%s" already exists. Do you want to select it anyways?' % new_name):
                 self.struct_id = struct_id
                 self.accept()
                 return
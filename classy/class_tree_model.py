@@ -0,0 +1,175 @@
+from PyQt5 import QtCore
+
+import classy.database as database
+
+
+# The class hierarchy as a tree model. The children of a class are only fetched once the view expands it, after that
+# the model keeps its own copy of the child list, so changes to the database have to be announced with class_added,
+# class_removed, class_moved and class_changed, or with reset for everything else.
+class ClassTreeModel(QtCore.QAbstractItemModel):
+    def __init__(self, parent=None):
+        super(ClassTreeModel, self).__init__(parent)
+        self.children = {}      # Fetched child lists by parent class, None is the root
+        self.rows = {}
+        self.parents = {}       # Parent class in the model, differs from the base while a class is moved
+
+
+    def reset(self):
+        self.beginResetModel()
+        self.children = {}
+        self.rows = {}
+        self.parents = {}
+        self.endResetModel()
+
+
+    @staticmethod
+    def class_of(index):
+        return index.internalPointer() if index.isValid() else None
+
+
+    @staticmethod
+    def source_children(c):
+        return database.get().root_classes if c is None else c.derived
+
+
+    def update_rows(self, parent):
+        for row, c in enumerate(self.children[parent]):
+            self.rows[c] = row
+            self.parents[c] = parent
+
+
+    # Index of a class, fetches the children of all its ancestors if needed
+    def index_of(self, c):
+        if c is None:
+            return QtCore.QModelIndex()
+        if c not in self.rows:
+            parent_index = self.index_of(c.base)
+            if c.base not in self.children:
+                self.fetchMore(parent_index)
+            if c not in self.rows:
+                return QtCore.QModelIndex()
+        return self.createIndex(self.rows[c], 0, c)
+
+
+    def class_added(self, c):
+        children = self.children.get(c.base)
+        if children is None:
+            if c.base is not None and len(c.base.derived) == 1:
+                # The parent gets its expand indicator
+                parent_index = self.index_of(c.base)
+                self.dataChanged.emit(parent_index, parent_index)
+            return
+
+        row = len(children)
+        self.beginInsertRows(self.index_of(c.base), row, row)
+        children.append(c)
+        self.rows[c] = row
+        self.parents[c] = c.base
+        self.endInsertRows()
+
+
+    def class_removed(self, c):
+        self.remove_row(c)
+
+
+    # A class that got another base, after set_base
+    def class_moved(self, c):
+        self.remove_row(c)
+        self.class_added(c)
+
+
+    def remove_row(self, c):
+        if c in self.rows:
+            parent = self.parents[c]
+            row = self.rows[c]
+            self.beginRemoveRows(self.parent_index(c), row, row)
+            del self.children[parent][row]
+            self.update_rows(parent)
+            self.endRemoveRows()
+
+        self.forget_subtree(c)
+
+
+    # Drops everything the model knows about the class and the classes below it
+    def forget_subtree(self, c):
+        stack = [c]
+        while len(stack):
+            d = stack.pop()
+            self.rows.pop(d, None)
+            self.parents.pop(d, None)
+            stack.extend(self.children.pop(d, ()))
+
+
+    def class_changed(self, c):
+        if c not in self.rows:
+            return
+        index = self.index_of(c)
+        self.dataChanged.emit(index, index)
+
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        children = self.children.get(self.class_of(parent))
+        if children is None or not 0 <= row < len(children) or column != 0:
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, children[row])
+
+
+    def parent(self, index):
+        c = self.class_of(index)
+        if c is None:
+            return QtCore.QModelIndex()
+        return self.parent_index(c)
+
+
+    def parent_index(self, c):
+        parent = self.parents.get(c)
+        if parent is None:
+            return QtCore.QModelIndex()
+        return self.createIndex(self.rows[parent], 0, parent)
+
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return len(self.children.get(self.class_of(parent), ()))
+
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 1
+
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        c = self.class_of(parent)
+        if c in self.children:
+            return len(self.children[c]) > 0
+        return len(self.source_children(c)) > 0
+
+
+    def canFetchMore(self, parent):
+        c = self.class_of(parent)
+        return c not in self.children and len(self.source_children(c)) > 0
+
+
+    def fetchMore(self, parent):
+        c = self.class_of(parent)
+        if c in self.children:
+            return
+
+        source = list(self.source_children(c))
+        if not len(source):
+            self.children[c] = []
+            return
+
+        self.beginInsertRows(parent, 0, len(source) - 1)
+        self.children[c] = source
+        self.update_rows(c)
+        self.endInsertRows()
+
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        c = self.class_of(index)
+        if c is None:
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return c.name
+        if role == QtCore.Qt.UserRole:
+            return c
+        return None
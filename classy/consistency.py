@@ -0,0 +1,195 @@
+# Compares the whole database with the IDB. Names, functions and structs are read from the IDB in one pass each and
+# joined with the database in memory, instead of asking IDA about every address on its own.
+import idc
+import idautils
+
+import classy.database as database
+import classy.idb_changes as idb_changes
+from classy.idb_changes import IDBChanges
+
+
+NOT_MANGLED = 'not mangled'
+NAME_TAKEN = 'name taken'
+STALE_STRUCT = 'stale struct'
+STRUCT_RENAMED = 'struct renamed'
+
+# Category -> title, in report order
+CATEGORIES = [
+    (idb_changes.RENAMED, 'Methods without their mangled name'),
+    (NAME_TAKEN, 'Methods whose mangled name is used elsewhere'),
+    (NOT_MANGLED, 'Methods that cannot be mangled'),
+    (idb_changes.NO_FUNCTION, 'Methods that are no function'),
+    (STALE_STRUCT, 'Classes linked to a struct that does not exist'),
+    (STRUCT_RENAMED, 'Classes linked to a struct with another name'),
+    (idb_changes.VTABLE_UNDEFINED, 'Classes whose vtable is not made of offsets'),
+]
+
+# Writing the database to the IDB again fixes these. Structs with another name are only listed, they might have been
+# linked on purpose.
+REPAIRABLE = [idb_changes.RENAMED, idb_changes.NO_FUNCTION, STALE_STRUCT, idb_changes.VTABLE_UNDEFINED]
+
+YIELD_INTERVAL = 1000
+
+
+
+class ConsistencyReport(object):
+    def __init__(self):
+        self.problems = {}          # Category -> [(entry, detail)]
+        self.checked_methods = 0
+        self.checked_classes = 0
+
+
+    def __len__(self):
+        return sum(len(p) for p in self.problems.values())
+
+
+    def add(self, category, entry, detail=''):
+        self.problems.setdefault(category, []).append((entry, detail))
+
+
+    # Repairable entries with their categories
+    def repairable(self):
+        entries = {}
+        for category in REPAIRABLE:
+            for entry, _ in self.problems.get(category, []):
+                entries.setdefault(entry, set()).add(category)
+        return entries
+
+
+    def iter_categories(self):
+        for category, title in CATEGORIES:
+            if category in self.problems:
+                yield category, title, self.problems[category]
+
+
+    def write_log(self):
+        from classy.util import log
+
+        log('Checked %d methods and %d classes' % (self.checked_methods, self.checked_classes))
+        for category, title, problems in self.iter_categories():
+            log('%s: %d' % (title, len(problems)))
+
+
+
+def describe(entry):
+    if idb_changes.is_class(entry):
+        return entry.name
+    return entry.get_signature()
+
+
+# The address to jump to for an entry
+def entry_ea(entry):
+    if idb_changes.is_class(entry):
+        return entry.vtable_start if entry.vtable_start is not None else idc.BADADDR
+    return entry.ea
+
+
+# Fills the report, yields the number of processed items every now and then so it can run as a job
+def iter_check(report):
+    db = database.get()
+
+    names = {}
+    eas_by_name = {}
+    for i, (ea, name) in enumerate(idautils.Names()):
+        names[ea] = name
+        eas_by_name[name] = ea
+        if i % YIELD_INTERVAL == YIELD_INTERVAL - 1:
+            yield YIELD_INTERVAL
+
+    functions = set()
+    for i, ea in enumerate(idautils.Functions()):
+        functions.add(ea)
+        if i % YIELD_INTERVAL == YIELD_INTERVAL - 1:
+            yield YIELD_INTERVAL
+
+    struct_names = {}
+    for _, struct_id, name in idautils.Structs():
+        struct_names[struct_id] = name
+    yield 1
+
+    for m in db.iter_methods():
+        if m.ea != idc.BADADDR:
+            check_method(db, report, m, names, eas_by_name, functions)
+            report.checked_methods += 1
+            if report.checked_methods % YIELD_INTERVAL == 0:
+                yield YIELD_INTERVAL
+
+    stale_classes = set()
+    for c in db.classes_by_name.values():
+        check_class(db, report, c, struct_names, stale_classes)
+        report.checked_classes += 1
+        if report.checked_classes % YIELD_INTERVAL == 0:
+            yield YIELD_INTERVAL
+
+    # Each class is reported once, repairing it drops all its stale registrations
+    for struct_id, c in db.classes_by_struct_id.items():
+        if c.struct_id != struct_id and c not in stale_classes:
+            stale_classes.add(c)
+            report.add(STALE_STRUCT, c, 'still registered for the struct 0x%X' % struct_id)
+
+
+def check_method(db, report, m, names, eas_by_name, functions):
+    if m.ea not in functions:
+        report.add(idb_changes.NO_FUNCTION, m, '0x%X' % m.ea)
+
+    mangled = db.mangled_index.get_mangled(m)
+    if mangled is None:
+        report.add(NOT_MANGLED, m)
+        return
+
+    if names.get(m.ea) == mangled:
+        return
+
+    other = db.mangled_index.find_collision(m, mangled)
+    if db.mangled_index.is_collided(m) and other is not None:
+        report.add(NAME_TAKEN, m, 'by %s' % other.get_signature())
+        return
+
+    named_ea = eas_by_name.get(mangled)
+    if named_ea is not None and named_ea != m.ea:
+        report.add(NAME_TAKEN, m, 'at 0x%X' % named_ea)
+        return
+
+    report.add(idb_changes.RENAMED, m, names.get(m.ea, 'unnamed'))
+
+
+def check_class(db, report, c, struct_names, stale_classes):
+    if c.struct_id != idc.BADADDR:
+        struct_name = struct_names.get(c.struct_id)
+        if struct_name is None:
+            stale_classes.add(c)
+            report.add(STALE_STRUCT, c, '0x%X' % c.struct_id)
+        elif struct_name != c.safe_name():
+            report.add(STRUCT_RENAMED, c, struct_name)
+
+    if c.vtable_start is not None:
+        idx = idb_changes.find_undefined_entry(c)
+        if idx is not None:
+            report.add(idb_changes.VTABLE_UNDEFINED, c, 'entry %d at 0x%X' % (idx, c.get_vtable_index_ea(idx)))
+
+
+# Writes the repairable entries of the report to the IDB again, one per iteration
+def iter_repair(report):
+    db = database.get()
+
+    for entry, categories in report.repairable().items():
+        if not idb_changes.is_linked(entry):
+            continue
+
+        if idb_changes.is_class(entry):
+            if STALE_STRUCT in categories:
+                unlink_stale_struct(db, entry)
+            IDBChanges.refresh_class(entry, categories)
+        else:
+            IDBChanges.refresh_method(entry, categories)
+        yield
+
+
+# Forgets the link to a struct that doesn't exist anymore, without touching the IDB
+def unlink_stale_struct(db, c):
+    for struct_id, other in list(db.classes_by_struct_id.items()):
+        if other is c and (struct_id != c.struct_id or not idc.get_struc_name(struct_id)):
+            del db.classes_by_struct_id[struct_id]
+    if c.struct_id != idc.BADADDR and not idc.get_struc_name(c.struct_id):
+        c.struct_id = idc.BADADDR
+    db.vcall_index.invalidate(c)
@@ -0,0 +1,72 @@
+import idaapi
+from PyQt5 import QtWidgets, QtCore
+
+import classy.consistency as consistency
+
+
+# Shown entries per category, a category can hold every method of a large database
+MAX_CATEGORY_ITEMS = 1000
+
+
+# Lists the problems of a consistency report by category. Repair accepts the dialog, the caller runs the repair.
+class ConsistencyDialog(QtWidgets.QDialog):
+    def __init__(self, report):
+        super(ConsistencyDialog, self).__init__()
+
+        self.report = report
+
+        self.setWindowTitle('Classy Consistency Check')
+        self.resize(800, 500)
+
+        layout = QtWidgets.QVBoxLayout(self)
+
+        layout.addWidget(QtWidgets.QLabel('Checked %d methods and %d classes, found %d problems.' %
+                                          (report.checked_methods, report.checked_classes, len(report))))
+
+        self.tree = QtWidgets.QTreeWidget()
+        self.tree.setHeaderLabels(['Entry', 'Detail'])
+        self.tree.setUniformRowHeights(True)
+        self.tree.itemDoubleClicked.connect(self.handle_item_double_clicked)
+        layout.addWidget(self.tree)
+
+        button_layout = QtWidgets.QHBoxLayout()
+        layout.addLayout(button_layout)
+
+        button_layout.addItem(QtWidgets.QSpacerItem(0, 0, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum))
+
+        repairable = len(report.repairable())
+        repair_btn = QtWidgets.QPushButton('Repair %d entries' % repairable)
+        repair_btn.setEnabled(repairable > 0)
+        repair_btn.clicked.connect(self.accept)
+        button_layout.addWidget(repair_btn)
+
+        close_btn = QtWidgets.QPushButton('Close')
+        close_btn.clicked.connect(self.reject)
+        button_layout.addWidget(close_btn)
+
+        self.update_tree()
+
+
+    def update_tree(self):
+        self.tree.clear()
+
+        for category, title, problems in self.report.iter_categories():
+            suffix = '' if category in consistency.REPAIRABLE else ', not repairable'
+            category_item = QtWidgets.QTreeWidgetItem(['%s (%d%s)' % (title, len(problems), suffix)])
+            self.tree.addTopLevelItem(category_item)
+
+            for entry, detail in problems[:MAX_CATEGORY_ITEMS]:
+                item = QtWidgets.QTreeWidgetItem([consistency.describe(entry), detail])
+                item.setData(0, QtCore.Qt.UserRole, consistency.entry_ea(entry))
+                category_item.addChild(item)
+
+            if len(problems) > MAX_CATEGORY_ITEMS:
+                category_item.addChild(QtWidgets.QTreeWidgetItem(['%d more' % (len(problems) - MAX_CATEGORY_ITEMS)]))
+
+        self.tree.resizeColumnToContents(0)
+
+
+    def handle_item_double_clicked(self, item, column):
+        ea = item.data(0, QtCore.Qt.UserRole)
+        if ea is not None and ea != idaapi.BADADDR:
+            idaapi.jumpto(ea)
@@ -1,34 +1,52 @@
 import _pickle as cPickle
 import idaapi
+import idc
 import os
-from datetime import datetime
 
 from classy.util import log
-from PyQt5 import QtCore
+from classy.interval_index import IntervalIndex
+from classy.hierarchy_index import HierarchyIndex
+from classy.mangled_index import MangledIndex
+from classy.vcall_index import VCallIndex
+from classy.search_index import SearchIndex
+from classy.type_index import TypeNameIndex
+from classy.idb_changes import IDBChanges
+# The mangler and the exporters are imported when first used, opening IDA without a Classy database doesn't need them
 
 
 class ClassyDatabase(object):
 
     CURRENT_VERSION = 1
 
-    NON_DICT_ATTRIBUTES = ['data', 'path', 'autosave_path', 'is_open', 'autosave_timer']
+    NON_DICT_ATTRIBUTES = ['data', 'path', 'autosave_path', 'is_open', 'autosave_timer', 'vtable_index',
+                           'hierarchy', 'mangled_index', 'compiled_typedefs',
+                           'vcall_index', 'search_index', 'type_index', 'idb_changes']
 
     NONE_DEFAULTS = []
-    HASH_DEFAULTS = ['classes_by_name', 'classes_by_struct_id', 'known_methods', 'typedefs']
+    HASH_DEFAULTS = ['classes_by_name', 'classes_by_struct_id', 'known_methods', 'typedefs', 'vtable_type_hashes']
     LIST_DEFAULTS = ['root_classes', 'pure_virtual_vals', 'deleted_virtual_vals']
-    DEFAULTS = {'autosave_interval': 60}
+    DEFAULTS = {'autosave_interval': 60, 'symbol_export_path': '', 'symbol_export_mode': 'single',
+                'header_export_path': '', 'header_export_mode': 'class', 'use_local_types': False}
 
 
     def __init__(self):
         self.data = {}
         self.is_open = False
+        self.vtable_index = IntervalIndex()
+        self.hierarchy = HierarchyIndex(lambda: self.root_classes)
+        self.mangled_index = MangledIndex()
+        self.compiled_typedefs = None
+        self.vcall_index = VCallIndex(lambda: self.classes_by_struct_id, lambda: self.classes_by_name,
+                                      idaapi.DEF_ADDRSIZE)
+        self.search_index = SearchIndex(self.iter_search_items)
+        self.type_index = TypeNameIndex(self.iter_type_names)
+        self.idb_changes = IDBChanges()
 
         idb_path = idaapi.get_path(idaapi.PATH_TYPE_IDB)
         self.path = os.path.splitext(idb_path)[0] + '.cdb'
         self.autosave_path = os.path.splitext(idb_path)[0] + '.autosave.cdb'
 
-        self.autosave_timer = QtCore.QTimer()
-        self.autosave_timer.timeout.connect(self.autosave)
+        self.autosave_timer = None
 
 
     def is_created(self):
@@ -48,31 +66,61 @@ class ClassyDatabase(object):
 
 
     def open(self):
-        try:
-            dbfile = open(self.path, 'rb')
-            self.data = cPickle.load(dbfile)
+        self.finish_open(*self.load())
+
+
+    # Reads the file and mangles all methods without touching IDA or this instance, so it can run on a worker thread.
+    # Returns the data and the result of mangle_methods for finish_open. Databases using the IDA local types are mangled
+    # by finish_open on the main thread instead, unless the local typedefs were read beforehand.
+    def load(self, local_typedefs=None):
+        data = self.read()
+        if data is None:
+            return None, None
+
+        if data.get('use_local_types', self.DEFAULTS['use_local_types']) and local_typedefs is None:
+            return data, None
 
-            if not hasattr(self, 'version'):
-                raise Exception('Database is corrupt!')
+        typedefs = compile_typedef_table(data, local_typedefs)
+        return data, self.mangle_methods([m for m in iter_methods(data) if m.ea != idc.BADADDR], typedefs)
 
-            if self.version != self.CURRENT_VERSION:
-                raise Exception('Version Mismatch! File: %s, Plugin: %s' % (self.version, self.CURRENT_VERSION))
 
+    # Reads and unpickles the database file without touching IDA, so it can run on a worker thread.
+    # Returns None if there is no database file yet.
+    def read(self):
+        try:
+            with open(self.path, 'rb') as dbfile:
+                data = cPickle.load(dbfile)
         except IOError:
-            pass
+            return None
+
+        if not isinstance(data, dict) or 'version' not in data:
+            raise Exception('Database is corrupt!')
+
+        if data['version'] != self.CURRENT_VERSION:
+            raise Exception('Version Mismatch! File: %s, Plugin: %s' % (data['version'], self.CURRENT_VERSION))
+
+        return data
+
+
+    # Takes the results of load, has to run on the main thread
+    def finish_open(self, data, mangled=None):
+        if data is not None:
+            self.data = data
 
         if not hasattr(self, 'version'):
             self.initialize()
 
-        self.is_open = True
-        self.autosave_timer.start(self.autosave_interval * 1000)
+        self.rebuild_indexes(mangled)
 
+        self.is_open = True
+        self.start_autosave()
 
 
     def close(self):
-        self.autosave_timer.stop()
+        self.stop_autosave()
         self.data = {}
         self.is_open = False
+        self.rebuild_indexes()
 
 
     def __getattr__(self, key):
@@ -120,28 +168,184 @@ class ClassyDatabase(object):
     def clear(self):
         self.data = {}
         self.initialize()
+        self.rebuild_indexes()
+
+
+    # Indexes are derived from the class data and therefore not saved
+    def rebuild_indexes(self, mangled=None):
+        self.hierarchy.invalidate()
+        self.compiled_typedefs = None
+        self.vcall_index.clear()
+        self.search_index.invalidate()
+        self.type_index.invalidate()
+        self.idb_changes.clear()
+
+        self.vtable_index.clear()
+        for c in self.data.get('classes_by_name', {}).values():
+            if c.vtable_start is None:
+                continue
+            try:
+                self.vtable_index.add(c.vtable_start, c.vtable_end, c)
+            except ValueError:
+                log('The VTable of %s overlaps another VTable' % c.name)
+
+        # Methods without an address have no name in the IDB, Method.refresh keeps them out of the index as well
+        self.mangled_index.clear()
+        if mangled is None:
+            mangled = self.mangle_methods([m for m in self.iter_methods() if m.ea != idc.BADADDR])
+        mangled_names, errors = mangled
+        for m, e in errors.items():
+            log('Mangling %s failed: %s' % (m.get_signature(), e))
+        for m, mangled in mangled_names.items():
+            if self.mangled_index.set(m, mangled) is not None:
+                log('The mangled name %s is used by multiple methods' % mangled)
+
+
+    # Mangles many methods at once using all cores, returns dicts of the mangled names and the errors by method
+    def mangle_methods(self, methods, typedefs=None):
+        import classy.parallel_mangler as parallel_mangler
+
+        if typedefs is None:
+            typedefs = self.typedef_table()
+
+        items = [(m.get_signature(False), m.ctor_type, m.dtor_type) for m in methods]
+        results = parallel_mangler.mangle_many(items, typedefs)
+
+        mangled_names = {}
+        errors = {}
+        for m, (ok, result) in zip(methods, results):
+            if ok:
+                mangled_names[m] = result
+            else:
+                errors[m] = result
+        return mangled_names, errors
+
+
+    # The typedefs in the form the mangler uses them, cached until the typedefs or the local types change
+    def typedef_table(self):
+        if self.compiled_typedefs is None:
+            self.compiled_typedefs = compile_typedef_table(self.data, self.local_typedefs())
+        return self.compiled_typedefs
+
+
+    def local_typedefs(self):
+        if not self.use_local_types:
+            return None
+        import classy.local_types as local_types
+        return local_types.cache.get_typedefs()
+
+
+    def set_use_local_types(self, use_local_types):
+        self.use_local_types = use_local_types
+        self.compiled_typedefs = None
+        self.type_index.invalidate()
+
+
+    # Called by the IDB hooks after the local type cache was cleared
+    def local_types_changed(self):
+        if self.use_local_types:
+            self.compiled_typedefs = None
+            self.type_index.invalidate()
+
+
+    def set_typedef(self, name, value):
+        if name not in self.typedefs:
+            self.type_index.add(name)
+        self.typedefs[name] = value
+        self.compiled_typedefs = None
+
+
+    def remove_typedef(self, name):
+        del self.typedefs[name]
+        self.compiled_typedefs = None
+        self.type_index.remove(name)
+
+
+    def iter_methods(self):
+        return iter_methods(self.data)
+
+
+    # Classes and methods with the texts the search index finds them by
+    def iter_search_items(self):
+        for c in self.classes_by_name.values():
+            yield c, c.search_texts()
+        for m in self.iter_methods():
+            yield m, m.search_texts()
+
+
+    # Everything that can be used as a type in signatures, for completion
+    def iter_type_names(self):
+        import classy.itanium_mangler as itanium_mangler
+
+        for name in itanium_mangler.BUILTIN_TYPES:
+            yield name
+        for name in self.classes_by_name:
+            yield name
+        for name in self.typedefs:
+            yield name
+        for name in (self.local_typedefs() or {}):
+            yield name
+
+
+    def find_method_by_mangled(self, mangled):
+        return self.mangled_index.find(mangled)
 
 
     def set_autosave_interval(self, interval):
         self.autosave_interval = interval
-        self.autosave_timer.stop()
+        self.stop_autosave()
         if self.is_open:
-            self.autosave_timer.start(self.autosave_interval * 1000)
+            self.start_autosave()
+
+
+    # The timer needs the Qt event loop, so there is no autosaving in batch mode
+    def start_autosave(self):
+        if not idaapi.is_idaq():
+            return
+        if self.autosave_timer is None:
+            from PyQt5 import QtCore
+            self.autosave_timer = QtCore.QTimer()
+            self.autosave_timer.timeout.connect(self.autosave)
+        self.autosave_timer.start(self.autosave_interval * 1000)
+
+
+    def stop_autosave(self):
+        if self.autosave_timer is not None:
+            self.autosave_timer.stop()
 
 
     def generate_symbols(self):
-        contents = []
-        contents.append('/*\n * Classy exported symbols')
-        contents.append(datetime.now().strftime(' * %x %X'))
-        contents.append(' */\n\n')
+        import classy.export as export
+
+        return export.generate_symbols(self.snapshot_symbols())
+
 
-        if len(self.classes_by_name) > 0:
-            contents.append('/*\n * Classes\n */\n\n')
-            for c_name in self.classes_by_name:
-                contents.append(self.classes_by_name[c_name].generate_symbols())
-                contents.append('')
+    # Class definitions of all classes, bases before derived classes
+    def snapshot_definitions(self):
+        return [c.snapshot_definition() for c in self.hierarchy.iter_all()]
 
-        return '\n'.join(contents)
+
+    # Immutable copy of all (mangled name, ea) pairs that can be exported without touching the database
+    def snapshot_symbols(self):
+        import classy.export as export
+
+        return export.snapshot_symbols(self.classes_by_name.values())
+
+
+    # JSON Lines records of the whole database (see classy.jsonl), generated while iterating
+    def iter_jsonl_records(self):
+        import classy.jsonl as jsonl
+
+        def struct_name_of(c):
+            return idc.get_struc_name(c.struct_id) if c.struct_id != idc.BADADDR else None
+
+        return jsonl.iter_records(list(self.hierarchy.iter_all()), dict(self.typedefs), list(self.pure_virtual_vals),
+                                  list(self.deleted_virtual_vals), struct_name_of)
+
+
+    # Upper bound, inherited vtable slots are not written
+    def jsonl_record_count(self):
+        return 1 + len(self.typedefs) + sum(1 + c.refresh_size() for c in self.classes_by_name.values())
 
 
     @staticmethod
@@ -156,6 +360,32 @@ class ClassyDatabase(object):
 
 
 
+# The typedefs of the database data, compiled for the mangler. With use_local_types the typedefs of the IDA local types
+# are added, unless a typedef or class of the database has the same name.
+def compile_typedef_table(data, local_typedefs):
+    import classy.itanium_mangler as itanium_mangler
+
+    typedefs = {}
+    if local_typedefs and data.get('use_local_types', ClassyDatabase.DEFAULTS['use_local_types']):
+        classes_by_name = data.get('classes_by_name', {})
+        for name, value in local_typedefs.items():
+            if name not in classes_by_name:
+                typedefs[name] = value
+    typedefs.update(data.get('typedefs', {}))
+    return itanium_mangler.compile_typedefs(typedefs)
+
+
+# Yields all methods and virtual methods of the database data once, virtual methods are yielded by the class that owns them
+def iter_methods(data):
+    for c in data.get('classes_by_name', {}).values():
+        for m in c.methods:
+            yield m
+        for vm in c.vmethods:
+            if vm is not None and vm.owner == c:
+                yield vm
+
+
+
 db = None
 
 
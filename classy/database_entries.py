@@ -4,6 +4,10 @@ import ida_bytes
 
 import classy.database as database
 import classy.itanium_mangler as itanium_mangler
+import classy.export as export
+import classy.struct_layout as struct_layout
+from classy.interval_index import IntervalIndex
+from classy.util import log
 
 
 class Class(object):
@@ -30,6 +34,9 @@ class Class(object):
         db.classes_by_name[name] = self
         if self.base is None:
             db.root_classes.append(self)
+        db.hierarchy.add(self)
+        db.search_index.set(self, self.search_texts())
+        db.type_index.add(name)
 
 
     def unlink(self, delete_orphaned_struct=False):
@@ -49,6 +56,11 @@ class Class(object):
             self.base.derived.remove(self)
 
         db = database.get()
+        db.vtable_index.remove(self)
+        db.hierarchy.remove(self)
+        db.vcall_index.invalidate(self)
+        db.search_index.remove(self)
+        db.type_index.remove(self.name)
         del db.classes_by_name[self.name]
         if self.base is None:
             db.root_classes.remove(self)
@@ -69,8 +81,12 @@ class Class(object):
         db = database.get()
         del db.classes_by_name[old_name]
         db.classes_by_name[new_name] = self
+        db.vcall_index.invalidate(self)
 
         self.name = new_name
+        db.search_index.set(self, self.search_texts())
+        db.type_index.remove(old_name)
+        db.type_index.add(new_name)
 
         # Try to rename the struct
         if self.struct_id != idc.BADADDR:
@@ -94,14 +110,43 @@ class Class(object):
 
 
     def refresh(self):
+        for _ in self.iter_refresh():
+            pass
+
+
+    # Refreshes one method per iteration. Methods in failed could not be mangled, they keep their names in the IDB.
+    def iter_refresh(self, mangled_names=None, failed=()):
+        if mangled_names is None:
+            mangled_names = {}
         for m in self.methods:
-            m.refresh()
+            if m not in failed:
+                m.refresh(mangled_names.get(m))
+            yield
         for m in self.vmethods:
-            m.refresh()
+            if m not in failed:
+                m.refresh(mangled_names.get(m))
+            yield
         self.refresh_struct_comment()
 
 
+    def refresh_size(self):
+        return len(self.methods) + len(self.vmethods)
+
+
+    def search_texts(self):
+        texts = [self.name]
+        if self.vtable_start is not None:
+            texts.append('%x' % self.vtable_start)
+        return texts
+
+
     def set_vtable_range(self, start, end):
+        self.prepare_vtable_range(start, end)
+        self.init_vtable()
+
+
+    # Checks and sets the new range without reading the vtable, iter_init_vtable has to be run afterwards
+    def prepare_vtable_range(self, start, end):
         if self.is_vtable_locked():
             raise ValueError('VTable cannot be modified because the class has derived classes')
         if start % 4 or end % 4:
@@ -112,22 +157,285 @@ class Class(object):
             new_len = (end - start) // 4
             if new_len < len(self.base.vmethods):
                 raise ValueError('VTable is smaller than base VTable')
-        # Todo: More sanity checks: Don't overwrite any other vtable
+        for c in database.get().vtable_index.find_overlapping(start, end):
+            if c != self:
+                raise ValueError('VTable overlaps the VTable of %s' % c.name)
 
         self.reset_vtable()
         self.vtable_start = start
         self.vtable_end = end
-        self.init_vtable()
+        self.update_vtable_index()
+
+
+    # Like set_vtable_range, but also works for classes with derived classes. The old and new slot arrays are diffed,
+    # slots inserted or removed in front of the old start are mirrored in all derived vtables, slots inserted or removed
+    # at the end move between the class and its derived classes. Untouched slots keep their entries and overrides.
+    def rebase_vtable(self, start, end):
+        if not self.is_vtable_locked():
+            self.set_vtable_range(start, end)
+            return
+
+        if start % 4 or end % 4:
+            raise ValueError('VTable start and end must be 4 byte aligned')
+        if start >= end:
+            raise ValueError('Vtable end must be after the start')
+        if self.base:
+            new_len = (end - start) // 4
+            if new_len < len(self.base.vmethods):
+                raise ValueError('VTable is smaller than base VTable')
+
+        # Slots inserted (positive) or removed (negative) in front of the old vtable start
+        front = 0 if self.vtable_start is None else (self.vtable_start - start) // 4
+
+        ranges = {self: (start, end)}
+        for c in self.iter_subtree():
+            if c == self:
+                continue
+            if c.vtable_start is None:
+                raise ValueError('The derived class %s has no VTable' % c.name)
+            c_start = c.vtable_start - front * 4
+            base_start, base_end = ranges[c.base]
+            if c_start >= c.vtable_end or (c.vtable_end - c_start) < (base_end - base_start):
+                raise ValueError('The VTable of the derived class %s would be smaller than its base VTable' % c.name)
+            ranges[c] = (c_start, c.vtable_end)
+
+        self.check_vtable_ranges(ranges)
+        self.rebuild_vtables(ranges, front)
+
+
+    # Checks that new ranges for a subtree neither overlap each other nor any VTable outside of the subtree
+    def check_vtable_ranges(self, ranges):
+        db = database.get()
+
+        new_index = IntervalIndex()
+        for c, (start, end) in ranges.items():
+            if start is None:
+                continue
+            for o in db.vtable_index.find_overlapping(start, end):
+                if o not in ranges:
+                    raise ValueError('The VTable of %s would overlap the VTable of %s' % (c.name, o.name))
+            try:
+                new_index.add(start, end, c)
+            except ValueError:
+                raise ValueError('The VTable of %s would overlap another VTable of the rebased classes' % c.name)
+
+
+    # Moves the class (and all of its derived classes) below another base class
+    def set_base(self, new_base):
+        if new_base == self.base:
+            return
+
+        if new_base is not None:
+            if new_base == self or self.is_base_of(new_base):
+                raise ValueError('A class cannot be derived from itself or from one of its derived classes')
+            if not new_base.can_be_derived():
+                raise ValueError('The class %s cannot be derived because the VTable is not setup correctly' % new_base.name)
+            if self.vtable_start is None:
+                if len(new_base.vmethods):
+                    raise ValueError('The class %s has no VTable' % self.name)
+            elif (self.vtable_end - self.vtable_start) // 4 < len(new_base.vmethods):
+                raise ValueError('VTable is smaller than base VTable')
+
+        ranges = {}
+        for c in self.iter_subtree():
+            ranges[c] = (c.vtable_start, c.vtable_end)
+
+        def relink():
+            db = database.get()
+            if self.base is None:
+                db.root_classes.remove(self)
+            else:
+                self.base.derived.remove(self)
+            self.base = new_base
+            if self.base is None:
+                db.root_classes.append(self)
+            else:
+                self.base.derived.append(self)
+            db.hierarchy.move(self)
+
+        self.rebuild_vtables(ranges, 0, relink)
+
+
+    # Applies new ranges to the vtables of the class and its derived classes, bases before derived classes. Slot j of a
+    # new vtable corresponds to slot j - front of the old one. Only slots without a counterpart or whose base slot changed
+    # are read from the IDB again, all other entries are kept as they are.
+    def rebuild_vtables(self, ranges, front=0, relink=None):
+        db = database.get()
+
+        subtree = list(self.iter_subtree())
+        old_vmethods = dict((c, list(c.vmethods)) for c in subtree)
+
+        # Slots that move from a derived class into this class keep the signature of the derived class
+        donors = {}
+        for c in subtree[1:]:
+            for i, vm in enumerate(old_vmethods[c]):
+                if vm is not None and vm.owner == c and not vm.is_override():
+                    donors.setdefault(i + front, vm.snapshot_signature())
+
+        if relink is not None:
+            relink()
+
+        diff = VTableDiff()
+        removed = []
+        for c in subtree:
+            old = old_vmethods[c]
+            c.vtable_start, c.vtable_end = ranges[c]
+            c.vmethods = []
+            if c.vtable_start is not None:
+                for j in range(c.vtable_size()):
+                    i = j - front
+                    old_vm = old[i] if 0 <= i < len(old) else None
+                    donor = donors.get(j) if c == self and old_vm is None else None
+                    c.vmethods.append(c.diff_vtable_slot(j, old_vm, donor, diff))
+            c.update_vtable_index()
+
+            kept = set(id(vm) for vm in c.vmethods)
+            for vm in old:
+                if vm is not None and vm.owner == c and id(vm) not in kept:
+                    removed.append(vm)
+                    diff.removed_ids.add(id(vm))
+
+        # Derived classes first, so overrides are gone before the methods they override
+        for vm in reversed(removed):
+            if vm.is_override():
+                Class.detach_override(vm, diff.removed_ids)
+            vm.unlink()
+            diff.unlinked.append(vm)
+
+        # Renamed entries take over the names of their neighbours, so the ones moving into free names go first
+        to_refresh = sorted(diff.renamed, key=lambda vm: vm.vtable_idx, reverse=front > 0) + diff.created
+
+        # Unlinking cleared the names of methods that share the address with a remaining one
+        unlinked_eas = set(vm.ea for vm in diff.unlinked if vm.ea != idc.BADADDR)
+        for c in subtree:
+            for vm in c.vmethods:
+                if vm.ea in unlinked_eas:
+                    db.known_methods[vm.ea] = vm
+                    to_refresh.append(vm)
+
+        renamed_ids = set(id(vm) for vm in diff.renamed)
+        refreshed = set()
+        for vm in to_refresh:
+            if id(vm) not in refreshed and vm.owner is not None:
+                refreshed.add(id(vm))
+                vm.refresh()
+                if id(vm) in renamed_ids:
+                    for o in vm.overrides:
+                        o.propagate_signature()
+
+
+    # The entry for slot idx of the new vtable. old_vm is the entry the slot had before, donor the signature an inserted
+    # slot takes over. Entries that are created or renamed are refreshed by rebuild_vtables once all vtables are done.
+    def diff_vtable_slot(self, idx, old_vm, donor, diff):
+        base_method = self.base.vmethods[idx] if idx < self.vtable_start_idx() else None
+
+        if old_vm is not None:
+            if old_vm.owner != self:
+                if old_vm is base_method:                           # Inherited, unchanged
+                    return old_vm
+            elif base_method is None and not old_vm.is_override():  # Own, unchanged
+                if old_vm.name == 'vf%X' % (old_vm.vtable_idx*4) and old_vm.vtable_idx != idx:
+                    old_vm.name = 'vf%X' % (idx*4)
+                    diff.renamed.append(old_vm)
+                old_vm.vtable_idx = idx
+                return old_vm
+            elif base_method is not None and old_vm.is_override() and old_vm.base is base_method:
+                old_vm.vtable_idx = idx                             # Override, unchanged
+                return old_vm
+
+        dst = make_vtable_entry(self.get_vtable_index_ea(idx))
+        is_own = old_vm is not None and old_vm.owner == self
+
+        # Overrides of a base slot that was replaced only need to be moved over
+        if is_own and old_vm.is_override() and base_method is not None and not base_method.is_dst_equal(dst):
+            Class.detach_override(old_vm, diff.removed_ids)
+            old_vm.base = base_method
+            old_vm.vtable_idx = idx
+            base_method.add_override(old_vm)
+            old_vm.propagate_signature()
+            return old_vm
+
+        signature = donor
+        if old_vm is not None and old_vm.owner is not None:
+            signature = old_vm.snapshot_signature()
+
+        overrides = []
+        if is_own:
+            overrides = old_vm.overrides
+            old_vm.overrides = []
+            if old_vm.is_override():
+                Class.detach_override(old_vm, diff.removed_ids)
+            old_vm.unlink()
+            diff.unlinked.append(old_vm)
+
+        vm = self.create_vmethod(dst, idx, False)
+        if vm is not base_method:
+            diff.created.append(vm)
+            if base_method is None and signature is not None:
+                vm.adopt_signature(signature)
+
+        for o in overrides:
+            o.base = vm
+            vm.add_override(o)
+            o.propagate_signature()
+
+        return vm
+
+
+    # Takes an override off the method it overrides. Methods removed from their vtable don't get their comments updated,
+    # as their slot is gone.
+    @staticmethod
+    def detach_override(vm, removed_ids):
+        if id(vm.base) in removed_ids:
+            vm.base.overrides.remove(vm)
+        else:
+            vm.base.remove_override(vm)
+
+
+    # Yields the class and all classes derived from it, bases before derived classes
+    def iter_subtree(self):
+        return database.get().hierarchy.iter_subtree(self)
+
+
+    def is_base_of(self, other):
+        return database.get().hierarchy.is_subclass_of(other, self)
+
+
+    def is_subclass_of(self, other):
+        return database.get().hierarchy.is_subclass_of(self, other)
+
+
+    def depth(self):
+        return database.get().hierarchy.depth(self)
+
+
+    # The base classes, nearest first
+    def iter_ancestors(self):
+        return database.get().hierarchy.iter_ancestors(self)
 
 
     def is_vtable_locked(self):
         return len(self.derived) > 0
 
 
+    # The vtables of the class and all of its bases have to be inited
     def can_be_derived(self):
-        if self.base is None:
-            return True
-        return len(self.vmethods) >= len(self.base.vmethods)    # vtable inited?
+        c = self
+        for base in self.iter_ancestors():
+            if len(c.vmethods) < len(base.vmethods):
+                return False
+            c = base
+        return True
+
+
+    def update_vtable_index(self):
+        db = database.get()
+        db.vcall_index.invalidate(self)
+        db.search_index.set(self, self.search_texts())
+        if self.vtable_start is None:
+            db.vtable_index.remove(self)
+        else:
+            db.vtable_index.add(self.vtable_start, self.vtable_end, self)
 
 
     def vtable_start_idx(self):
@@ -141,6 +449,7 @@ class Class(object):
             return
         self.vtable_start = None
         self.vtable_end = None
+        self.update_vtable_index()
         idx = self.vtable_start_idx()
         for vm in self.vmethods[idx:]:
             vm.unlink()
@@ -148,51 +457,68 @@ class Class(object):
 
 
     def init_vtable(self):
-        my_start_idx = self.vtable_start_idx()
+        for _ in self.iter_init_vtable():
+            pass
 
-        # Fix: support 64bit work
-        if idc.__EA64__:
-            pointer_size = idaapi.DEF_ADDRSIZE
-            pfn_make_ptr = lambda x: ida_bytes.create_data(x, idc.FF_QWORD, 8, idaapi.BADADDR) #MakeQword
-            pfn_get_ptr_value = ida_bytes.get_qword
-        else:
-            pointer_size = idaapi.DEF_ADDRSIZE
-            pfn_make_ptr =  lambda x: ida_bytes.create_data(x, idc.FF_DWORD, 4, idaapi.BADADDR) #ida_bytes.MakeDword
-            pfn_get_ptr_value = ida_bytes.get_dword
-
-        for idx, ea in enumerate(range(self.vtable_start, self.vtable_end, pointer_size)):
-            pfn_make_ptr(ea)
-            idc.op_plain_offset(ea, 0, 0)
-            dst = pfn_get_ptr_value(ea)
-
-            if idx < my_start_idx:
-                base_method = self.base.vmethods[idx]
-                if base_method.is_dst_equal(dst):                   # Method from base class
-                    self.vmethods.append(self.base.vmethods[idx])
-                elif Method.s_is_pure_virtual_dst(dst):             # New pure virtual override
-                    opvm = PureVirtualOverrideMethod(self, base_method, idx)
-                    opvm.refresh()
-                    self.vmethods.append(opvm)
-                elif Method.s_is_deleted_virtual_dst(dst):          # New deleted override
-                    dom = DeletedOverrideMethod(self, base_method, idx)
-                    dom.refresh()
-                    self.vmethods.append(dom)
-                else:                                               # New override
-                    om = OverrideMethod(dst, self, base_method, idx)
-                    om.refresh()
-                    self.vmethods.append(om)
-            elif Method.s_is_pure_virtual_dst(dst):                 # New pure virtual
-                pvm = PureVirtualMethod(self, 'vf%X' % (idx*4), idx)
-                pvm.refresh()
-                self.vmethods.append(pvm)
-            elif Method.s_is_deleted_virtual_dst(dst):              # New deleted virtual
-                pvm = DeletedVirtualMethod(self, 'vf%X' % (idx*4), idx)
-                pvm.refresh()
-                self.vmethods.append(pvm)
-            else:                                                   # New virtual
-                vm = VirtualMethod(dst, self, 'vf%X' % (idx*4), idx)
-                vm.refresh()
-                self.vmethods.append(vm)
+
+    # Cuts the vtable after the entries read so far, used when iter_init_vtable is not run to the end
+    def truncate_vtable(self):
+        if self.vtable_start is None:
+            return
+        if len(self.vmethods) < self.vtable_start_idx() or not len(self.vmethods):
+            self.reset_vtable()
+            return
+        self.vtable_end = self.vtable_start + len(self.vmethods) * 4
+        self.update_vtable_index()
+
+
+    def vtable_size(self):
+        if self.vtable_start is None:
+            return 0
+        return (self.vtable_end - self.vtable_start) // 4
+
+
+    # Reads one vtable entry per iteration
+    def iter_init_vtable(self):
+        for idx, ea in enumerate(range(self.vtable_start, self.vtable_end, idaapi.DEF_ADDRSIZE)):
+            self.vmethods.append(self.create_vmethod(make_vtable_entry(ea), idx))
+            yield
+
+
+    # The entry of slot idx for the destination dst, which is the base class entry if the slot is inherited
+    def create_vmethod(self, dst, idx, refresh=True):
+        if idx < self.vtable_start_idx():
+            base_method = self.base.vmethods[idx]
+            if base_method.is_dst_equal(dst):                       # Method from base class
+                return base_method
+            elif Method.s_is_pure_virtual_dst(dst):                 # New pure virtual override
+                vm = PureVirtualOverrideMethod(self, base_method, idx)
+            elif Method.s_is_deleted_virtual_dst(dst):              # New deleted override
+                vm = DeletedOverrideMethod(self, base_method, idx)
+            else:                                                   # New override
+                vm = OverrideMethod(dst, self, base_method, idx)
+        elif Method.s_is_pure_virtual_dst(dst):                     # New pure virtual
+            vm = PureVirtualMethod(self, 'vf%X' % (idx*4), idx)
+        elif Method.s_is_deleted_virtual_dst(dst):                  # New deleted virtual
+            vm = DeletedVirtualMethod(self, 'vf%X' % (idx*4), idx)
+        else:                                                       # New virtual
+            vm = VirtualMethod(dst, self, 'vf%X' % (idx*4), idx)
+        if refresh:
+            vm.refresh()
+        return vm
+
+
+    # Formats the vtable as offsets again, for IDBs the database was not created in. Returns the entries whose
+    # destination doesn't match the database as (index, destination) pairs.
+    def apply_vtable_data(self):
+        mismatches = []
+        if self.vtable_start is None:
+            return mismatches
+        for idx, ea in enumerate(range(self.vtable_start, self.vtable_end, idaapi.DEF_ADDRSIZE)):
+            dst = make_vtable_entry(ea)
+            if idx < len(self.vmethods) and not self.vmethods[idx].is_dst_equal(dst):
+                mismatches.append((idx, dst))
+        return mismatches
 
 
     def get_vtable_index_ea(self, idx):
@@ -224,6 +550,7 @@ class Class(object):
         self.struct_id = new_struct_id
         if self.struct_id != idc.BADADDR:
             db.classes_by_struct_id[self.struct_id] = self
+        db.vcall_index.invalidate()
 
         self.refresh()
 
@@ -252,81 +579,38 @@ class Class(object):
 
 
     def generate_cpp_definition(self):
-        contents = []
-        contents.append('class %s%s\n{\npublic:' % (self.name, '' if self.base is None else (' : public %s' % self.base.name)))
-
-        seen_dtor = False
-
-        # Overrides
-        for idx in range(self.vtable_start_idx()):
-            vm = self.vmethods[idx]
-            if vm.owner == self and type(vm) == OverrideMethod:
-                if vm.name == '~' + self.name:
-                    if seen_dtor:
-                        continue
-                    seen_dtor = True
-                    contents.append('    virtual %s;' % vm.get_signature(include_owner=False))
-                else:
-                    contents.append('    %s override;' % vm.get_signature(include_owner=False))
+        return export.format_class_definition(self.snapshot_definition())
 
-        if self.vtable_start_idx() > 0:
-            contents.append('')
 
-        # New virtuals
-        for idx in range(self.vtable_start_idx(), len(self.vmethods)):
-            vm = self.vmethods[idx]
-            if type(vm) == VirtualMethod:   # If this isn't the case something is very wrong
-                if vm.name == '~' + self.name:
-                    if seen_dtor:
-                        continue
-                    seen_dtor = True
-                contents.append('    virtual %s;' % vm.get_signature(include_owner=False))
+    def snapshot_definition(self):
+        return export.snapshot_class_definition(self, self.get_struct_member_lines())
 
-        if (len(self.vmethods) - self.vtable_start_idx()) > 0:
-            contents.append('')
 
-        # Methods
-        for m in self.methods:
-            if m.name == '~' + self.name:
-                if seen_dtor:
-                    continue
-                seen_dtor = True
-            contents.append('    %s;' % m.get_signature(include_owner=False))
+    # Member declarations of the linked struct, without the ones inherited from the base class struct
+    def get_struct_member_lines(self):
+        if self.struct_id == idc.BADADDR:
+            return None
 
-        # Todo: Replace this ugly temp code
-        if self.struct_id != idc.BADADDR:
-            struct = idaapi.get_struc(self.struct_id)
-            raw_txt = idc.GetLocalType(struct.ordinal, idc.PRTYPE_1LINE)
-            l_idx = raw_txt.find('{')
-            r_idx = raw_txt.find('}')
-            segs = raw_txt[l_idx+1:r_idx].split(';')
-            if len(segs):
-                contents.append('')
-            for s in segs:
-                contents.append('    %s;' % s)
+        layout = struct_layout.get_layout(self.struct_id)
+        if layout is None:
+            return None
 
-        contents.append('};\n')
+        base_struct_name = None
+        if self.base is not None and self.base.struct_id != idc.BADADDR:
+            base_struct_name = idc.get_struc_name(self.base.struct_id)
 
-        return '\n'.join(contents)
+        lines = []
+        for m in layout.members:
+            if m.is_base:
+                continue
+            if m.offset == 0 and base_struct_name and m.type_name == base_struct_name:
+                continue
+            lines.append(m.decl)
+        return lines
 
 
     def generate_symbols(self):
-        contents = ['/* %s */\n' % self.name]
-
-        if len(self.vmethods):
-            contents.append('/* virtual functions */')
-            for vm in self.vmethods:
-                if vm.owner == self and not vm.is_pure_virtual():
-                    contents.append('%s = 0x%X;' % (vm.get_mangled(), vm.ea))
-            contents.append('')
-
-        if len(self.methods):
-            contents.append('/* functions */')
-            for m in self.methods:
-                contents.append('%s = 0x%X;' % (m.get_mangled(), m.ea))
-            contents.append('')
-
-        return '\n'.join(contents)
+        return export.format_class_symbols(export.snapshot_class_symbols(self))
 
 
     @staticmethod
@@ -404,6 +688,16 @@ class Class(object):
         '''
 
 
+# Bookkeeping of Class.rebuild_vtables
+class VTableDiff(object):
+    def __init__(self):
+        self.removed_ids = set()    # Entries removed from their vtable
+        self.unlinked = []
+        self.renamed = []           # Entries with default names that moved to another slot
+        self.created = []
+
+
+
 class Method(object):
     def __init__(self, ea, owner, name):
         self.ea = ea
@@ -423,21 +717,43 @@ class Method(object):
         return 'regular'
 
 
-    def refresh(self):
-        if self.ea != idc.BADADDR:
+    # Methods without an address (pure virtuals) are not mangled, they have no name in the IDB
+    def refresh(self, mangled=None):
+        db = database.get()
+
+        if self.ea == idc.BADADDR:
+            db.mangled_index.remove(self)
+            db.search_index.set(self, self.search_texts(None))
+            self.refresh_comments()
+            return
+
+        if mangled is None:
             mangled = self.get_mangled()
-            idc.set_name(self.ea, mangled, idc.SN_CHECK)
+        other = db.mangled_index.set(self, mangled)
+        db.search_index.set(self, self.search_texts(mangled))
+
+        if other is not None:
+            log('Not naming 0x%X: The mangled name %s is already used by %s' % (self.ea, mangled, other.get_signature()))
+        else:
+            named_ea = idc.get_name_ea_simple(mangled)
+            if named_ea != idc.BADADDR and named_ea != self.ea:
+                log('Not naming 0x%X: The name %s is already used at 0x%X' % (self.ea, mangled, named_ea))
+            else:
+                idc.set_name(self.ea, mangled, idc.SN_CHECK)
         self.refresh_comments()
 
 
     def unlink(self):
+        database.get().mangled_index.remove(self)
+        database.get().search_index.remove(self)
+
         if self.owner and self in self.owner.methods:
             self.owner.methods.remove(self)
 
         self.owner = None
 
         if self.ea != idc.BADADDR:
-            del database.get().known_methods[self.ea]
+            database.get().known_methods.pop(self.ea, None)
             idc.set_name(self.ea, '', idc.SN_CHECK)
             idc.set_func_cmt(self.ea, '', False)
 
@@ -447,14 +763,19 @@ class Method(object):
 
 
     def set_signature(self, name, args, return_type='void', is_const=False, ctor_type=1, dtor_type=1):
+        db = database.get()
         signature = Method.s_make_signature(self.owner, name, args, is_const, return_type)
-        itanium_mangler.mangle_function(signature, database.get().typedefs, ctor_type, dtor_type)    # throws excption when invalid
+        mangled = itanium_mangler.mangle_function(signature, db.typedef_table(), ctor_type, dtor_type)    # throws excption when invalid
+        other = db.mangled_index.find_collision(self, mangled)
+        if other is not None:
+            raise ValueError('The mangled name %s is already used by %s' % (mangled, other.get_signature()))
         self.name = name
         self.args = args
         self.return_type = return_type
         self.is_const = is_const
         self.ctor_type = ctor_type
         self.dtor_type = dtor_type
+        db.vcall_index.invalidate()
         self.refresh()
 
 
@@ -476,10 +797,6 @@ class Method(object):
         return Method.s_make_signature(self.owner if include_owner else None, self.name, self.args, self.is_const, self.return_type if include_return_type else '')
 
 
-    def get_mangled(self):
-        return itanium_mangler.mangle_function(self.get_signature(), database.get().typedefs, self.ctor_type, self.dtor_type)  # throws excption when invalid
-
-
     def copy_signature(self, other):
         if (other.owner is not None) and (other.name == '~' + other.owner.name):
             if self.owner is None:
@@ -494,9 +811,55 @@ class Method(object):
         self.dtor_type = other.dtor_type
 
 
+    # The signature in the form taken by adopt_signature, destructors are marked so they can be renamed
+    def snapshot_signature(self):
+        is_dtor = self.owner is not None and self.name == '~' + self.owner.name
+        return (self.name, self.args, self.return_type, self.is_const, self.ctor_type, self.dtor_type, is_dtor)
+
+
+    # Takes over a signature from snapshot_signature, unless the mangled name is already used by another method. The
+    # method is not refreshed.
+    def adopt_signature(self, signature):
+        previous = (self.name, self.args, self.return_type, self.is_const, self.ctor_type, self.dtor_type)
+        name, self.args, self.return_type, self.is_const, self.ctor_type, self.dtor_type, is_dtor = signature
+        self.name = ('~' + self.owner.name) if is_dtor else name
+
+        reason = None
+        try:
+            collision = database.get().mangled_index.find_collision(self, self.get_mangled())
+            if collision is not None:
+                reason = 'The mangled name is already used by %s' % collision.get_signature()
+        except Exception as e:
+            reason = str(e)
+
+        if reason is not None:
+            log('Not keeping the signature %s: %s' % (self.get_signature(), reason))
+            self.name, self.args, self.return_type, self.is_const, self.ctor_type, self.dtor_type = previous
+
+
     def get_mangled(self):
         demangled = self.get_signature(False)
-        return itanium_mangler.mangle_function(demangled, database.get().typedefs, self.ctor_type, self.dtor_type)
+        return itanium_mangler.mangle_function(demangled, database.get().typedef_table(), self.ctor_type, self.dtor_type)
+
+
+    # The name, the signature, the mangled name and the address. The mangled name is taken from the mangled name index
+    # if not given.
+    def search_texts(self, mangled=None):
+        if mangled is None:
+            mangled = database.get().mangled_index.get_mangled(self)
+        name = ('%s::%s' % (self.owner.name, self.name)) if self.owner is not None else self.name
+        texts = [name, self.get_signature(), mangled]
+        if self.ea != idc.BADADDR:
+            texts.append('%x' % self.ea)
+        return texts
+
+
+    # The mangled name from the mangled name index, which is kept up to date on every refresh
+    def get_cached_mangled(self):
+        mangled = database.get().mangled_index.get_mangled(self)
+        if mangled is None:
+            mangled = self.get_mangled()
+        return mangled
 
 
     def get_comment(self):
@@ -542,8 +905,8 @@ class VirtualMethod(Method):
         return 'virtual'
 
 
-    def refresh(self):
-        Method.refresh(self)
+    def refresh(self, mangled=None):
+        Method.refresh(self, mangled)
 
 
     def refresh_comments(self):
@@ -682,7 +1045,15 @@ class OverrideMethod(VirtualMethod):
             o.propagate_signature()
 
 
+    # The virtual method of the topmost class with the slot, all overrides in between share its signature
     def get_root_method(self):
+        for c in reversed(tuple(self.owner.iter_ancestors())):
+            if self.vtable_idx < len(c.vmethods):
+                method = c.vmethods[self.vtable_idx]
+                if method is not None and not method.is_override():
+                    return method
+                break
+
         method = self
         while method.is_override():
             method = method.base
@@ -747,7 +1118,7 @@ class NullMethod(Method):
         return 'null'
 
 
-    def refresh(self):
+    def refresh(self, mangled=None):
         pass
 
 
@@ -756,8 +1127,162 @@ class NullMethod(Method):
 
 
 
+# Fix: support 64bit work
+def make_vtable_entry(ea):
+    if idc.__EA64__:
+        ida_bytes.create_data(ea, idc.FF_QWORD, 8, idaapi.BADADDR) #MakeQword
+        idc.op_plain_offset(ea, 0, 0)
+        return ida_bytes.get_qword(ea)
+    ida_bytes.create_data(ea, idc.FF_DWORD, 4, idaapi.BADADDR) #ida_bytes.MakeDword
+    idc.op_plain_offset(ea, 0, 0)
+    return ida_bytes.get_dword(ea)
+
+
 def refresh_all():
+    for _ in iter_refresh_all():
+        pass
+
+
+def iter_refresh_all():
+    db = database.get()
+
+    # Mangling is done in parallel up front, only applying the names has to happen one by one
+    mangled_names, errors = db.mangle_methods(list(db.iter_methods()))
+    for m, e in errors.items():
+        log('Mangling %s failed: %s' % (m.get_signature(), e))
+        db.mangled_index.remove(m)
+
+    # Refreshing doesn't invalidate the virtual call results on its own, once for all methods is enough
+    db.vcall_index.invalidate()
+
+    for c in list(db.classes_by_name.values()):
+        for _ in c.iter_refresh(mangled_names, errors):
+            yield
+
+
+def refresh_all_size():
+    return sum(c.refresh_size() for c in database.get().classes_by_name.values())
+
+
+# Imports JSON Lines records (see classy.jsonl), one record per iteration. Classes that already exist are kept as they
+# are and only get the methods they don't have yet. Records that cannot be applied are logged and skipped.
+# Returns (added classes, added methods, skipped records).
+def iter_import_records(records):
+    db = database.get()
+    db.vcall_index.invalidate()
+
+    created = set()
+    added_classes = 0
+    added_methods = 0
+    skipped = 0
+
+    for record in records:
+        kind = record.get('type')
+        try:
+            if kind == 'database':
+                for key in ('pure_virtual_vals', 'deleted_virtual_vals'):
+                    vals = getattr(db, key)
+                    for val in record.get(key, []):
+                        if val not in vals:
+                            vals.append(val)
+            elif kind == 'typedef':
+                if record['name'] not in db.typedefs:
+                    db.set_typedef(record['name'], record['value'])
+            elif kind == 'class':
+                if record['name'] in db.classes_by_name:
+                    skipped += 1
+                else:
+                    import_class_record(record)
+                    created.add(record['name'])
+                    added_classes += 1
+            elif kind == 'method':
+                if import_method_record(record):
+                    added_methods += 1
+                else:
+                    skipped += 1
+            elif kind == 'vslot':
+                if record['class'] in created:
+                    import_vslot_record(record)
+            else:
+                raise ValueError('Unknown record type %s' % kind)
+        except (ValueError, KeyError) as e:
+            log('Skipping %s record %s: %s' % (kind, record.get('name', ''), str(e)))
+            skipped += 1
+        yield
+
+    return added_classes, added_methods, skipped
+
+
+def import_class_record(record):
+    db = database.get()
+
+    name = record['name']
+    if not Class.s_name_is_valid(name):
+        raise ValueError('Invalid class name')
+
+    base = None
+    if record.get('base') is not None:
+        base = db.classes_by_name.get(record['base'])
+        if base is None:
+            raise ValueError('The base class %s does not exist' % record['base'])
+        if not base.can_be_derived():
+            raise ValueError('The base class %s does not have a complete vtable' % base.name)
+
+    c = Class(name, base)
+
+    if record.get('struct'):
+        struct_id = idc.get_struc_id(record['struct'])
+        if struct_id != idc.BADADDR and struct_id not in db.classes_by_struct_id:
+            c.set_struct_id(struct_id)
+
+    if record.get('vtable_start') is not None:
+        try:
+            c.set_vtable_range(record['vtable_start'], record['vtable_end'])
+        except ValueError as e:
+            log('Not setting the vtable of %s: %s' % (name, str(e)))
+
+    return c
+
+
+# Returns False if the method is already known
+def import_method_record(record):
     db = database.get()
 
-    for c in db.classes_by_name.values():
-        c.refresh()
+    c = db.classes_by_name.get(record['class'])
+    if c is None:
+        raise ValueError('The class %s does not exist' % record['class'])
+
+    ea = record['ea']
+    if ea is None:
+        raise ValueError('Regular methods need an address')
+    if ea in db.known_methods:
+        return False
+
+    m = Method(ea, c, record['name'])
+    try:
+        m.set_signature(record['name'], record['args'], record['return_type'], record['is_const'],
+                        record['ctor_type'], record['dtor_type'])
+    except ValueError:
+        m.unlink()
+        raise
+    c.methods.append(m)
+    return True
+
+
+# Overrides are skipped, they get their signature from the method they override
+def import_vslot_record(record):
+    c = database.get().classes_by_name[record['class']]
+
+    idx = record['idx']
+    if idx >= len(c.vmethods) or c.vmethods[idx].owner != c:
+        raise ValueError('%s has no own vtable entry %d' % (c.name, idx))
+
+    vm = c.vmethods[idx]
+    if vm.type_name() != record['kind']:
+        raise ValueError('The vtable entry %d of %s is %s, not %s' % (idx, c.name, vm.type_name(), record['kind']))
+
+    if vm.is_override():
+        return
+
+    vm.set_signature(record['name'], record['args'], record['return_type'], record['is_const'],
+                     record['ctor_type'], record['dtor_type'])
@@ -0,0 +1,520 @@
+# Exporters working on immutable snapshots of the database. Nothing in here may touch IDA or Qt, so the exports can
+# run on worker threads and outside of IDA.
+import os
+import json
+import hashlib
+from collections import namedtuple
+from datetime import datetime
+
+import classy.parallel_mangler as parallel_mangler
+
+
+# symbols and virtual_symbols are tuples of (mangled name, ea) pairs
+ClassSymbols = namedtuple('ClassSymbols', ['name', 'has_vmethods', 'virtual_symbols', 'symbols'])
+
+
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+def snapshot_class_symbols(c):
+    virtual_symbols = tuple((vm.get_cached_mangled(), vm.ea) for vm in c.vmethods
+                            if vm.owner == c and not vm.is_pure_virtual())
+    symbols = tuple((m.get_cached_mangled(), m.ea) for m in c.methods)
+    return ClassSymbols(c.name, len(c.vmethods) > 0, virtual_symbols, symbols)
+
+
+def snapshot_symbols(classes):
+    return tuple(snapshot_class_symbols(c) for c in classes)
+
+
+def format_class_symbols(cs):
+    contents = ['/* %s */\n' % cs.name]
+
+    if cs.has_vmethods:
+        contents.append('/* virtual functions */')
+        for mangled, ea in cs.virtual_symbols:
+            contents.append('%s = 0x%X;' % (mangled, ea))
+        contents.append('')
+
+    if len(cs.symbols):
+        contents.append('/* functions */')
+        for mangled, ea in cs.symbols:
+            contents.append('%s = 0x%X;' % (mangled, ea))
+        contents.append('')
+
+    return '\n'.join(contents)
+
+
+def format_symbols_header(timestamp=None):
+    if timestamp is None:
+        timestamp = datetime.now()
+    return '/*\n * Classy exported symbols\n%s\n */\n\n' % timestamp.strftime(' * %x %X')
+
+
+# Yields the linker script in pieces, one class at a time
+def iter_symbols(snapshot, timestamp=None):
+    yield format_symbols_header(timestamp)
+
+    if len(snapshot) > 0:
+        yield '\n/*\n * Classes\n */\n\n'
+        for cs in snapshot:
+            yield '\n' + format_class_symbols(cs) + '\n'
+
+
+def generate_symbols(snapshot, timestamp=None):
+    return ''.join(iter_symbols(snapshot, timestamp))
+
+
+# Streams the linker script to a temporary file that replaces the target once it is complete.
+# The job (see classy.jobs) is optional and used for progress and cancellation.
+def write_symbols(path, snapshot, job=None):
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+            for idx, chunk in enumerate(iter_symbols(snapshot)):
+                f.write(chunk)
+                if job is not None:
+                    job.check_cancelled()
+                    job.set_progress(idx, len(snapshot) + 1)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    return sum(len(cs.symbols) + len(cs.virtual_symbols) for cs in snapshot)
+
+
+SYMBOL_EXPORT_MODES = ['single', 'class', 'namespace']
+
+MANIFEST_VERSION = 1
+
+
+def hash_text(txt):
+    return hashlib.sha1(txt.encode('utf-8')).hexdigest()
+
+
+def safe_file_name(name):
+    return name.replace('::', '_')
+
+
+# Name -> file name. Names whose files would clash, like a::b and a_b or names that only differ in case, get the hash
+# of the name appended. The suffix only depends on the name, but a name only gets it while it clashes, so a new clashing
+# class moves the other one to another file. The manifests list the old file, which is then deleted.
+def unique_file_names(names, ext):
+    file_of = dict((name, (safe_file_name(name) or '_global') + ext) for name in names)
+
+    clashes = {}
+    for name, file_name in file_of.items():
+        clashes.setdefault(file_name.lower(), []).append(name)
+
+    for clashing in clashes.values():
+        if len(clashing) > 1:
+            for name in clashing:
+                file_of[name] = '%s_%s%s' % (safe_file_name(name) or '_global', hash_text(name)[:8], ext)
+
+    return file_of
+
+
+def manifest_path(path):
+    return path + '.manifest.json'
+
+
+def load_manifest(path):
+    try:
+        with open(manifest_path(path), 'r') as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(path, manifest):
+    tmp_path = manifest_path(path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path(path))
+
+
+def write_file_atomic(path, txt):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(txt)
+    os.replace(tmp_path, path)
+
+
+def namespace_of(class_name):
+    segs = class_name.split('::')
+    return '::'.join(segs[:-1]) if len(segs) > 1 else ''
+
+
+# Groups the class sections into output files. Returns a list of (file name, [ClassSymbols]).
+def group_symbol_files(snapshot, mode):
+    if mode == 'class':
+        file_of = unique_file_names([cs.name for cs in snapshot], '.ld')
+        return [(file_of[cs.name], [cs]) for cs in snapshot]
+
+    groups = {}
+    order = []
+    for cs in snapshot:
+        ns = namespace_of(cs.name)
+        if ns not in groups:
+            groups[ns] = []
+            order.append(ns)
+        groups[ns].append(cs)
+    file_of = unique_file_names(order, '.ld')
+    return [(file_of[ns], groups[ns]) for ns in order]
+
+
+def remove_symbol_files(path, manifest):
+    if manifest.get('mode') == 'single':
+        return
+    out_dir = os.path.splitext(path)[0]
+    for file_name in manifest.get('files', {}):
+        if file_name:
+            try:
+                os.remove(os.path.join(out_dir, file_name))
+            except OSError:
+                pass
+
+
+# Exports the symbols, but only rewrites what changed since the last export. The sidecar manifest stores the content
+# hash of every class section and output file. The 'single' mode is not incremental beyond skipping unchanged exports,
+# the whole linker script is rewritten as soon as any class changed. In the 'class' and 'namespace' modes every class or
+# namespace gets its own file next to the main linker script, which then just includes them, so only the files of
+# changed classes are written. Returns (class hashes, dirty class names, written file count).
+def write_symbols_incremental(path, snapshot, mode='single', job=None):
+    if mode not in SYMBOL_EXPORT_MODES:
+        raise ValueError('Invalid symbol export mode "%s"' % mode)
+
+    manifest = load_manifest(path)
+    if manifest is not None and manifest.get('mode') != mode:
+        remove_symbol_files(path, manifest)
+        manifest = None
+    if manifest is None or not os.path.isfile(path):
+        manifest = {'version': MANIFEST_VERSION, 'mode': mode, 'order': '', 'classes': {}, 'files': {}}
+
+    old_class_hashes = manifest['classes']
+    old_file_hashes = manifest['files']
+
+    sections = {}
+    class_hashes = {}
+    dirty = []
+    for idx, cs in enumerate(snapshot):
+        txt = format_class_symbols(cs)
+        sections[cs.name] = txt
+        class_hashes[cs.name] = hash_text(txt)
+        if old_class_hashes.get(cs.name) != class_hashes[cs.name]:
+            dirty.append(cs.name)
+        if job is not None and not idx % 256:
+            job.check_cancelled()
+            job.set_progress(idx, len(snapshot) * 2)
+
+    order = hash_text('\n'.join(cs.name for cs in snapshot))
+    order_changed = manifest.get('order') != order
+
+    files = {}
+    written = 0
+
+    if mode == 'single':
+        # Removed classes change the order. One changed class rewrites the whole file.
+        if len(dirty) or order_changed or '' not in old_file_hashes:
+            write_symbols(path, snapshot)
+            written += 1
+        files[''] = order
+
+    else:
+        out_dir = os.path.splitext(path)[0]
+        os.makedirs(out_dir, exist_ok=True)
+        rel_dir = os.path.basename(out_dir)
+
+        includes = []
+        for idx, (file_name, group) in enumerate(group_symbol_files(snapshot, mode)):
+            txt = '\n'.join(sections[cs.name] for cs in group) + '\n'
+            file_hash = hash_text(txt)
+            file_path = os.path.join(out_dir, file_name)
+            if old_file_hashes.get(file_name) != file_hash or not os.path.isfile(file_path):
+                write_file_atomic(file_path, txt)
+                written += 1
+            files[file_name] = file_hash
+            includes.append('INCLUDE "%s/%s"' % (rel_dir, file_name))
+            if job is not None and not idx % 256:
+                job.check_cancelled()
+                job.set_progress(len(snapshot) + idx, len(snapshot) * 2)
+
+        # Files of classes or namespaces that are gone
+        for file_name in old_file_hashes:
+            if file_name not in files:
+                try:
+                    os.remove(os.path.join(out_dir, file_name))
+                except OSError:
+                    pass
+
+        main_txt = '/*\n * Classy exported symbols\n */\n\n' + '\n'.join(includes) + '\n'
+        main_hash = hash_text(main_txt)
+        if old_file_hashes.get('') != main_hash or not os.path.isfile(path):
+            write_file_atomic(path, main_txt)
+            written += 1
+        files[''] = main_hash
+
+    manifest['order'] = order
+    manifest['classes'] = class_hashes
+    manifest['files'] = files
+    save_manifest(path, manifest)
+
+    return class_hashes, dirty, written
+
+
+# overrides, virtuals and methods are tuples of (signature without owner, is dtor) pairs, members is None if the class
+# has no struct, type_names are all types used by the signatures
+ClassDefinition = namedtuple('ClassDefinition', ['name', 'base_name', 'overrides', 'has_inherited', 'virtuals',
+                                                 'has_new_virtuals', 'methods', 'members', 'type_names'])
+
+HEADER_EXPORT_MODES = ['class', 'namespace']
+
+TYPE_QUALIFIERS = ['const', 'volatile', 'signed', 'unsigned', 'struct', 'class', 'enum', 'union']
+
+
+# Returns the names of all types used by a signature, without decors and qualifiers
+def extract_type_names(args, return_type=''):
+    names = set()
+    for txt in args.split(',') + [return_type]:
+        segs = [seg for seg in txt.replace('&', ' ').replace('*', ' ').split() if seg not in TYPE_QUALIFIERS]
+        if len(segs):
+            names.add(segs[0])
+    return names
+
+
+def snapshot_class_definition(c, members=None):
+    dtor_name = '~' + c.name
+    start_idx = c.vtable_start_idx()
+    type_names = set()
+
+    def sig(m):
+        type_names.update(extract_type_names(m.args, m.return_type))
+        return (m.get_signature(include_owner=False), m.name == dtor_name)
+
+    overrides = tuple(sig(vm) for vm in c.vmethods[:start_idx] if vm.owner == c and vm.type_name() == 'override')
+    virtuals = tuple(sig(vm) for vm in c.vmethods[start_idx:] if vm.type_name() == 'virtual')
+    methods = tuple(sig(m) for m in c.methods)
+
+    return ClassDefinition(c.name, c.base.name if c.base is not None else None, overrides, start_idx > 0,
+                           virtuals, len(c.vmethods) - start_idx > 0, methods,
+                           tuple(members) if members is not None else None, frozenset(type_names))
+
+
+def format_class_definition(cd, name=None):
+    if name is None:
+        name = cd.name
+
+    contents = []
+    contents.append('class %s%s\n{\npublic:' % (name, '' if cd.base_name is None else (' : public %s' % cd.base_name)))
+
+    seen_dtor = False
+
+    # Overrides
+    for signature, is_dtor in cd.overrides:
+        if is_dtor:
+            if seen_dtor:
+                continue
+            seen_dtor = True
+            contents.append('    virtual %s;' % signature)
+        else:
+            contents.append('    %s override;' % signature)
+
+    if cd.has_inherited:
+        contents.append('')
+
+    # New virtuals
+    for signature, is_dtor in cd.virtuals:
+        if is_dtor:
+            if seen_dtor:
+                continue
+            seen_dtor = True
+        contents.append('    virtual %s;' % signature)
+
+    if cd.has_new_virtuals:
+        contents.append('')
+
+    # Methods
+    for signature, is_dtor in cd.methods:
+        if is_dtor:
+            if seen_dtor:
+                continue
+            seen_dtor = True
+        contents.append('    %s;' % signature)
+
+    if cd.members is not None:
+        if len(cd.members):
+            contents.append('')
+        for member in cd.members:
+            contents.append('    %s;' % member)
+
+    contents.append('};\n')
+
+    return '\n'.join(contents)
+
+
+def split_namespace(name):
+    segs = name.split('::')
+    return segs[:-1], segs[-1]
+
+
+def format_forward_declarations(names):
+    contents = []
+    for name in sorted(names):
+        namespaces, short_name = split_namespace(name)
+        decl = 'class %s;' % short_name
+        for ns in reversed(namespaces):
+            decl = 'namespace %s { %s }' % (ns, decl)
+        contents.append(decl)
+    return contents
+
+
+# Renders the class definitions of one header, each wrapped in its namespaces
+def render_header(includes, forward_decls, definitions):
+    contents = ['#pragma once', '']
+
+    if len(includes):
+        for include in includes:
+            contents.append('#include "%s"' % include)
+        contents.append('')
+
+    if len(forward_decls):
+        contents += format_forward_declarations(forward_decls)
+        contents.append('')
+
+    for cd in definitions:
+        namespaces, short_name = split_namespace(cd.name)
+        for ns in namespaces:
+            contents.append('namespace %s {' % ns)
+        contents.append(format_class_definition(cd, short_name))
+        for ns in reversed(namespaces):
+            contents.append('} // namespace %s' % ns)
+        if len(namespaces):
+            contents.append('')
+
+    return '\n'.join(contents)
+
+
+def render_header_chunk(chunk):
+    return [(file_name, render_header(includes, forward_decls, definitions))
+            for file_name, includes, forward_decls, definitions in chunk]
+
+
+# Groups the definitions (which must be in base before derived order) into headers.
+# Returns a list of (file name, includes, forward declarations, definitions).
+def plan_headers(definitions, mode='class'):
+    if mode not in HEADER_EXPORT_MODES:
+        raise ValueError('Invalid header export mode "%s"' % mode)
+
+    if mode == 'class':
+        file_of = unique_file_names([cd.name for cd in definitions], '.h')
+    else:
+        namespace_files = unique_file_names(set(namespace_of(cd.name) for cd in definitions), '.h')
+        file_of = dict((cd.name, namespace_files[namespace_of(cd.name)]) for cd in definitions)
+
+    groups = {}
+    order = []
+    for cd in definitions:
+        file_name = file_of[cd.name]
+        if file_name not in groups:
+            groups[file_name] = []
+            order.append(file_name)
+        groups[file_name].append(cd)
+
+    plan = []
+    for file_name in order:
+        group = groups[file_name]
+        group_names = set(cd.name for cd in group)
+
+        includes = []
+        forward_decls = set()
+        defined = set()
+        for cd in group:
+            if cd.base_name is not None:
+                defined.add(cd.base_name)
+                if cd.base_name not in group_names:
+                    include = file_of.get(cd.base_name)
+                    if include is not None and include not in includes:
+                        includes.append(include)
+            for t in cd.type_names:
+                if t in file_of and t != cd.name and t not in defined:
+                    forward_decls.add(t)
+            defined.add(cd.name)
+
+        plan.append((file_name, includes, sorted(forward_decls), group))
+
+    return plan
+
+
+def headers_manifest_path(out_dir):
+    return os.path.join(out_dir, '.classy_headers.json')
+
+
+# Writes all headers into out_dir, generating them in parallel. Headers whose content did not change are not written,
+# so their modification times stay untouched, headers that are not generated anymore are deleted. Returns (written,
+# unchanged) file counts.
+def write_headers(out_dir, definitions, mode='class', job=None):
+    os.makedirs(out_dir, exist_ok=True)
+
+    plan = plan_headers(definitions, mode)
+    plan.append(('classy_all.h', [file_name for file_name, _, _, _ in plan], [], []))
+
+    if job is not None:
+        job.set_progress(0, len(plan) * 2)
+
+    rendered = parallel_mangler.map_chunks(render_header_chunk, plan, 256, min_parallel_size=2000)
+
+    try:
+        with open(headers_manifest_path(out_dir), 'r') as f:
+            old_hashes = json.load(f)
+    except (IOError, ValueError):
+        old_hashes = {}
+
+    hashes = {}
+    written = 0
+    for idx, (file_name, txt) in enumerate(rendered):
+        if job is not None and not idx % 64:
+            job.check_cancelled()
+            job.set_progress(len(plan) + idx, len(plan) * 2)
+
+        file_path = os.path.join(out_dir, file_name)
+        file_hash = hash_text(txt)
+        hashes[file_name] = file_hash
+
+        if old_hashes.get(file_name) == file_hash and os.path.isfile(file_path):
+            continue
+        if old_hashes.get(file_name) is None and read_file(file_path) == txt:
+            continue
+
+        write_file_atomic(file_path, txt)
+        written += 1
+
+    # Headers of classes or namespaces that were deleted or renamed. Only files of the last export are removed, nothing
+    # else in the directory is touched.
+    for file_name in old_hashes:
+        if file_name not in hashes and os.path.basename(file_name) == file_name:
+            try:
+                os.remove(os.path.join(out_dir, file_name))
+            except OSError:
+                pass
+
+    tmp_path = headers_manifest_path(out_dir) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(hashes, f, indent=1)
+    os.replace(tmp_path, headers_manifest_path(out_dir))
+
+    return written, len(rendered) - written
+
+
+def read_file(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except IOError:
+        return None
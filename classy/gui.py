@@ -1,13 +1,15 @@
 from PyQt5 import QtWidgets, QtCore
-import sip
 import idaapi
 import idc
 
-import classy.util as util
+import classy.widgets as widgets
 import classy.database as database
 import classy.database_entries as database_entries
+import classy.jobs as jobs
 from classy.signature_dialog import SignatureDialog
 from classy.choose_struct_dialog import ChooseStructDialog
+from classy.table_models import MethodTableModel, VTableModel, SearchResultModel, SORT_ROLE
+from classy.class_tree_model import ClassTreeModel
 
 
 class ClassyGui(idaapi.PluginForm):
@@ -16,7 +18,8 @@ class ClassyGui(idaapi.PluginForm):
         idaapi.PluginForm.__init__(self)
         self.plugin = plugin
         self.parent = None
-        self.items_by_class = {}
+        self.class_tree_model = None
+        self.search_model = None
 
 
     def show(self):
@@ -35,12 +38,33 @@ class ClassyGui(idaapi.PluginForm):
         splitter = QtWidgets.QSplitter(QtCore.Qt.Horizontal)
         layout.addWidget(splitter)
 
-        self.class_tree = QtWidgets.QTreeWidget()
+        self.search_edit = QtWidgets.QLineEdit()
+        self.search_edit.setPlaceholderText('Search classes, methods and addresses')
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(self.update_search_results)
+        self.search_edit.returnPressed.connect(self.handle_search_return_pressed)
+        left_layout.addWidget(self.search_edit)
+
+        self.search_model = SearchResultModel(self.parent)
+        self.search_results = QtWidgets.QListView()
+        self.search_results.setModel(self.search_model)
+        self.search_results.setUniformItemSizes(True)
+        self.search_results.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.search_results.clicked.connect(self.handle_search_result_activated)
+        self.search_results.activated.connect(self.handle_search_result_activated)
+        self.search_results.hide()
+        left_layout.addWidget(self.search_results)
+
+        self.class_tree_model = ClassTreeModel(self.parent)
+        self.class_tree = QtWidgets.QTreeView()
+        self.class_tree.setModel(self.class_tree_model)
         self.class_tree.header().hide()
+        self.class_tree.setUniformRowHeights(True)
+        self.class_tree.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.class_tree.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
         self.class_tree.customContextMenuRequested.connect(self.handle_class_tree_context_menu)
         self.class_tree.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
-        self.class_tree.itemSelectionChanged.connect(self.handle_class_tree_selection_change)
+        self.class_tree.selectionModel().selectionChanged.connect(self.handle_class_tree_selection_change)
         left_layout.addWidget(self.class_tree)
 
         button_layout = QtWidgets.QHBoxLayout()
@@ -68,86 +92,144 @@ class ClassyGui(idaapi.PluginForm):
         self.update_fields()
 
 
+    # The tree only gets the row of the shown class updated, changes to the hierarchy are announced to the model
+    # where they happen and reload_tree is for changes to the whole database
     def update_fields(self):
-        self.reload_tree()
+        if self.class_edit.edit_class is not None:
+            self.class_tree_model.class_changed(self.class_edit.edit_class)
+        self.update_search_results()
         self.class_edit.update_fields()
 
 
-    def reload_tree(self):
-        db = database.get()
+    def update_search_results(self):
+        query = self.search_edit.text()
+        if not query.strip():
+            self.search_model.set_results([])
+            self.search_results.hide()
+            return
 
-        self.items_by_class = {}
-        self.class_tree.clear()
-        for c in db.root_classes:
-            self.add_child_class_item(self.class_tree, c)
+        self.search_model.set_results(database.get().search_index.search(query))
+        self.search_results.show()
 
 
-    def add_child_class_item(self, parent, c):
-        if parent is None:
-            parent = self.class_tree
+    def handle_search_return_pressed(self):
+        if self.search_model.rowCount():
+            self.handle_search_result_activated(self.search_model.index(0, 0))
 
-        item = QtWidgets.QTreeWidgetItem(parent, [c.name])
-        item.setData(0, QtCore.Qt.UserRole, c)
-        self.items_by_class[c] = item
-        for d in c.derived:
-            self.add_child_class_item(item, d)
-        return item
+
+    def handle_search_result_activated(self, index):
+        entry = self.search_model.data(index, QtCore.Qt.UserRole)
+        if entry is None:
+            return
+        if type(entry) == database_entries.Class:
+            self.select_class(entry)
+        else:
+            self.select_method(entry)
 
 
-    def add_class(self):
-        c = database_entries.Class.s_create()
-        if c is None:
+    # Selects the class and row of a method and jumps to it
+    def select_method(self, m):
+        if m.owner is None:
             return
 
-        if c.base is not None:
-            parent_item = self.items_by_class[c.base]
+        if isinstance(m, database_entries.VirtualMethod):
+            self.select_class(m.owner, m.vtable_idx)
         else:
-            parent_item = None
+            self.select_class(m.owner)
+            self.class_edit.select_method_row(m)
+
+        if m.ea != idc.BADADDR:
+            idaapi.jumpto(m.ea)
 
-        item = self.add_child_class_item(parent_item, c)
 
-        self.class_tree.clearSelection()
-        self.class_tree.scrollToItem(item)
-        item.setSelected(True)
+    # Only the top level is fetched again, everything else when it is expanded
+    def reload_tree(self):
+        self.class_tree_model.reset()
 
 
-    def remove_class(self):
-        item = self.class_tree.selectedItems()[0] if len(self.class_tree.selectedItems()) else None
-        if item is None:
+    def selected_class(self):
+        indexes = self.class_tree.selectionModel().selectedIndexes()
+        if not len(indexes):
+            return None
+        c = self.class_tree_model.class_of(indexes[0])
+        return c if type(c) == database_entries.Class else None
+
+
+    def add_class(self):
+        c = database_entries.Class.s_create()
+        if c is None:
             return
 
-        c = item.data(0, QtCore.Qt.UserRole)
-        if type(c) != database_entries.Class:
+        self.class_tree_model.class_added(c)
+        self.select_class(c)
+
+
+    def remove_class(self):
+        c = self.selected_class()
+        if c is None:
             return
 
-        if not util.ask_yes_no('Do you really want to remove the class "%s"? All methods and new virtual methods will be unlinked' % c.name, False):
+        if not widgets.ask_yes_no('Do you really want to remove the class "%s"? All methods and new virtual methods will be unlinked' % c.name, False):
             return
 
         try:
             c.unlink()
-            del self.items_by_class[c]
-            sip.delete(item)
-            idaapi.refresh_idaview_anyway()
+            self.class_tree_model.class_removed(c)
+            jobs.get().refresh_idaview()
         except ValueError as e:
             idaapi.warning(str(e))
 
 
+    def select_class(self, c, vtable_idx=None):
+        index = self.class_tree_model.index_of(c)
+        if not index.isValid():
+            return
+
+        self.class_tree.scrollTo(index)
+        self.class_tree.selectionModel().select(index, QtCore.QItemSelectionModel.ClearAndSelect)
+        self.class_tree.setCurrentIndex(index)
+
+        if vtable_idx is not None:
+            self.class_edit.select_vtable_row(vtable_idx)
+
+
     def update_class(self, c):
-        try:
-            item = self.items_by_class[c]
-        except KeyError:
+        self.class_tree_model.class_changed(c)
+
+
+    def set_base_class(self):
+        c = self.selected_class()
+        if c is None:
             return
 
-        item.setText(0, c.name)
+        db = database.get()
 
+        base_name = idaapi.ask_str(c.base.name if c.base is not None else '', idaapi.HIST_IDENT, 'Enter a base class name (leave empty for none)')
+        if base_name is None:
+            return
 
-    def generate_class_header_to_file(self):
-        item = self.class_tree.selectedItems()[0] if len(self.class_tree.selectedItems()) else None
-        if item is None:
+        base_class = None
+        if base_name:
+            if base_name not in db.classes_by_name:
+                idaapi.warning('The class "%s" is not in the database.' % base_name)
+                return
+            base_class = db.classes_by_name[base_name]
+
+        try:
+            c.set_base(base_class)
+        except ValueError as e:
+            idaapi.warning(str(e))
             return
 
-        c = item.data(0, QtCore.Qt.UserRole)
-        if type(c) != database_entries.Class:
+        self.class_tree_model.class_moved(c)
+        self.select_class(c)
+        self.update_fields()
+        jobs.get().refresh_idaview()
+
+
+    def generate_class_header_to_file(self):
+        c = self.selected_class()
+        if c is None:
             return
 
         path = QtWidgets.QFileDialog.getSaveFileName(None,
@@ -161,37 +243,26 @@ class ClassyGui(idaapi.PluginForm):
         f.close()
 
     def generate_class_header_to_clipboard(self):
-        item = self.class_tree.selectedItems()[0] if len(self.class_tree.selectedItems()) else None
-        if item is None:
-            return
-
-        c = item.data(0, QtCore.Qt.UserRole)
-        if type(c) != database_entries.Class:
+        c = self.selected_class()
+        if c is None:
             return
 
         QtWidgets.QApplication.clipboard().setText(c.generate_cpp_definition())
 
 
     def handle_class_tree_selection_change(self):
-        item = self.class_tree.selectedItems()[0] if len(self.class_tree.selectedItems()) else None
-        if item is None:
-            self.class_edit.set_edit_class(None)
-        else:
-            c = item.data(0, QtCore.Qt.UserRole)
-            if type(c) == database_entries.Class:
-                self.class_edit.set_edit_class(c)
-            else:
-                self.class_edit.set_edit_class(None)
+        self.class_edit.set_edit_class(self.selected_class())
 
 
     def handle_class_tree_context_menu(self, point):
-        item = self.class_tree.itemAt(point)
+        index = self.class_tree.indexAt(point)
 
         menu = QtWidgets.QMenu()
         menu.addAction('Add', self.add_class)
 
-        if item is not None:
+        if index.isValid():
             menu.addAction('Remove', self.remove_class)
+            menu.addAction('Set base class...', self.set_base_class)
             menu.addAction('Generate C++ Header (File)', self.generate_class_header_to_file)
             menu.addAction('Generate C++ Header (Clipboard)', self.generate_class_header_to_clipboard)
 
@@ -224,7 +295,7 @@ class ClassWidget(QtWidgets.QWidget):
         self.derived_classes.setWordWrap(True)
         layout.addWidget(self.derived_classes, 2, 0, 1, 2)
 
-        self.struct = util.ClickableQLabel()
+        self.struct = widgets.ClickableQLabel()
         self.struct.doubleClicked.connect(self.handle_struct_double_clicked)
         layout.addWidget(self.struct, 3, 0)
 
@@ -241,29 +312,16 @@ class ClassWidget(QtWidgets.QWidget):
         self.set_vtable_range.clicked.connect(self.handle_set_vtable_range)
         layout.addWidget(self.set_vtable_range, 4, 1)
 
-        self.vtable = util.EnterPressQTableWidget()
-        self.vtable.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
-        self.vtable.setColumnCount(4)
-        self.vtable.setHorizontalHeaderLabels(['ID', 'Address', 'Function', 'Type'])
-        vtable_header = self.vtable.horizontalHeader()
-        vtable_header.setSectionResizeMode(2, QtWidgets.QHeaderView.Stretch)
-        self.vtable.verticalHeader().hide()
-        self.vtable.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
-        self.vtable.cellDoubleClicked.connect(self.handle_vtable_interaction)
-        self.vtable.cellEnterPressed.connect(self.handle_vtable_interaction)
+        self.vtable_model = VTableModel(self)
+        self.vtable = self.create_table_view(self.vtable_model, 2)
+        self.vtable.doubleClicked.connect(self.handle_vtable_interaction)
+        self.vtable.enterPressed.connect(self.handle_vtable_interaction)
         layout.addWidget(self.vtable, 5, 0, 1, 2)
 
-        self.methods = util.EnterPressQTableWidget()
-        self.methods.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
-        self.methods.setColumnCount(2)
-        self.methods.setHorizontalHeaderLabels(['Address', 'Function'])
-        methods_header = self.methods.horizontalHeader()
-        methods_header.setSectionResizeMode(1, QtWidgets.QHeaderView.Stretch)
-        self.methods.verticalHeader().hide()
-        self.methods.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
-        # self.methods.setSortingEnabled(True) Todo
-        self.methods.cellDoubleClicked.connect(self.handle_methods_interaction)
-        self.methods.cellEnterPressed.connect(self.handle_methods_interaction)
+        self.methods_model = MethodTableModel(self)
+        self.methods = self.create_table_view(self.methods_model, 1)
+        self.methods.doubleClicked.connect(self.handle_methods_interaction)
+        self.methods.enterPressed.connect(self.handle_methods_interaction)
         layout.addWidget(self.methods, 6, 0, 1, 2)
 
         method_btn_layout = QtWidgets.QHBoxLayout()
@@ -285,6 +343,47 @@ class ClassWidget(QtWidgets.QWidget):
         self.update_fields()
 
 
+    # The view sorts through a proxy, so view rows have to be mapped with source_row and view_row
+    def create_table_view(self, model, stretch_column):
+        proxy = QtCore.QSortFilterProxyModel(self)
+        proxy.setSourceModel(model)
+        proxy.setSortRole(SORT_ROLE)
+
+        view = widgets.EnterPressQTableView()
+        view.setModel(proxy)
+        view.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
+        view.horizontalHeader().setSectionResizeMode(stretch_column, QtWidgets.QHeaderView.Stretch)
+        view.verticalHeader().hide()
+        view.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        view.setSortingEnabled(True)
+        view.sortByColumn(0, QtCore.Qt.AscendingOrder)
+        return view
+
+
+    @staticmethod
+    def source_row(view, index):
+        return view.model().mapToSource(index).row()
+
+
+    @staticmethod
+    def select_row(view, model, row):
+        if row >= model.rowCount():
+            return
+        index = view.model().mapFromSource(model.index(row, 0))
+        view.selectRow(index.row())
+        view.scrollTo(index)
+
+
+    def select_vtable_row(self, row):
+        self.select_row(self.vtable, self.vtable_model, row)
+
+
+    def select_method_row(self, m):
+        if m in self.methods_model.methods:
+            self.select_row(self.methods, self.methods_model, self.methods_model.methods.index(m))
+
+
     def set_edit_class(self, edit_class):
         self.edit_class = edit_class
         self.update_fields()
@@ -298,8 +397,8 @@ class ClassWidget(QtWidgets.QWidget):
             self.derived_classes.setText('Derived classes: -')
             self.struct.setText('Struct: -')
             self.vtable_range.setText('VTable: -')
-            self.vtable.setRowCount(0)
-            self.methods.setRowCount(0)
+            self.vtable_model.set_methods([])
+            self.methods_model.set_methods([])
 
         else:
             self.setEnabled(True)
@@ -327,21 +426,8 @@ class ClassWidget(QtWidgets.QWidget):
                 vtable_range_txt = '0x%X - 0x%X' % (self.edit_class.vtable_start, self.edit_class.vtable_end)
             self.vtable_range.setText('VTable: %s' % vtable_range_txt)
 
-            self.vtable.setRowCount(len(self.edit_class.vmethods))
-            for idx, vm in enumerate(self.edit_class.vmethods):
-                self.vtable.setItem(idx, 0, QtWidgets.QTableWidgetItem(str(idx)))
-                self.vtable.setItem(idx, 1, QtWidgets.QTableWidgetItem(("0x%X" % vm.ea) if vm.ea != idc.BADADDR else '-'))
-                self.vtable.setItem(idx, 2, QtWidgets.QTableWidgetItem(vm.get_signature()))
-                self.vtable.setItem(idx, 3, QtWidgets.QTableWidgetItem(vm.type_name()))
-
-            # This way of doing won't work when allowing sorting
-            self.methods.setRowCount(len(self.edit_class.methods))
-            for idx, m in enumerate(self.edit_class.methods):
-                address_item = QtWidgets.QTableWidgetItem(m.ea)
-                address_item.setData(QtCore.Qt.DisplayRole, "0x%X" % m.ea)
-                address_item.setData(QtCore.Qt.UserRole, m)
-                self.methods.setItem(idx, 0, address_item)
-                self.methods.setItem(idx, 1, QtWidgets.QTableWidgetItem(m.get_signature()))
+            self.vtable_model.set_methods(self.edit_class.vmethods)
+            self.methods_model.set_methods(self.edit_class.methods)
 
 
     def handle_set_struct(self):
@@ -367,7 +453,7 @@ class ClassWidget(QtWidgets.QWidget):
 
         delete_orphaned = False
         if self.edit_class.struct_id != idc.BADADDR:
-            delete_orphaned = util.ask_yes_no('Do you want to delete the orphaned class', False)
+            delete_orphaned = widgets.ask_yes_no('Do you want to delete the orphaned class', False)
 
         self.edit_class.set_struct_id(dlg.struct_id, delete_orphaned)
         self.update_fields()
@@ -433,21 +519,47 @@ class ClassWidget(QtWidgets.QWidget):
 
         # Warning for large ranges
         if (ea1 - ea0) > 0x1000:
-            if not util.ask_yes_no('Warning: The VTable range is longer than 0x1000 bytes. Continue?', False):
+            if not widgets.ask_yes_no('Warning: The VTable range is longer than 0x1000 bytes. Continue?', False):
                 return
 
+        c = self.edit_class
+        scheduler = jobs.get()
+
         try:
-            self.edit_class.set_vtable_range(ea0, ea1)
-            self.update_fields()
+            if c.is_vtable_locked():
+                if not widgets.ask_yes_no('The class has derived classes. Do you want to rebase their VTables as well?', False):
+                    return
+                c.rebase_vtable(ea0, ea1)
+                self.update_fields()
+                scheduler.refresh_idaview()
+                return
+
+            c.prepare_vtable_range(ea0, ea1)
         except ValueError as e:
             idaapi.warning(str(e))
+            return
+
+        def done(_):
+            self.update_fields()
+            scheduler.refresh_idaview()
 
+        def cancelled():
+            c.truncate_vtable()
+            done(None)
 
-    def handle_vtable_interaction(self, row, column):
+        scheduler.run('Reading VTable of %s' % c.name, c.iter_init_vtable(), c.vtable_size(),
+                      on_done=done, on_cancel=cancelled)
+
+
+    def handle_vtable_interaction(self, index):
         if self.edit_class is None:
             return
 
-        vm = self.edit_class.vmethods[row]
+        row = self.source_row(self.vtable, index)
+        column = index.column()
+        vm = self.vtable_model.method_at(row)
+        if vm is None:
+            return
 
         if column == 0:         # Go to vtable offset
             idc.jumpto(self.edit_class.vtable_start + row*4)
@@ -457,9 +569,13 @@ class ClassWidget(QtWidgets.QWidget):
             dlg = SignatureDialog(vm.return_type, vm.owner.name, vm.name, vm.args, vm.is_const, vm.ctor_type, vm.dtor_type, fixed_owner_type=True)
             if dlg.exec_() != QtWidgets.QDialog.Accepted:
                 return
-            vm.set_signature(dlg.name, dlg.args, dlg.return_type, dlg.is_const, dlg.ctor_type, dlg.dtor_type)
-            self.vtable.setItem(row, 2, QtWidgets.QTableWidgetItem(vm.get_signature()))
-            idaapi.refresh_idaview_anyway()
+            try:
+                vm.set_signature(dlg.name, dlg.args, dlg.return_type, dlg.is_const, dlg.ctor_type, dlg.dtor_type)
+            except ValueError as e:
+                idaapi.warning(str(e))
+                return
+            self.vtable_model.refresh_method(vm)
+            jobs.get().refresh_idaview()
 
 
     def handle_add_method(self):
@@ -494,7 +610,12 @@ class ClassWidget(QtWidgets.QWidget):
             existing_method.unlink()
 
         method = database_entries.Method(sel_ea, self.edit_class, dlg.name)
-        method.set_signature(dlg.name, dlg.args, dlg.return_type, dlg.is_const, dlg.ctor_type, dlg.dtor_type)
+        try:
+            method.set_signature(dlg.name, dlg.args, dlg.return_type, dlg.is_const, dlg.ctor_type, dlg.dtor_type)
+        except ValueError as e:
+            method.unlink()
+            idaapi.warning(str(e))
+            return
         self.edit_class.methods.append(method)
         method.refresh()
 
@@ -507,11 +628,11 @@ class ClassWidget(QtWidgets.QWidget):
         if self.edit_class is None:
             return
 
-        row_item = self.methods.item(self.methods.currentRow(), 0)
-        if row_item is None:
+        index = self.methods.currentIndex()
+        if not index.isValid():
             return
 
-        m = row_item.data(QtCore.Qt.UserRole)
+        m = self.methods_model.method_at(self.source_row(self.methods, index))
         if type(m) != database_entries.Method or m not in self.edit_class.methods:
             return
 
@@ -521,11 +642,12 @@ class ClassWidget(QtWidgets.QWidget):
 
 
 
-    def handle_methods_interaction(self, row, column):
+    def handle_methods_interaction(self, index):
         if self.edit_class is None:
             return
 
-        m = self.methods.item(row, 0).data(QtCore.Qt.UserRole)
+        column = index.column()
+        m = self.methods_model.method_at(self.source_row(self.methods, index))
         if type(m) != database_entries.Method or m not in self.edit_class.methods:
             return
 
@@ -535,7 +657,11 @@ class ClassWidget(QtWidgets.QWidget):
             dlg = SignatureDialog(m.return_type, m.owner.name, m.name, m.args, m.is_const, m.ctor_type, m.dtor_type, fixed_owner_type=True)
             if dlg.exec_() != QtWidgets.QDialog.Accepted:
                 return
-            m.set_signature(dlg.name, dlg.args, dlg.return_type, dlg.is_const, dlg.ctor_type, dlg.dtor_type)
-            self.methods.setItem(row, 1, QtWidgets.QTableWidgetItem(m.get_signature()))
-            idaapi.refresh_idaview_anyway()
+            try:
+                m.set_signature(dlg.name, dlg.args, dlg.return_type, dlg.is_const, dlg.ctor_type, dlg.dtor_type)
+            except ValueError as e:
+                idaapi.warning(str(e))
+                return
+            self.methods_model.refresh_method(m)
+            jobs.get().refresh_idaview()
 
@@ -0,0 +1,135 @@
+import idc
+import ida_hexrays
+
+import classy.database as database
+
+
+def strip_casts(e):
+    while e.op == ida_hexrays.cot_cast:
+        e = e.x
+    return e
+
+
+# The class of the object a vtable pointer expression reads from
+def class_of_vtable_ptr(vtbl, index):
+    vtbl = strip_casts(vtbl)
+
+    # A typed vtable struct: Class_vtbl *
+    if vtbl.type.is_ptr():
+        c = index.class_of_vtable_type(vtbl.type.get_pointed_object().get_type_name())
+        if c is not None:
+            return c
+
+    # *(_DWORD *)this or this->vftable
+    if vtbl.op == ida_hexrays.cot_ptr:
+        obj = strip_casts(vtbl.x)
+    elif vtbl.op == ida_hexrays.cot_memptr and vtbl.m == 0:
+        obj = vtbl.x
+    else:
+        return None
+
+    tif = obj.type
+    if not tif.is_ptr():
+        return None
+
+    name = tif.get_pointed_object().get_type_name()
+    if not name:
+        return None
+
+    return index.class_of_struct(idc.get_struc_id(name))
+
+
+# Returns (class, vtable offset) for calls like (*(this->vftable + 0x48))(this) or this->vftable->vf48(this)
+def extract_vcall(call, index):
+    target = strip_casts(call.x)
+
+    if target.op == ida_hexrays.cot_memptr:
+        return class_of_vtable_ptr(target.x, index), target.m
+
+    if target.op != ida_hexrays.cot_ptr:
+        return None, None
+
+    slot = strip_casts(target.x)
+    offset = 0
+    if slot.op == ida_hexrays.cot_add:
+        num = strip_casts(slot.y)
+        if num.op != ida_hexrays.cot_num:
+            return None, None
+        elem_size = slot.x.type.get_ptrarr_objsize() if slot.x.type.is_ptr() else 1
+        offset = num.numval() * max(elem_size, 1)
+        slot = slot.x
+
+    return class_of_vtable_ptr(slot, index), offset
+
+
+
+class VCallVisitor(ida_hexrays.ctree_visitor_t):
+    def __init__(self, index):
+        ida_hexrays.ctree_visitor_t.__init__(self, ida_hexrays.CV_FAST)
+        self.index = index
+        self.calls = []
+
+
+    def visit_expr(self, e):
+        if e.op == ida_hexrays.cot_call:
+            c, offset = extract_vcall(e, self.index)
+            if c is not None:
+                self.calls.append((e.ea, c, offset))
+        return 0
+
+
+
+# Annotates virtual calls through the vtables of known classes with the signature of the called method
+class ClassyHexraysHooks(ida_hexrays.Hexrays_Hooks):
+    def __init__(self):
+        ida_hexrays.Hexrays_Hooks.__init__(self)
+
+
+    def maturity(self, cfunc, maturity):
+        if maturity != ida_hexrays.CMAT_FINAL:
+            return 0
+
+        try:
+            db = database.get()
+        except ValueError:
+            return 0
+        if not db.is_open:
+            return 0
+
+        index = db.vcall_index
+        results = index.get_cached(cfunc.entry_ea)
+        if results is None:
+            visitor = VCallVisitor(index)
+            visitor.apply_to(cfunc.body, None)
+            results = index.resolve_function(cfunc.entry_ea, visitor.calls)
+
+        # User comments are only kept if they are saved, and only saved if any changed, decompiling again is a no-op
+        changed = False
+        for call_ea, vm in results.items():
+            tl = ida_hexrays.treeloc_t()
+            tl.ea = call_ea
+            tl.itp = ida_hexrays.ITP_SEMI
+            cmt = self.format_comment(vm)
+            if cfunc.get_user_cmt(tl, ida_hexrays.RETRIEVE_ALWAYS) != cmt:
+                cfunc.set_user_cmt(tl, cmt)
+                changed = True
+
+        if changed:
+            cfunc.save_user_cmts()
+
+        return 0
+
+
+    def lvar_type_changed(self, vu, v, tinfo):
+        try:
+            database.get().vcall_index.function_cache.pop(vu.cfunc.entry_ea, None)
+        except ValueError:
+            pass
+        return 0
+
+
+    @staticmethod
+    def format_comment(vm):
+        if vm.ea != idc.BADADDR:
+            return '%s (0x%X)' % (vm.get_signature(), vm.ea)
+        return '%s (%s)' % (vm.get_signature(), vm.type_name())
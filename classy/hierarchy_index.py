@@ -0,0 +1,208 @@
+import bisect
+
+
+# Euler tour numbering of the class hierarchy. Every class gets a preorder label and the label of its last descendant,
+# so the subtree of a class is a contiguous range of labels and ancestor checks are constant time. Labels are spread out
+# with gaps, so new classes and moved subtrees get labels between the existing ones without renumbering everything. Only
+# when a gap is used up the index is rebuilt, on the next query. Ancestor chains are kept as tuples shared down the tree.
+class HierarchyIndex(object):
+
+    GAP = 1 << 16
+
+    def __init__(self, get_roots):
+        self.get_roots = get_roots
+        self.labels = []            # Sorted preorder labels
+        self.classes = {}           # Label -> class
+        self.pre = {}
+        self.last = {}
+        self.ancestors = {}         # Class -> bases, nearest first
+        self.is_dirty = True
+
+
+    def invalidate(self):
+        self.is_dirty = True
+
+
+    def build(self):
+        self.labels = []
+        self.classes = {}
+        self.pre = {}
+        self.last = {}
+        self.ancestors = {}
+
+        stack = [(c, (), False) for c in reversed(self.get_roots())]
+        while len(stack):
+            c, ancestors, is_exit = stack.pop()
+            if is_exit:
+                self.last[c] = self.labels[-1]
+                continue
+
+            label = (len(self.labels) + 1) * self.GAP
+            self.pre[c] = label
+            self.classes[label] = c
+            self.labels.append(label)
+            self.ancestors[c] = ancestors
+
+            stack.append((c, ancestors, True))
+            for d in reversed(c.derived):
+                stack.append((d, (c,) + ancestors, False))
+
+        self.is_dirty = False
+
+
+    def ensure_built(self):
+        if self.is_dirty:
+            self.build()
+
+
+    # A class that was just created, it has to be the last derived class of its base or the last root
+    def add(self, c):
+        if self.is_dirty:
+            return
+        self.insert_subtree(c)
+
+
+    # A class that was moved to another base with set_base, together with its derived classes
+    def move(self, c):
+        if self.is_dirty:
+            return
+        if c not in self.pre:
+            self.invalidate()
+            return
+
+        self.unlabel(list(self.iter_subtree(c)))
+        self.insert_subtree(c)
+
+
+    # Labels the class and its derived classes after the last descendant of its base
+    def insert_subtree(self, c):
+        if c.base is None:
+            after = self.labels[-1] if len(self.labels) else 0
+            ancestors = ()
+        elif c.base in self.pre:
+            after = self.last[c.base]
+            ancestors = (c.base,) + self.ancestors[c.base]
+        else:
+            self.invalidate()
+            return
+
+        count = self.count_subtree(c)
+        idx = bisect.bisect_right(self.labels, after)
+        before = self.labels[idx] if idx < len(self.labels) else after + (count + 1) * self.GAP
+        step = (before - after) // (count + 1)
+        if step < 1:
+            self.invalidate()
+            return
+
+        # Preorder walk, labels are handed out in order and contiguous, so they can go into the sorted list in one piece
+        new_labels = []
+        stack = [(c, ancestors, False)]
+        while len(stack):
+            d, d_ancestors, is_exit = stack.pop()
+            if is_exit:
+                self.last[d] = new_labels[-1]
+                continue
+
+            label = after + (len(new_labels) + 1) * step
+            self.pre[d] = label
+            self.classes[label] = d
+            self.ancestors[d] = d_ancestors
+            new_labels.append(label)
+
+            stack.append((d, d_ancestors, True))
+            for e in reversed(d.derived):
+                stack.append((e, (d,) + d_ancestors, False))
+
+        self.labels[idx:idx] = new_labels
+
+        # Bases whose last descendant was the one the subtree was inserted after now end with the subtree
+        for a in ancestors:
+            if self.last[a] == after:
+                self.last[a] = new_labels[-1]
+
+
+    @staticmethod
+    def count_subtree(c):
+        count = 0
+        stack = [c]
+        while len(stack):
+            d = stack.pop()
+            count += 1
+            stack.extend(d.derived)
+        return count
+
+
+    # Only leaves can be removed without a rebuild
+    def remove(self, c):
+        if self.is_dirty or c not in self.pre:
+            return
+
+        if len(c.derived):
+            self.invalidate()
+            return
+
+        self.unlabel([c])
+
+
+    # Drops the labels of a subtree given in preorder. Bases that ended with the subtree end with the label before it.
+    def unlabel(self, subtree):
+        first = bisect.bisect_left(self.labels, self.pre[subtree[0]])
+        last_label = self.last[subtree[0]]
+        prev_label = self.labels[first - 1] if first > 0 else 0
+        for a in self.ancestors[subtree[0]]:
+            if self.last[a] == last_label:
+                self.last[a] = prev_label
+
+        del self.labels[first:first + len(subtree)]
+        for d in subtree:
+            del self.classes[self.pre.pop(d)]
+            del self.last[d]
+            del self.ancestors[d]
+
+
+    # Is a derived (directly or indirectly) from b?
+    def is_subclass_of(self, a, b):
+        self.ensure_built()
+        try:
+            pre_b = self.pre[b]
+            return pre_b < self.pre[a] <= self.last[b]
+        except KeyError:
+            return False
+
+
+    # None for classes that are not in the database
+    def depth(self, c):
+        ancestors = self.get_ancestors(c)
+        return None if ancestors is None else len(ancestors)
+
+
+    # The bases of a class, nearest first, or None for classes that are not in the database
+    def get_ancestors(self, c):
+        self.ensure_built()
+        if c not in self.ancestors:
+            self.build()
+        return self.ancestors.get(c)
+
+
+    # Yields the class and all classes derived from it in preorder
+    def iter_subtree(self, c):
+        self.ensure_built()
+        if c not in self.pre:
+            self.build()
+            if c not in self.pre:
+                return
+        start = bisect.bisect_left(self.labels, self.pre[c])
+        end = bisect.bisect_right(self.labels, self.last[c])
+        for label in self.labels[start:end]:
+            yield self.classes[label]
+
+
+    # Yields all classes in preorder, bases always come before derived classes
+    def iter_all(self):
+        self.ensure_built()
+        for label in list(self.labels):
+            yield self.classes[label]
+
+
+    def iter_ancestors(self, c):
+        return iter(self.get_ancestors(c) or ())
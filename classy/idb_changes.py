@@ -0,0 +1,182 @@
+import idaapi
+import idc
+import ida_bytes
+import ida_funcs
+
+import classy.database as database
+from classy.util import log
+
+
+NO_FUNCTION = 'no function'
+RENAMED = 'renamed'
+STRUCT_DELETED = 'struct deleted'
+VTABLE_UNDEFINED = 'vtable undefined'
+
+
+def check_method(m):
+    reasons = set()
+    if m.ea == idc.BADADDR:
+        return reasons
+    if ida_funcs.get_func(m.ea) is None:
+        reasons.add(NO_FUNCTION)
+    mangled = database.get().mangled_index.get_mangled(m)
+    if mangled is not None and idc.get_name(m.ea) != mangled:
+        reasons.add(RENAMED)
+    return reasons
+
+
+# Linked structs can have any name, the user can pick existing structs, so struct names are not checked
+def check_class(c):
+    reasons = set()
+    if c.vtable_start is not None and find_undefined_entry(c) is not None:
+        reasons.add(VTABLE_UNDEFINED)
+    return reasons
+
+
+# Index of the first vtable entry that is no offset, or None. IDA has no call that returns the flags of a range, so the
+# flags are read entry by entry, with the same slot size as the rest of the vtable code.
+def find_undefined_entry(c):
+    for idx in range(c.vtable_size()):
+        if not ida_bytes.is_off0(ida_bytes.get_full_flags(c.get_vtable_index_ea(idx))):
+            return idx
+    return None
+
+
+def is_class(entry):
+    import classy.database_entries as database_entries
+    return isinstance(entry, database_entries.Class)
+
+
+def is_linked(entry):
+    if is_class(entry):
+        return database.get().classes_by_name.get(entry.name) is entry
+    return entry.owner is not None
+
+
+
+# Classes and methods whose counterparts in the IDB were changed outside of Classy. The IDB hooks only report candidates,
+# they are checked together once the events stop coming in, so the changes Classy makes itself and changes that were
+# undone are not flagged. Flagged entries are written to the IDB again by iter_refresh, nothing is overwritten before.
+class IDBChanges(object):
+
+    CHECK_DELAY = 300           # ms
+
+    def __init__(self):
+        self.candidates = set()
+        self.flagged = {}           # Entry -> reasons
+        self.sticky = {}            # Reasons that cannot be checked again, like deleted structs
+        self.check_timer = None
+
+
+    def __len__(self):
+        self.ensure_checked()
+        return len(self.flagged)
+
+
+    def clear(self):
+        self.candidates = set()
+        self.flagged = {}
+        self.sticky = {}
+
+
+    def add_candidate(self, entry, sticky_reason=None):
+        if sticky_reason is not None:
+            self.sticky.setdefault(entry, set()).add(sticky_reason)
+        self.candidates.add(entry)
+        self.schedule_check()
+
+
+    # The class loses its struct right away, a struct id can be reused by the next struct. The class stays flagged until
+    # it is refreshed, so the deletion shows up in "Refresh changed" and not just in the log.
+    def struct_deleted(self, c):
+        db = database.get()
+        db.classes_by_struct_id.pop(c.struct_id, None)
+        c.struct_id = idc.BADADDR
+        db.vcall_index.invalidate(c)
+        log('The struct of %s was deleted, the class is not linked to a struct anymore' % c.name)
+        self.add_candidate(c, STRUCT_DELETED)
+
+
+    # Without Qt, e.g. in batch mode, there is no timer, the candidates are checked once the flagged entries are needed
+    def schedule_check(self):
+        if not idaapi.is_idaq():
+            return
+
+        if self.check_timer is None:
+            from PyQt5 import QtCore
+            self.check_timer = QtCore.QTimer()
+            self.check_timer.setSingleShot(True)
+            self.check_timer.timeout.connect(self.check)
+        if not self.check_timer.isActive():
+            self.check_timer.start(self.CHECK_DELAY)
+
+
+    def ensure_checked(self):
+        if len(self.candidates):
+            self.check()
+
+
+    def check(self):
+        candidates = self.candidates
+        self.candidates = set()
+
+        newly_flagged = 0
+        for entry in candidates:
+            if not is_linked(entry):
+                self.flagged.pop(entry, None)
+                self.sticky.pop(entry, None)
+                continue
+
+            reasons = check_class(entry) if is_class(entry) else check_method(entry)
+            reasons |= self.sticky.get(entry, set())
+            if not len(reasons):
+                self.flagged.pop(entry, None)
+                continue
+
+            if entry not in self.flagged:
+                newly_flagged += 1
+            self.flagged[entry] = reasons
+
+        if newly_flagged:
+            log('%d Classy entries were changed in the IDB, %d in total. "Refresh changed" writes them again.' %
+                (newly_flagged, len(self.flagged)))
+
+
+    def describe(self, entry):
+        name = entry.name if is_class(entry) else entry.get_signature()
+        return '%s: %s' % (name, ', '.join(sorted(self.flagged[entry])))
+
+
+    # Writes the flagged entries to the IDB again, one per iteration
+    def iter_refresh(self):
+        self.ensure_checked()
+        flagged = self.flagged
+        self.flagged = {}
+        self.sticky = {}
+
+        for entry, reasons in flagged.items():
+            if not is_linked(entry):
+                continue
+            if is_class(entry):
+                self.refresh_class(entry, reasons)
+            else:
+                self.refresh_method(entry, reasons)
+            yield
+
+
+    @staticmethod
+    def refresh_method(m, reasons):
+        if NO_FUNCTION in reasons and not ida_funcs.add_func(m.ea):
+            log('Cannot create a function at 0x%X for %s' % (m.ea, m.get_signature()))
+        m.refresh()
+
+
+    @staticmethod
+    def refresh_class(c, reasons):
+        if STRUCT_DELETED in reasons:
+            log('The struct of %s was deleted' % c.name)
+        if VTABLE_UNDEFINED in reasons:
+            for idx, dst in c.apply_vtable_data():
+                log('VTable entry %d of %s points to 0x%X, which is not %s' %
+                    (idx, c.name, dst, c.vmethods[idx].get_signature()))
+        c.refresh_struct_comment()
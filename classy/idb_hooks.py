@@ -0,0 +1,127 @@
+import ida_idp
+
+import classy.database as database
+import classy.struct_layout as struct_layout
+import classy.local_types as local_types
+
+
+# Keeps the caches derived from the IDB up to date and reports entries that might have been changed outside of Classy
+class ClassyIDBHooks(ida_idp.IDB_Hooks):
+    def __init__(self):
+        ida_idp.IDB_Hooks.__init__(self)
+
+
+    def struc_created(self, struc_id):
+        struct_layout.cache.invalidate(struc_id)
+        return 0
+
+
+    def struc_deleted(self, struc_id):
+        struct_layout.cache.invalidate(struc_id)
+        db = self.get_database()
+        if db is not None and struc_id in db.classes_by_struct_id:
+            db.idb_changes.struct_deleted(db.classes_by_struct_id[struc_id])
+        return 0
+
+
+    def struc_renamed(self, sptr, *args):
+        struct_layout.cache.invalidate(sptr.id)
+        return 0
+
+
+    # Newer IDA versions pass the old name too
+    def renamed(self, ea, new_name, local_name, *args):
+        db = self.get_database()
+        if db is not None and ea in db.known_methods:
+            db.idb_changes.add_candidate(db.known_methods[ea])
+        return 0
+
+
+    def func_added(self, pfn):
+        db = self.get_database()
+        if db is not None and pfn.start_ea in db.known_methods:
+            db.idb_changes.add_candidate(db.known_methods[pfn.start_ea])
+        return 0
+
+
+    def func_deleted(self, func_ea):
+        db = self.get_database()
+        if db is not None and func_ea in db.known_methods:
+            db.idb_changes.add_candidate(db.known_methods[func_ea])
+        return 0
+
+
+    def destroyed_items(self, ea1, ea2, will_disable_range):
+        db = self.get_database()
+        if db is not None:
+            for c in db.vtable_index.find_overlapping(ea1, ea2):
+                db.idb_changes.add_candidate(c)
+        return 0
+
+
+    def struc_expanded(self, sptr):
+        struct_layout.cache.invalidate(sptr.id)
+        return 0
+
+
+    def struc_align_changed(self, sptr):
+        struct_layout.cache.invalidate(sptr.id)
+        return 0
+
+
+    def struc_member_created(self, sptr, mptr):
+        struct_layout.cache.invalidate(sptr.id)
+        return 0
+
+
+    def struc_member_deleted(self, sptr, member_id, offset):
+        struct_layout.cache.invalidate(sptr.id)
+        return 0
+
+
+    def struc_member_renamed(self, sptr, mptr):
+        struct_layout.cache.invalidate(sptr.id)
+        return 0
+
+
+    def struc_member_changed(self, sptr, mptr):
+        struct_layout.cache.invalidate(sptr.id)
+        return 0
+
+
+    # IDA 9 passes the changed ordinal, older versions don't tell what changed
+    def local_types_changed(self, *args):
+        if len(args) >= 2 and args[1]:
+            struct_layout.cache.invalidate_ordinal(args[1])
+        else:
+            struct_layout.cache.clear()
+        local_types.cache.clear()
+        self.invalidate_vcalls()
+        self.invalidate_typedefs()
+        return 0
+
+
+    @staticmethod
+    def get_database():
+        try:
+            db = database.get()
+        except ValueError:
+            return None
+        return db if db.is_open else None
+
+
+    @staticmethod
+    def invalidate_typedefs():
+        try:
+            database.get().local_types_changed()
+        except ValueError:
+            pass
+
+
+    # Changed types might change which calls go through a class vtable
+    @staticmethod
+    def invalidate_vcalls():
+        try:
+            database.get().vcall_index.invalidate()
+        except ValueError:
+            pass
@@ -0,0 +1,80 @@
+import bisect
+
+
+# Sorted index of non-overlapping [start, end) intervals. As no interval may overlap another one,
+# the starts and ends are both sorted, which allows point and overlap queries using bisection.
+class IntervalIndex(object):
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.values = []
+        self.intervals_by_value = {}
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+    def __iter__(self):
+        return iter(zip(self.starts, self.ends, self.values))
+
+
+    def clear(self):
+        self.starts = []
+        self.ends = []
+        self.values = []
+        self.intervals_by_value = {}
+
+
+    def add(self, start, end, value):
+        if start >= end:
+            raise ValueError('Interval end must be after the start')
+
+        # The old interval of the value is only replaced once the new one fits, a rejected add keeps it
+        overlapping = [v for v in self.find_overlapping(start, end) if v != value]
+        if len(overlapping):
+            raise ValueError('Interval 0x%X - 0x%X overlaps with an existing interval' % (start, end))
+
+        self.remove(value)
+
+        idx = bisect.bisect_left(self.starts, start)
+        self.starts.insert(idx, start)
+        self.ends.insert(idx, end)
+        self.values.insert(idx, value)
+        self.intervals_by_value[value] = (start, end)
+
+
+    def remove(self, value):
+        try:
+            start, end = self.intervals_by_value.pop(value)
+        except KeyError:
+            return
+
+        idx = bisect.bisect_left(self.starts, start)
+        while self.values[idx] != value:
+            idx += 1
+        del self.starts[idx]
+        del self.ends[idx]
+        del self.values[idx]
+
+
+    def get(self, value):
+        return self.intervals_by_value.get(value)
+
+
+    # Returns the value whose interval contains the address or None
+    def find(self, ea):
+        idx = bisect.bisect_right(self.starts, ea) - 1
+        if idx >= 0 and ea < self.ends[idx]:
+            return self.values[idx]
+        return None
+
+
+    # Returns the values of all intervals overlapping [start, end)
+    def find_overlapping(self, start, end):
+        ret = []
+        idx = bisect.bisect_right(self.ends, start)
+        while idx < len(self.starts) and self.starts[idx] < end:
+            ret.append(self.values[idx])
+            idx += 1
+        return ret
@@ -124,13 +124,22 @@ def len_encode(ident):
     return "%u%s" % (len(ident), ident)
 
 
+# Pre-splits the typedef values so they don't have to be split for every argument
+def compile_typedefs(typedefs):
+    compiled = {}
+    for name, value in typedefs.items():
+        compiled[name] = tuple(value.split())
+    return compiled
+
+
 def apply_typedefs(segs, typedefs):
     idx = 0
     while idx < len(segs):
         s = segs[idx]
         if s in typedefs:
             del segs[idx]
-            new_segs = typedefs[s].split()
+            new_segs = typedefs[s]
+            new_segs = new_segs.split() if isinstance(new_segs, str) else list(new_segs)
             while len(new_segs):
                 segs.insert(idx, new_segs.pop(0))
                 idx += 1
@@ -0,0 +1,293 @@
+import time
+import threading
+import concurrent.futures
+
+import idaapi
+
+from classy.util import log
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# A long running operation. Main thread jobs are generators doing one unit of IDA work per iteration, they may yield
+# the number of processed units. Thread jobs are functions that get the job as argument, report their progress through
+# set_progress and are expected to call check_cancelled regularly.
+class Job(object):
+    def __init__(self, title, work, total=0, on_done=None, on_cancel=None, in_thread=False, on_error=None):
+        self.title = title
+        self.work = work
+        self.total = total
+        self.done = 0
+        self.on_done = on_done
+        self.on_cancel = on_cancel
+        self.on_error = on_error
+        self.in_thread = in_thread
+        self.future = None
+        self.lock = threading.Lock()
+        self.cancelled = False
+
+
+    def set_progress(self, done, total=None):
+        with self.lock:
+            self.done = done
+            if total is not None:
+                self.total = total
+
+
+    def get_progress(self):
+        with self.lock:
+            return self.done, self.total
+
+
+    def cancel(self):
+        self.cancelled = True
+
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+
+
+class JobScheduler(object):
+
+    TIME_SLICE = 0.05           # seconds of IDA work per timer tick
+    POLL_INTERVAL = 50          # ms between polls of thread jobs
+    MAX_WORKERS = 2
+
+    # Qt is imported with the first job, not with the module
+    def __init__(self):
+        from PyQt5 import QtCore
+
+        self.queue = []
+        self.current = None
+        self.executor = None
+        self.progress = None
+
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.step)
+
+        self.refresh_pending = False
+        self.refresh_timer = QtCore.QTimer()
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.timeout.connect(self.do_refresh_idaview)
+
+
+    def run(self, title, work, total=0, on_done=None, on_cancel=None, on_error=None):
+        job = Job(title, work, total, on_done, on_cancel, on_error=on_error)
+        self.enqueue(job)
+        return job
+
+
+    def run_in_thread(self, title, fn, total=0, on_done=None, on_cancel=None, on_error=None):
+        job = Job(title, fn, total, on_done, on_cancel, in_thread=True, on_error=on_error)
+        self.enqueue(job)
+        return job
+
+
+    def is_busy(self):
+        return self.current is not None or len(self.queue) > 0
+
+
+    def enqueue(self, job):
+        self.queue.append(job)
+        if self.current is None:
+            self.start_next()
+
+
+    def start_next(self):
+        if not len(self.queue):
+            self.current = None
+            self.close_progress()
+            return
+
+        self.current = self.queue.pop(0)
+        self.show_progress(self.current)
+
+        if self.current.in_thread:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(self.MAX_WORKERS)
+            self.current.future = self.executor.submit(self.current.work, self.current)
+            self.timer.start(self.POLL_INTERVAL)
+        else:
+            self.timer.start(0)
+
+
+    def step(self):
+        job = self.current
+        if job is None:
+            return
+
+        if job.cancelled or (self.progress is not None and self.progress.wasCanceled()):
+            job.cancel()
+
+        if job.in_thread:
+            self.step_thread_job(job)
+        else:
+            self.step_main_job(job)
+
+
+    def step_main_job(self, job):
+        if job.cancelled:
+            job.work.close()
+            self.finish(job, None, cancelled=True)
+            return
+
+        deadline = time.time() + self.TIME_SLICE
+        try:
+            while time.time() < deadline:
+                processed = next(job.work)
+                job.done += processed if isinstance(processed, int) else 1
+        except StopIteration as e:
+            self.finish(job, e.value)
+            return
+        except Exception as e:
+            self.fail(job, e)
+            return
+
+        self.update_progress(job)
+        self.timer.start(0)
+
+
+    def step_thread_job(self, job):
+        if not job.future.done():
+            self.update_progress(job)
+            self.timer.start(self.POLL_INTERVAL)
+            return
+
+        try:
+            result = job.future.result()
+        except JobCancelled:
+            self.finish(job, None, cancelled=True)
+            return
+        except Exception as e:
+            self.fail(job, e)
+            return
+
+        self.finish(job, result)
+
+
+    def finish(self, job, result, cancelled=False):
+        self.current = None
+        self.close_progress()
+
+        try:
+            if cancelled:
+                log('%s: Cancelled' % job.title)
+                if job.on_cancel is not None:
+                    job.on_cancel()
+            elif job.on_done is not None:
+                job.on_done(result)
+        except Exception as e:
+            idaapi.warning('%s failed: %s' % (job.title, str(e)))
+
+        self.start_next()
+
+
+    def fail(self, job, e):
+        self.current = None
+        self.close_progress()
+        idaapi.warning('%s failed: %s' % (job.title, str(e)))
+        if job.on_error is not None:
+            job.on_error(e)
+        self.start_next()
+
+
+    # Main thread jobs change the database between their iterations, so the dialog blocks the rest of the UI right away
+    # for them. Thread jobs work on snapshots and leave IDA usable.
+    def show_progress(self, job):
+        from PyQt5 import QtWidgets, QtCore
+
+        self.close_progress()
+        self.progress = QtWidgets.QProgressDialog(job.title, 'Cancel', 0, max(job.total, 0))
+        self.progress.setWindowTitle('Classy')
+        if job.in_thread:
+            self.progress.setMinimumDuration(500)
+        else:
+            self.progress.setWindowModality(QtCore.Qt.ApplicationModal)
+            self.progress.setMinimumDuration(0)
+        self.progress.setAutoClose(False)
+        self.progress.setAutoReset(False)
+        self.progress.setValue(0)
+
+
+    def update_progress(self, job):
+        if self.progress is None:
+            return
+        done, total = job.get_progress()
+        if total != self.progress.maximum():
+            self.progress.setMaximum(max(total, 0))
+        if total > 0:
+            self.progress.setValue(min(done, total))
+
+
+    def close_progress(self):
+        if self.progress is None:
+            return
+        self.progress.close()
+        self.progress.deleteLater()
+        self.progress = None
+
+
+    # Many operations end with refresh_idaview_anyway, this merges them into a single refresh
+    def refresh_idaview(self):
+        if self.refresh_pending:
+            return
+        self.refresh_pending = True
+        self.refresh_timer.start(0)
+
+
+    def do_refresh_idaview(self):
+        self.refresh_pending = False
+        idaapi.refresh_idaview_anyway()
+
+
+    def cleanup(self):
+        self.timer.stop()
+        self.refresh_timer.stop()
+        if self.current is not None:
+            self.current.cancel()
+        self.queue = []
+        self.close_progress()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+
+# Runs fn on the main thread from a worker thread and returns its result
+def execute_sync(fn, write=True):
+    ret = []
+
+    def wrapper():
+        ret.append(fn())
+        return 1
+
+    idaapi.execute_sync(wrapper, idaapi.MFF_WRITE if write else idaapi.MFF_READ)
+    return ret[0] if len(ret) else None
+
+
+
+scheduler = None
+
+
+def get():
+    global scheduler
+
+    if scheduler is None:
+        scheduler = JobScheduler()
+
+    return scheduler
+
+
+def destroy_instance():
+    global scheduler
+
+    if scheduler is None:
+        return
+
+    scheduler.cleanup()
+    scheduler = None
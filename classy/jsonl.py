@@ -0,0 +1,103 @@
+# Streaming JSON Lines export of the database, one record per line. Nothing in here touches IDA, the records can be
+# read with any JSON parser and written from inside IDA or from the command line tool.
+#
+# Records, in this order:
+#   {"type": "database", "format": "classy-jsonl", "version": 1, "pure_virtual_vals": [...], "deleted_virtual_vals": [...]}
+#   {"type": "typedef", "name": ..., "value": ...}
+#   {"type": "class", "name": ..., "base": ..., "struct": ..., "vtable_start": ..., "vtable_end": ...}
+#   {"type": "method", "class": ..., "ea": ..., <signature>}
+#   {"type": "vslot", "class": ..., "idx": ..., "kind": ..., "ea": ..., <signature>}
+# Classes come before their derived classes and are followed by their methods and the vtable slots they own.
+# Signatures are "name", "args", "return_type", "is_const", "ctor_type", "dtor_type" and "mangled".
+import json
+
+
+FORMAT_NAME = 'classy-jsonl'
+FORMAT_VERSION = 1
+
+WRITE_BUFFER_SIZE = 1 << 16
+
+BADADDR_VALUES = [0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF]
+
+
+def encode_ea(ea):
+    return None if ea in BADADDR_VALUES else ea
+
+
+def signature_fields(m, record):
+    record['name'] = m.name
+    record['args'] = m.args
+    record['return_type'] = m.return_type
+    record['is_const'] = m.is_const
+    record['ctor_type'] = m.ctor_type
+    record['dtor_type'] = m.dtor_type
+    try:
+        record['mangled'] = m.get_cached_mangled()
+    except (ValueError, NotImplementedError):
+        record['mangled'] = None
+    return record
+
+
+# classes have to be in base before derived order, struct_name_of returns the name of the struct linked to a class
+def iter_records(classes, typedefs, pure_virtual_vals=(), deleted_virtual_vals=(), struct_name_of=None):
+    yield {'type': 'database', 'format': FORMAT_NAME, 'version': FORMAT_VERSION,
+           'pure_virtual_vals': list(pure_virtual_vals), 'deleted_virtual_vals': list(deleted_virtual_vals)}
+
+    for name, value in typedefs.items():
+        yield {'type': 'typedef', 'name': name, 'value': value}
+
+    for c in classes:
+        yield {'type': 'class', 'name': c.name, 'base': c.base.name if c.base is not None else None,
+               'struct': struct_name_of(c) if struct_name_of is not None else None,
+               'vtable_start': c.vtable_start, 'vtable_end': c.vtable_end}
+
+        for m in c.methods:
+            yield signature_fields(m, {'type': 'method', 'class': c.name, 'ea': encode_ea(m.ea)})
+
+        for idx, vm in enumerate(c.vmethods):
+            if vm is None or vm.owner != c:
+                continue
+            yield signature_fields(vm, {'type': 'vslot', 'class': c.name, 'idx': idx, 'kind': vm.type_name(),
+                                        'ea': encode_ea(vm.ea)})
+
+
+# Writes the records one line at a time. Yields after every record, so it can run as a job (see classy.jobs).
+def iter_write(path, records):
+    count = 0
+    with open(path, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(',', ':')))
+            f.write('\n')
+            count += 1
+            yield
+    return count
+
+
+def write(path, records):
+    for _ in iter_write(path, records):
+        pass
+
+
+def iter_read(path):
+    with open(path, 'r') as f:
+        is_first = True
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError('Line %d is not valid JSON: %s' % (line_no, str(e)))
+            # The header is the first record, blank lines before it don't count
+            if is_first:
+                check_header(record)
+                is_first = False
+            yield record
+
+
+def check_header(record):
+    if record.get('type') != 'database' or record.get('format') != FORMAT_NAME:
+        raise ValueError('Not a Classy JSON Lines file')
+    if record.get('version') != FORMAT_VERSION:
+        raise ValueError('Version Mismatch! File: %s, Plugin: %s' % (record.get('version'), FORMAT_VERSION))
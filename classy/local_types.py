@@ -0,0 +1,113 @@
+import re
+
+import idc
+import ida_typeinf
+
+
+# IDA spellings of builtin types
+IDA_TYPES = {
+    '__int8': 'char',
+    '__int16': 'short',
+    '__int32': 'int',
+    '__int64': 'long long',
+    '_BYTE': 'unsigned char',
+    '_WORD': 'unsigned short',
+    '_DWORD': 'unsigned int',
+    '_QWORD': 'unsigned long long',
+    '_BOOL1': 'bool',
+    '_BOOL4': 'int',
+}
+
+TAG_KEYWORDS = ['struct', 'union', 'enum', 'class']
+
+MAX_DEPTH = 16
+
+
+def get_ordinal_limit():
+    if hasattr(ida_typeinf, 'get_ordinal_limit'):
+        return ida_typeinf.get_ordinal_limit(None)
+    return ida_typeinf.get_ordinal_qty(None) + 1
+
+
+# The type a local typedef refers to as written, or None if it is no typedef or of a kind the mangler cannot handle
+def get_typedef_declaration(ordinal, name):
+    decl = idc.get_local_type(ordinal, idc.PRTYPE_1LINE)
+    if not decl:
+        return None
+
+    m = re.match(r'^typedef\s+(.+?)\s*\b%s\s*;$' % re.escape(name), decl)
+    if m is None or '(' in m.group(1) or '[' in m.group(1):
+        return None
+    return m.group(1)
+
+
+# Typedefs of the IDA local types in the form of Classy typedefs, e.g. u32 -> unsigned int. Typedefs referring to other
+# typedefs are resolved to the final type, as the mangler only applies typedefs once. Everything is read from the IDB
+# on first use and kept until clear, which the IDB hooks call when local types change.
+class LocalTypedefCache(object):
+    def __init__(self):
+        self.declarations = None
+        self.typedefs = None
+        self.resolved = {}
+
+
+    def clear(self):
+        self.declarations = None
+        self.typedefs = None
+        self.resolved = {}
+
+
+    def load_declarations(self):
+        self.declarations = {}
+        for ordinal in range(1, get_ordinal_limit()):
+            name = ida_typeinf.get_numbered_type_name(None, ordinal)
+            if not name:
+                continue
+            decl = get_typedef_declaration(ordinal, name)
+            if decl is not None:
+                self.declarations[name] = decl
+
+
+    # The final type of a typedef or None if it is not a usable local typedef
+    def resolve(self, name, depth=0):
+        if name in self.resolved:
+            return self.resolved[name]
+        if self.declarations is None:
+            self.load_declarations()
+
+        decl = self.declarations.get(name)
+        if decl is None or depth > MAX_DEPTH:
+            return None
+
+        segs = []
+        for s in decl.replace('&', ' & ').replace('*', ' * ').split():
+            if s in TAG_KEYWORDS:
+                continue
+            if s in IDA_TYPES:
+                s = IDA_TYPES[s]
+            elif s != name and s in self.declarations:
+                s = self.resolve(s, depth + 1) or s
+            segs.append(s)
+
+        resolved = ' '.join(segs)
+        if resolved == name:
+            resolved = None
+        self.resolved[name] = resolved
+        return resolved
+
+
+    # All usable local typedefs by name
+    def get_typedefs(self):
+        if self.typedefs is None:
+            if self.declarations is None:
+                self.load_declarations()
+            self.typedefs = {}
+            for name in self.declarations:
+                resolved = self.resolve(name)
+                if resolved:
+                    self.typedefs[name] = resolved
+        return self.typedefs
+
+
+
+cache = LocalTypedefCache()
@@ -0,0 +1,72 @@
+# Maps mangled names to methods and back. A method whose mangled name is already used by another method is still
+# tracked, but as a collision, so it can be reported and takes over the name once the other method goes away.
+class MangledIndex(object):
+    def __init__(self):
+        self.methods_by_name = {}
+        self.names_by_method = {}
+        self.collisions = {}
+
+
+    def __len__(self):
+        return len(self.names_by_method)
+
+
+    def clear(self):
+        self.methods_by_name = {}
+        self.names_by_method = {}
+        self.collisions = {}
+
+
+    # Registers the mangled name of a method and returns the method already using that name, if any
+    def set(self, method, mangled):
+        if self.names_by_method.get(method) == mangled and method not in self.collisions:
+            return None
+
+        self.remove(method)
+
+        self.names_by_method[method] = mangled
+
+        owner = self.methods_by_name.get(mangled)
+        if owner is None:
+            self.methods_by_name[mangled] = method
+            return None
+
+        self.collisions[method] = mangled
+        return owner
+
+
+    def remove(self, method):
+        mangled = self.names_by_method.pop(method, None)
+        if mangled is None:
+            return
+
+        if self.collisions.pop(method, None) is not None:
+            return
+
+        del self.methods_by_name[mangled]
+
+        for m, m_mangled in self.collisions.items():
+            if m_mangled == mangled:
+                del self.collisions[m]
+                self.methods_by_name[mangled] = m
+                break
+
+
+    def find(self, mangled):
+        return self.methods_by_name.get(mangled)
+
+
+    def get_mangled(self, method):
+        return self.names_by_method.get(method)
+
+
+    # Returns the method other than the given one that already uses the mangled name
+    def find_collision(self, method, mangled):
+        owner = self.methods_by_name.get(mangled)
+        if owner is None or owner == method:
+            return None
+        return owner
+
+
+    def is_collided(self, method):
+        return method in self.collisions
@@ -2,13 +2,13 @@ import re
 
 import ida_kernwin
 from classy.uiaction import UiAction
-from classy.util import show_about
 
 
 class MenuState:
     NULL = 0
     DATABASE_CLOSED = 1
     DATABASE_OPENED = 2
+    DATABASE_LOADING = 3
 
 
 class MenuMgr:
@@ -19,21 +19,34 @@ class MenuMgr:
         self.menu = ida_kernwin.create_menu("Classy", "Classy")
 
         # Global actions
-        self.about_action = self.create_menu_item("About", show_about)
+        self.about_action = self.create_menu_item("About", plugin.show_about)
 
         # Database closed actions
         self.action_create_open = self.create_menu_item("Create/open database", plugin.create_open_database)
 
+        # Database loading actions
+        self.action_loading = self.create_menu_item("Loading database...", plugin.show_loading)
+
         # Database opened actions
         self.action_show_gui = self.create_menu_item("Show GUI", plugin.show_gui)
         self.action_save = self.create_menu_item("Save Database", plugin.save)
         self.action_save_as = self.create_menu_item("Save Database As...", plugin.save_as)
         self.action_export_all_symbols = self.create_menu_item("Export all Symbols...", plugin.export_all_symbols)
+        self.action_export_symbols_incremental = self.create_menu_item("Export changed Symbols", plugin.export_symbols_incremental)
+        self.action_set_symbol_export_target = self.create_menu_item("Set incremental Symbol export target...", plugin.set_symbol_export_target)
+        self.action_export_all_headers = self.create_menu_item("Export all C++ Headers...", plugin.export_all_headers)
+        self.action_export_jsonl = self.create_menu_item("Export JSON Lines...", plugin.export_jsonl)
+        self.action_import_jsonl = self.create_menu_item("Import JSON Lines...", plugin.import_jsonl)
+        self.action_update_vtable_types = self.create_menu_item("Update VTable types", plugin.update_vtable_types)
         self.action_edit_typedefs = self.create_menu_item("Edit Typedefs...", plugin.edit_typedefs)
+        self.action_set_use_local_types = self.create_menu_item("Set local type resolution...", plugin.set_use_local_types)
         self.action_set_pure_virtuals = self.create_menu_item("Set pure virtual values...", plugin.edit_pure_virtual_vals)
         self.action_set_deleted_virtuals = self.create_menu_item("Set deleted virtual values...", plugin.edit_deleted_virtual_vals)
         self.action_set_autosave_interval = self.create_menu_item("Set autosave interval...", plugin.set_autosave_interval)
         self.action_refresh_all = self.create_menu_item("Refresh all", plugin.refresh_all)
+        self.action_refresh_changed = self.create_menu_item("Refresh changed", plugin.refresh_changed)
+        self.action_check_consistency = self.create_menu_item("Check consistency...", plugin.check_consistency)
+        self.action_find_vtable_owner = self.create_menu_item("Find VTable owner", plugin.find_vtable_owner)
         self.action_clear_database = self.create_menu_item("Clear Database", plugin.clear_database)
 
 
@@ -55,16 +68,29 @@ class MenuMgr:
         if self.state == MenuState.DATABASE_CLOSED:
             self.action_create_open.attach()
 
+        if self.state == MenuState.DATABASE_LOADING:
+            self.action_loading.attach()
+
         if self.state == MenuState.DATABASE_OPENED:
             self.action_show_gui.attach()
             self.action_save.attach()
             self.action_save_as.attach()
             self.action_export_all_symbols.attach()
+            self.action_export_symbols_incremental.attach()
+            self.action_set_symbol_export_target.attach()
+            self.action_export_all_headers.attach()
+            self.action_export_jsonl.attach()
+            self.action_import_jsonl.attach()
+            self.action_update_vtable_types.attach()
             self.action_edit_typedefs.attach()
+            self.action_set_use_local_types.attach()
             self.action_set_pure_virtuals.attach()
             self.action_set_deleted_virtuals.attach()
             self.action_set_autosave_interval.attach()
             self.action_refresh_all.attach()
+            self.action_refresh_changed.attach()
+            self.action_check_consistency.attach()
+            self.action_find_vtable_owner.attach()
             self.action_clear_database.attach()
 
         self.about_action.attach()
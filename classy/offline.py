@@ -0,0 +1,387 @@
+# Loads .cdb files without IDA. The classes below stand in for the ones of classy.database_entries while unpickling,
+# they only carry the data and the queries the exporters need. Editing a database still requires the plugin, except
+# for merging, which only moves entries between databases.
+import sys
+import pickle
+import contextlib
+
+import classy.itanium_mangler as itanium_mangler
+import classy.parallel_mangler as parallel_mangler
+import classy.export as export
+from classy.hierarchy_index import HierarchyIndex
+from classy.interval_index import IntervalIndex
+from classy.mangled_index import MangledIndex
+
+
+ENTRIES_MODULE = 'classy.database_entries'
+
+DATABASE_VERSION = 1
+
+BADADDR_VALUES = [0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF]
+
+
+def is_badaddr(ea):
+    return ea in BADADDR_VALUES
+
+
+# 32 bit databases never have addresses above 0xFFFFFFFF
+def badaddr_like(ea):
+    return BADADDR_VALUES[0] if ea <= BADADDR_VALUES[0] else BADADDR_VALUES[1]
+
+
+
+class Class(object):
+    def safe_name(self):
+        return self.name.replace('::', '_')
+
+
+    def vtable_start_idx(self):
+        if self.base is None:
+            return 0
+        return len(self.base.vmethods)
+
+
+    def iter_owned_methods(self):
+        for m in self.methods:
+            yield m
+        for vm in self.vmethods:
+            if vm is not None and vm.owner == self:
+                yield vm
+
+
+    def snapshot_definition(self):
+        return export.snapshot_class_definition(self)
+
+
+
+class Method(object):
+    def type_name(self):
+        return 'regular'
+
+
+    def is_override(self):
+        return False
+
+
+    def is_pure_virtual(self):
+        return False
+
+
+    def get_signature(self, include_return_type=True, include_owner=True):
+        signature = ('%s::' % self.owner.name) if include_owner and self.owner is not None else ''
+        signature += '%s(%s)' % (self.name, self.args)
+        if self.is_const:
+            signature += ' const'
+        if include_return_type and self.return_type:
+            signature = self.return_type + ' ' + signature
+        return signature
+
+
+    def get_mangled(self):
+        return itanium_mangler.mangle_function(self.get_signature(False), get().typedef_table(),
+                                               self.ctor_type, self.dtor_type)
+
+
+    def get_cached_mangled(self):
+        mangled = get().mangled_index.get_mangled(self)
+        if mangled is None:
+            mangled = self.get_mangled()
+        return mangled
+
+
+
+class VirtualMethod(Method):
+    def type_name(self):
+        return 'virtual'
+
+
+
+class PureVirtualMethod(VirtualMethod):
+    def is_pure_virtual(self):
+        return True
+
+
+    def type_name(self):
+        return 'pure virtual'
+
+
+
+class DeletedVirtualMethod(PureVirtualMethod):
+    def type_name(self):
+        return 'deleted virtual'
+
+
+
+class OverrideMethod(VirtualMethod):
+    def is_override(self):
+        return True
+
+
+    def type_name(self):
+        return 'override'
+
+
+
+class PureVirtualOverrideMethod(OverrideMethod):
+    def is_pure_virtual(self):
+        return True
+
+
+    def type_name(self):
+        return 'pure virtual override'
+
+
+
+class DeletedOverrideMethod(PureVirtualOverrideMethod):
+    def type_name(self):
+        return 'deleted override'
+
+
+
+class NullMethod(Method):
+    def type_name(self):
+        return 'null'
+
+
+
+ENTRY_CLASSES = [Class, Method, VirtualMethod, PureVirtualMethod, DeletedVirtualMethod, OverrideMethod,
+                 PureVirtualOverrideMethod, DeletedOverrideMethod, NullMethod]
+
+# Pickled under the names of the plugin classes, so databases saved here open in the plugin again
+for cls in ENTRY_CLASSES:
+    cls.__module__ = ENTRIES_MODULE
+
+
+# Makes this module stand in for classy.database_entries while pickling, unless the real one is loaded
+@contextlib.contextmanager
+def entries_module_alias():
+    if ENTRIES_MODULE in sys.modules:
+        yield
+        return
+    sys.modules[ENTRIES_MODULE] = sys.modules[__name__]
+    try:
+        yield
+    finally:
+        del sys.modules[ENTRIES_MODULE]
+
+
+
+class OfflineDatabase(object):
+
+    HASH_DEFAULTS = ['classes_by_name', 'classes_by_struct_id', 'known_methods', 'typedefs']
+    LIST_DEFAULTS = ['root_classes', 'pure_virtual_vals', 'deleted_virtual_vals']
+
+    def __init__(self, data, path=None):
+        self.data = data
+        self.path = path
+        self.hierarchy = HierarchyIndex(lambda: self.root_classes)
+        self.mangled_index = MangledIndex()
+        self.mangle_errors = {}
+        self.compiled_typedefs = None
+
+
+    def __getattr__(self, key):
+        if key == 'data':
+            raise AttributeError(key)
+        try:
+            return self.data[key]
+        except KeyError:
+            if key in self.HASH_DEFAULTS:
+                return self.data.setdefault(key, {})
+            if key in self.LIST_DEFAULTS:
+                return self.data.setdefault(key, [])
+            raise AttributeError('Classy database has no attribute %s' % key)
+
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f, entries_module_alias():
+            data = pickle.load(f)
+
+        if not isinstance(data, dict) or 'version' not in data:
+            raise ValueError('Database is corrupt!')
+        if data['version'] != DATABASE_VERSION:
+            raise ValueError('Version Mismatch! File: %s, Tool: %s' % (data['version'], DATABASE_VERSION))
+
+        db = OfflineDatabase(data, path)
+        db.activate()
+        return db
+
+
+    def save(self, path):
+        with open(path, 'wb') as f, entries_module_alias():
+            pickle.dump(self.data, f)
+
+
+    # The database the methods mangle against, like database.get() in the plugin
+    def activate(self):
+        global current
+        current = self
+
+
+    def typedef_table(self):
+        if self.compiled_typedefs is None:
+            self.compiled_typedefs = itanium_mangler.compile_typedefs(self.typedefs)
+        return self.compiled_typedefs
+
+
+    def iter_methods(self):
+        for c in self.classes_by_name.values():
+            for m in c.iter_owned_methods():
+                yield m
+
+
+    # Mangles all methods with an address on a process pool, like the plugin does. Failures end up in mangle_errors.
+    def mangle_all(self):
+        self.mangled_index.clear()
+        self.mangle_errors = {}
+
+        methods = [m for m in self.iter_methods() if not is_badaddr(m.ea)]
+        items = [(m.get_signature(False), m.ctor_type, m.dtor_type) for m in methods]
+        for m, (ok, result) in zip(methods, parallel_mangler.mangle_many(items, self.typedef_table())):
+            if ok:
+                self.mangled_index.set(m, result)
+            else:
+                self.mangle_errors[m] = result
+
+
+    def snapshot_symbols(self):
+        return export.snapshot_symbols(self.classes_by_name.values())
+
+
+    def snapshot_definitions(self):
+        return [c.snapshot_definition() for c in self.hierarchy.iter_all()]
+
+
+    def stats(self):
+        kinds = {}
+        for m in self.iter_methods():
+            kinds[m.type_name()] = kinds.get(m.type_name(), 0) + 1
+
+        classes = list(self.hierarchy.iter_all())
+        return {
+            'classes': len(classes),
+            'root classes': len(self.root_classes),
+            'max depth': max([self.hierarchy.depth(c) for c in classes] or [0]),
+            'classes with vtable': sum(1 for c in classes if c.vtable_start is not None),
+            'linked structs': len(self.classes_by_struct_id),
+            'typedefs': len(self.typedefs),
+            'methods': kinds,
+        }
+
+
+    # Moves the classes and methods of other that this database doesn't have into this database. Classes are only
+    # taken over if their base is identical in both databases, vtables don't overlap and no address is known already.
+    # Returns (added classes, added methods, conflicts).
+    def merge(self, other):
+        conflicts = []
+
+        for name, value in other.typedefs.items():
+            if name not in self.typedefs:
+                self.typedefs[name] = value
+            elif self.typedefs[name] != value:
+                conflicts.append('Typedef %s: keeping %s, not %s' % (name, self.typedefs[name], value))
+        self.compiled_typedefs = None
+
+        for key in ('pure_virtual_vals', 'deleted_virtual_vals'):
+            vals = getattr(self, key)
+            for val in getattr(other, key):
+                if val not in vals:
+                    vals.append(val)
+
+        vtables = IntervalIndex()
+        for c in self.classes_by_name.values():
+            if c.vtable_start is not None:
+                vtables.add(c.vtable_start, c.vtable_end, c)
+
+        added_classes = 0
+        added_methods = 0
+        moved = set()
+
+        for c in list(other.hierarchy.iter_all()):
+            mine = self.classes_by_name.get(c.name)
+            if mine is not None:
+                if (mine.base.name if mine.base else None) != (c.base.name if c.base else None):
+                    conflicts.append('Class %s: different base classes' % c.name)
+                for m in c.methods:
+                    if m.ea not in self.known_methods:
+                        m.owner = mine
+                        mine.methods.append(m)
+                        self.known_methods[m.ea] = m
+                        added_methods += 1
+                continue
+
+            error = self.check_merge_class(c, moved, vtables)
+            if error is not None:
+                conflicts.append('Class %s: %s' % (c.name, error))
+                continue
+
+            self.move_class(c, moved)
+            if c.vtable_start is not None:
+                vtables.add(c.vtable_start, c.vtable_end, c)
+            moved.add(c)
+            added_classes += 1
+
+        self.hierarchy.invalidate()
+        self.mangled_index.clear()
+        return added_classes, added_methods, conflicts
+
+
+    def check_merge_class(self, c, moved, vtables):
+        if c.base is not None and c.base not in moved:
+            mine = self.classes_by_name.get(c.base.name)
+            if mine is None:
+                return 'the base class was not merged'
+            if len(mine.vmethods) != len(c.base.vmethods) or mine.vtable_start != c.base.vtable_start:
+                return 'the vtable of the base class differs'
+
+        if c.vtable_start is not None and len(vtables.find_overlapping(c.vtable_start, c.vtable_end)):
+            return 'the vtable overlaps another vtable'
+
+        for m in c.iter_owned_methods():
+            if not is_badaddr(m.ea) and m.ea in self.known_methods:
+                return 'the method at 0x%X is already known' % m.ea
+
+        return None
+
+
+    # Links a class of another database into this one. Inherited vtable entries are replaced by the entries of the
+    # base class in this database.
+    def move_class(self, c, moved):
+        c.derived = []
+
+        if c.base is None:
+            self.root_classes.append(c)
+        else:
+            if c.base not in moved:
+                c.base = self.classes_by_name[c.base.name]
+                for idx, vm in enumerate(c.vmethods[:len(c.base.vmethods)]):
+                    base_vm = c.base.vmethods[idx]
+                    if vm is None or vm.owner != c:
+                        c.vmethods[idx] = base_vm
+                    elif vm.is_override():
+                        vm.base = base_vm
+                        base_vm.overrides.append(vm)
+            c.base.derived.append(c)
+
+        self.classes_by_name[c.name] = c
+
+        if not is_badaddr(c.struct_id):
+            if c.struct_id in self.classes_by_struct_id:
+                c.struct_id = badaddr_like(c.struct_id)
+            else:
+                self.classes_by_struct_id[c.struct_id] = c
+
+        for m in c.iter_owned_methods():
+            if not is_badaddr(m.ea):
+                self.known_methods[m.ea] = m
+
+
+
+current = None
+
+
+def get():
+    if current is None:
+        raise ValueError('No database loaded')
+    return current
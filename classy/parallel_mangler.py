@@ -0,0 +1,98 @@
+# Mangles many signatures at once on a process pool, also used for other pure Python bulk work. This module must not
+# import anything from IDA or Qt, the worker processes import it on their own.
+import os
+import sys
+import functools
+import multiprocessing
+import multiprocessing.spawn
+import concurrent.futures
+
+import classy.itanium_mangler as itanium_mangler
+
+
+CHUNK_SIZE = 2000
+MIN_PARALLEL_SIZE = 10000       # Spawning the workers is not worth it for less
+
+
+# Mangles a list of (signature, ctor_type, dtor_type) tuples. The results are (True, mangled) or (False, error) tuples.
+# Malformed signatures can make the mangler fail in other ways than with a ValueError, any error only fails its item.
+def mangle_chunk(typedefs, chunk):
+    ret = []
+    for signature, ctor_type, dtor_type in chunk:
+        try:
+            ret.append((True, itanium_mangler.mangle_function(signature, typedefs, ctor_type, dtor_type)))
+        except Exception as e:
+            ret.append((False, str(e) or e.__class__.__name__))
+    return ret
+
+
+# Inside of IDA sys.executable is IDA itself, so the workers have to be started with the real interpreter
+def find_python_executable():
+    names = ['python.exe', 'pythonw.exe'] if os.name == 'nt' else ['python3', 'python']
+
+    candidates = [getattr(sys, '_base_executable', None), sys.executable]
+    for prefix in [sys.exec_prefix, sys.base_exec_prefix]:
+        for name in names:
+            candidates.append(os.path.join(prefix, name))
+            candidates.append(os.path.join(prefix, 'bin', name))
+
+    for c in candidates:
+        if c and os.path.isfile(c) and os.path.basename(c).lower().startswith('python'):
+            return c
+    return None
+
+
+def get_worker_count():
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return max(1, cpus - 1)
+
+
+# Mangles all items and returns the results in order. Falls back to mangling in this process when the items are few
+# or no worker processes can be started.
+def mangle_many(items, typedefs, chunk_size=CHUNK_SIZE, max_workers=None):
+    typedefs = itanium_mangler.compile_typedefs(typedefs) if is_uncompiled(typedefs) else typedefs
+    return map_chunks(functools.partial(mangle_chunk, typedefs), items, chunk_size, max_workers)
+
+
+# Applies fn, which has to take and return a list, to chunks of the items on a process pool and returns the
+# concatenated results in order. fn must be a module level function of a module that does not import IDA or Qt.
+def map_chunks(fn, items, chunk_size=CHUNK_SIZE, max_workers=None, min_parallel_size=MIN_PARALLEL_SIZE):
+    items = list(items)
+
+    if max_workers is None:
+        max_workers = get_worker_count()
+
+    if len(items) < min_parallel_size or max_workers < 2:
+        return fn(items)
+
+    executable = find_python_executable()
+    if executable is None:
+        return fn(items)
+
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    # The executable of the spawn context is process wide, IDA's own multiprocessing users get theirs back afterwards
+    ctx = multiprocessing.get_context('spawn')
+    previous_executable = multiprocessing.spawn.get_executable()
+    ctx.set_executable(executable)
+
+    try:
+        results = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers, mp_context=ctx) as pool:
+            for r in pool.map(fn, chunks):
+                results.extend(r)
+        return results
+    except Exception:
+        # No worker processes, a broken pool or results that cannot be pickled, the work is done in this process
+        return fn(items)
+    finally:
+        ctx.set_executable(previous_executable)
+
+
+def is_uncompiled(typedefs):
+    for v in typedefs.values():
+        return isinstance(v, str)
+    return False
@@ -1,15 +1,18 @@
+# Only what is needed to register the menu is imported here. Qt, the GUI, the dialogs, the mangler and the exporters
+# are imported by the actions that use them, so IDBs without a Classy database don't pay for them.
 import os
-import re
+import sys
+import time
 import idaapi
+import idc
 
-from PyQt5 import QtWidgets, QtCore
-
-from classy.util import *
-from classy.gui import *
+from classy.util import log
 from classy.menumgr import MenuMgr, MenuState
-from classy.typedef_dialog import TypedefDialog
 
 import classy.database as database
+import classy.jobs as jobs
+import classy.struct_layout as struct_layout
+from classy.idb_hooks import ClassyIDBHooks
 
 
 class ClassyPlugin(idaapi.plugin_t):
@@ -23,29 +26,83 @@ class ClassyPlugin(idaapi.plugin_t):
     version = 'v0.0.2'
 
 
+    # load_start and preloaded_modules come from PLUGIN_ENTRY and are used for the load time report
+    def __init__(self, load_start=None, preloaded_modules=None):
+        idaapi.plugin_t.__init__(self)
+        self.load_start = load_start
+        self.preloaded_modules = preloaded_modules
+        self.gui_instance = None
+
+
     def init(self):
+        # idat has no Qt and no event loop, so neither the menu nor the jobs would work. Databases are applied headless
+        # with classy_batch.py, which opens its own database instance.
+        if not idaapi.is_idaq():
+            return idaapi.PLUGIN_SKIP
+
         self.menumgr = MenuMgr(self)
-        self.gui = ClassyGui(self)
+
+        struct_layout.cache.clear()
+        self.idb_hooks = ClassyIDBHooks()
+        self.idb_hooks.hook()
+
+        self.hexrays_hooks = None
+        try:
+            import ida_hexrays
+            if ida_hexrays.init_hexrays_plugin():
+                from classy.hexrays_hooks import ClassyHexraysHooks
+                self.hexrays_hooks = ClassyHexraysHooks()
+                self.hexrays_hooks.hook()
+        except ImportError:
+            pass
 
         db = database.create_instance()
         if db.is_created():
-            try:
-                db.open()
-            except Exception as e:
-                idaapi.warning('Loading Classy database failed: %s' % str(e))
-
-        if db.is_open:
-            self.menumgr.set_state(MenuState.DATABASE_OPENED)
+            self.open_database()
         else:
             self.menumgr.set_state(MenuState.DATABASE_CLOSED)
 
-
-        log('Loaded')
+        self.report_load_time()
 
         return idaapi.PLUGIN_KEEP
 
 
+    def report_load_time(self):
+        if self.load_start is None:
+            log('Loaded')
+            return
+
+        duration = (time.time() - self.load_start) * 1000
+        if self.preloaded_modules is None:
+            log('Loaded in %.1f ms' % duration)
+            return
+
+        imported = sorted(set(sys.modules) - self.preloaded_modules)
+        log('Loaded in %.1f ms, %d modules imported: %s' %
+            (duration, len(imported), ', '.join(m for m in imported if m.startswith('classy'))))
+
+
+    @property
+    def gui(self):
+        if self.gui_instance is None:
+            from classy.gui import ClassyGui
+            self.gui_instance = ClassyGui(self)
+        return self.gui_instance
+
+
+    # Only updates the GUI if it was shown before. Used after changes to the whole database, like imports.
+    def update_gui(self):
+        if self.gui_instance is not None and self.gui_instance.parent is not None:
+            self.gui_instance.reload_tree()
+            self.gui_instance.update_fields()
+
+
     def run(self, arg):
+        self.show_about()
+
+
+    def show_about(self):
+        from classy.widgets import show_about
         show_about()
 
 
@@ -53,7 +110,7 @@ class ClassyPlugin(idaapi.plugin_t):
         try:
             db = database.get()
 
-            if db.is_open and ask_yes_no('Do you want to save the classy database?', True):
+            if db.is_open and self.ask_yes_no('Do you want to save the classy database?', True):
                 db.save()
             db.close()
 
@@ -63,15 +120,29 @@ class ClassyPlugin(idaapi.plugin_t):
             pass
 
         self.menumgr.cleanup()
+        jobs.destroy_instance()
+
+        self.idb_hooks.unhook()
+        if self.hexrays_hooks is not None:
+            self.hexrays_hooks.unhook()
+        struct_layout.cache.clear()
 
         log('Unloaded')
 
 
+    @staticmethod
+    def ask_yes_no(text, yes_is_default=True):
+        from classy.widgets import ask_yes_no
+        return ask_yes_no(text, yes_is_default)
+
+
     def save(self):
         database.get().save()
 
 
     def save_as(self):
+        from PyQt5 import QtWidgets
+
         db = database.get()
 
         path = QtWidgets.QFileDialog.getSaveFileName(None,
@@ -93,44 +164,221 @@ class ClassyPlugin(idaapi.plugin_t):
 
 
     def create_open_database(self):
+        self.open_database()
+
+
+    # The file is read and mangled on a worker thread while IDA keeps loading, the indexes are built on the main
+    # thread once that is done. Until then only the loading entry is in the menu.
+    def open_database(self):
+        import classy.database_entries     # Unpickling needs it, IDA modules are better imported on the main thread
+
         db = database.get()
+        self.menumgr.set_state(MenuState.DATABASE_LOADING)
 
-        try:
-            db.open()
-        except Exception as e:
-            idaapi.warning('Creating/opening Classy database failed: %s' % str(e))
+        def done(result):
+            try:
+                db.finish_open(*result)
+            except Exception as e:
+                idaapi.warning('Opening Classy database failed: %s' % str(e))
+            self.update_menu_state()
+
+        jobs.get().run_in_thread('Loading Classy database', lambda job: db.load(),
+                                 on_done=done,
+                                 on_cancel=self.update_menu_state,
+                                 on_error=lambda e: self.update_menu_state())
 
-        if db.is_open:
+
+    def update_menu_state(self):
+        if database.get().is_open:
             self.menumgr.set_state(MenuState.DATABASE_OPENED)
         else:
             self.menumgr.set_state(MenuState.DATABASE_CLOSED)
 
 
+    def show_loading(self):
+        idaapi.info('The Classy database is still loading.')
+
+
     def export_all_symbols(self):
+        from PyQt5 import QtWidgets
+        import classy.export as export
+
         path = QtWidgets.QFileDialog.getSaveFileName(None,
                                                      'Export all symbols', '',
                                                      'Linker script (*.ld);;All files (*)')
         if not path[0]:
             return
 
-        f = open(path[0], 'w')
-        f.write(database.get().generate_symbols())
-        f.close()
+        snapshot = database.get().snapshot_symbols()
+
+        jobs.get().run_in_thread('Exporting all symbols', lambda job: export.write_symbols(path[0], snapshot, job),
+                                 len(snapshot) + 1,
+                                 on_done=lambda count: log('Exported %d symbols to %s' % (count, path[0])))
+
+
+
+    SYMBOL_EXPORT_MODE_NAMES = ['Single file', 'One file per class', 'One file per namespace']
+
+
+    def set_symbol_export_target(self):
+        from PyQt5 import QtWidgets
+        import classy.export as export
+
+        db = database.get()
+
+        path = QtWidgets.QFileDialog.getSaveFileName(None,
+                                                     'Incremental symbol export', db.symbol_export_path,
+                                                     'Linker script (*.ld);;All files (*)')
+        if not path[0]:
+            return False
+
+        current_idx = export.SYMBOL_EXPORT_MODES.index(db.symbol_export_mode)
+        mode_name, ok_pressed = QtWidgets.QInputDialog.getItem(None, 'Incremental symbol export', 'Output:',
+                                                               self.SYMBOL_EXPORT_MODE_NAMES, current_idx, False)
+        if not ok_pressed:
+            return False
+
+        db.symbol_export_path = path[0]
+        db.symbol_export_mode = export.SYMBOL_EXPORT_MODES[self.SYMBOL_EXPORT_MODE_NAMES.index(mode_name)]
+        return True
+
+
+    # Only rewrites the sections or files of classes that changed since the last export to the same target
+    def export_symbols_incremental(self):
+        import classy.export as export
+
+        db = database.get()
+
+        if not db.symbol_export_path and not self.set_symbol_export_target():
+            return
+
+        path = db.symbol_export_path
+        mode = db.symbol_export_mode
+        snapshot = db.snapshot_symbols()
+
+        def done(result):
+            _, dirty, written = result
+            log('Exported symbols to %s: %d changed classes, %d files written' % (path, len(dirty), written))
+
+        jobs.get().run_in_thread('Exporting changed symbols',
+                                 lambda job: export.write_symbols_incremental(path, snapshot, mode, job),
+                                 len(snapshot) * 2, on_done=done)
+
 
+    HEADER_EXPORT_MODE_NAMES = ['One header per class', 'One header per namespace']
+
+
+    def export_all_headers(self):
+        from PyQt5 import QtWidgets
+        import classy.export as export
+
+        db = database.get()
+
+        out_dir = QtWidgets.QFileDialog.getExistingDirectory(None, 'Export all C++ headers', db.header_export_path)
+        if not out_dir:
+            return
+
+        current_idx = export.HEADER_EXPORT_MODES.index(db.header_export_mode)
+        mode_name, ok_pressed = QtWidgets.QInputDialog.getItem(None, 'Export all C++ headers', 'Output:',
+                                                               self.HEADER_EXPORT_MODE_NAMES, current_idx, False)
+        if not ok_pressed:
+            return
+
+        mode = export.HEADER_EXPORT_MODES[self.HEADER_EXPORT_MODE_NAMES.index(mode_name)]
+        db.header_export_path = out_dir
+        db.header_export_mode = mode
+
+        definitions = db.snapshot_definitions()
+
+        def done(result):
+            written, unchanged = result
+            log('Exported headers to %s: %d written, %d unchanged' % (out_dir, written, unchanged))
+
+        jobs.get().run_in_thread('Exporting all C++ headers',
+                                 lambda job: export.write_headers(out_dir, definitions, mode, job),
+                                 len(definitions), on_done=done)
+
+
+    def export_jsonl(self):
+        from PyQt5 import QtWidgets
+        import classy.jsonl as jsonl
+
+        path = QtWidgets.QFileDialog.getSaveFileName(None,
+                                                     'Export JSON Lines', '',
+                                                     'JSON Lines (*.jsonl);;All files (*)')
+        if not path[0]:
+            return
+
+        db = database.get()
+        jobs.get().run('Exporting JSON Lines', jsonl.iter_write(path[0], db.iter_jsonl_records()),
+                       db.jsonl_record_count(),
+                       on_done=lambda count: log('Exported %d records to %s' % (count, path[0])))
+
+
+    def import_jsonl(self):
+        from PyQt5 import QtWidgets
+        import classy.jsonl as jsonl
+        import classy.database_entries as database_entries
+
+        path = QtWidgets.QFileDialog.getOpenFileName(None,
+                                                     'Import JSON Lines', '',
+                                                     'JSON Lines (*.jsonl);;All files (*)')
+        if not path[0]:
+            return
+
+        def done(result):
+            added_classes, added_methods, skipped = result
+            log('Imported %s: %d classes, %d methods added, %d records skipped' %
+                (path[0], added_classes, added_methods, skipped))
+            self.update_gui()
+            jobs.get().refresh_idaview()
+
+        def cancelled():
+            self.update_gui()
+            jobs.get().refresh_idaview()
+
+        jobs.get().run('Importing JSON Lines', database_entries.iter_import_records(jsonl.iter_read(path[0])),
+                       on_done=done, on_cancel=cancelled)
+
+
+    def update_vtable_types(self):
+        import classy.vtable_types as vtable_types
+
+        start = time.time()
+        updated, failed = vtable_types.update_vtable_types()
+        log('Updated %d VTable types in %.2fs' % (len(updated), time.time() - start))
+        if len(failed):
+            idaapi.warning('The VTable types of these classes have untyped entries, because their signatures could not be parsed:\n%s' %
+                           '\n'.join(failed))
 
 
     def clear_database(self):
-        if ask_yes_no('Are you really sure that you want to clear the Classy databse?\n', False):
+        if self.ask_yes_no('Are you really sure that you want to clear the Classy databse?\n', False):
             database.get().clear()
-            self.gui.update_fields()
-            idaapi.refresh_idaview_anyway()
+            self.update_gui()
+            jobs.get().refresh_idaview()
 
 
     def edit_typedefs(self):
+        from classy.typedef_dialog import TypedefDialog
         dlg = TypedefDialog()
         dlg.exec_()
 
 
+    # Changes how types are mangled, so all names are refreshed afterwards
+    def set_use_local_types(self):
+        db = database.get()
+
+        use_local_types = self.ask_yes_no('Resolve types that are no builtin type, class or typedef from the IDA local '
+                                          'types?\nCurrently: %s' % ('Yes' if db.use_local_types else 'No'),
+                                          db.use_local_types)
+        if use_local_types == db.use_local_types:
+            return
+
+        db.set_use_local_types(use_local_types)
+        self.refresh_all()
+
+
     def edit_pure_virtual_vals(self):
         db = database.get()
 
@@ -170,11 +418,78 @@ class ClassyPlugin(idaapi.plugin_t):
 
 
     def refresh_all(self):
-        database_entries.refresh_all()
-        idaapi.refresh_idaview_anyway()
+        import classy.database_entries as database_entries
+
+        scheduler = jobs.get()
+        scheduler.run('Refreshing all classes', database_entries.iter_refresh_all(), database_entries.refresh_all_size(),
+                      on_done=lambda _: scheduler.refresh_idaview(),
+                      on_cancel=scheduler.refresh_idaview)
+
+
+    # Only the entries the IDB hooks found changed
+    def refresh_changed(self):
+        db = database.get()
+        if not len(db.idb_changes):
+            log('No Classy entries were changed in the IDB')
+            return
+
+        for entry in sorted(db.idb_changes.flagged, key=db.idb_changes.describe):
+            log('Refreshing %s' % db.idb_changes.describe(entry))
+
+        scheduler = jobs.get()
+        scheduler.run('Refreshing changed entries', db.idb_changes.iter_refresh(), len(db.idb_changes),
+                      on_done=lambda _: scheduler.refresh_idaview(),
+                      on_cancel=scheduler.refresh_idaview)
+
+
+    # Compares the whole database with the IDB and offers to repair what differs
+    def check_consistency(self):
+        import classy.consistency as consistency
+
+        report = consistency.ConsistencyReport()
+        jobs.get().run('Checking the database against the IDB', consistency.iter_check(report),
+                       on_done=lambda _: self.show_consistency_report(report))
+
+
+    def show_consistency_report(self, report):
+        from PyQt5 import QtWidgets
+        import classy.consistency as consistency
+        from classy.consistency_dialog import ConsistencyDialog
+
+        report.write_log()
+        if not len(report):
+            log('The Classy database matches the IDB')
+            return
+
+        dlg = ConsistencyDialog(report)
+        if dlg.exec_() != QtWidgets.QDialog.Accepted:
+            return
+
+        scheduler = jobs.get()
+        scheduler.run('Repairing entries', consistency.iter_repair(report), len(report.repairable()),
+                      on_done=lambda _: scheduler.refresh_idaview(),
+                      on_cancel=scheduler.refresh_idaview)
+
+
+    def find_vtable_owner(self):
+        db = database.get()
+
+        ea = idc.get_screen_ea()
+        c = db.vtable_index.find(ea)
+        if c is None:
+            idaapi.warning('0x%X is not inside of any known VTable.' % ea)
+            return
+
+        idx = (ea - c.vtable_start) // 4
+        log('0x%X is VTable entry %d of %s' % (ea, idx, c.name))
+
+        self.gui.show()
+        self.gui.select_class(c, idx)
 
 
     def set_autosave_interval(self):
+        from PyQt5 import QtWidgets
+
         db = database.get()
 
         new_interval, ok_pressed = QtWidgets.QInputDialog.getInt(None, 'Set autosave interval', 'Autosave interval [seconds]:', db.autosave_interval, 10)
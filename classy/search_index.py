@@ -0,0 +1,194 @@
+import re
+import bisect
+
+
+WORD_RE = re.compile(r'[A-Za-z0-9]+')
+CAMEL_RE = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+HEX_RE = re.compile(r'^0x([0-9a-f]+)$')
+
+
+# Lowercase words of a text. With split_camel_case camel case words are also added from each of their parts on, so
+# getName is found by name too.
+def tokenize(text, split_camel_case=False):
+    if not split_camel_case:
+        return set(WORD_RE.findall(text.lower()))
+
+    tokens = set()
+    for word in WORD_RE.findall(text):
+        word_lower = word.lower()
+        tokens.add(word_lower)
+        for m in CAMEL_RE.finditer(word):
+            if m.start() > 0:
+                tokens.add(word_lower[m.start():])
+    return tokens
+
+
+# Addresses are indexed as plain hex
+def normalize_query(query):
+    query = query.strip().lower()
+    m = HEX_RE.match(query)
+    if m is not None:
+        return m.group(1)
+    return query
+
+
+# Finds entries by the words in their texts. All words are kept in sorted arrays, so the entries with a word starting
+# with some prefix are a contiguous range found by bisection. These candidates are then matched against the whole query,
+# which has to be contained in one of their texts. Each word of the query has to start a word of the texts or a camel
+# case part of the name. Words of the name, the first text, are kept apart from the others, so names are found first and
+# common words of signatures like void don't drown them.
+# The index is built from get_items, which yields (object, texts) pairs, on the first search after invalidate. Until
+# then set and remove do nothing. Afterwards they only append the words of new entries and forget removed entries, the
+# words are sorted again and the ones of removed entries dropped on the next search. Bursts of changes, like refreshing
+# all methods, don't insert into the middle of the arrays over and over this way.
+class SearchIndex(object):
+    def __init__(self, get_items):
+        self.get_items = get_items
+        self.name_words = []        # (word, entry id), sorted unless is_sorted is False
+        self.words = []
+        self.ids = {}
+        self.entries = {}           # Entry id -> (object, lowercase texts, name words, other words)
+        self.next_id = 0
+        self.is_dirty = True
+        self.is_sorted = True
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def invalidate(self):
+        self.name_words = []
+        self.words = []
+        self.ids = {}
+        self.entries = {}
+        self.is_dirty = True
+        self.is_sorted = True
+
+
+    # Sorting all words at once is much faster than inserting them one by one
+    def build(self):
+        self.invalidate()
+        for obj, texts in self.get_items():
+            name_words, words = self.add_entry(obj, texts)
+            self.name_words.extend(name_words)
+            self.words.extend(words)
+        self.name_words.sort()
+        self.words.sort()
+        self.is_dirty = False
+
+
+    def ensure_built(self):
+        if self.is_dirty:
+            self.build()
+        elif not self.is_sorted:
+            self.sort()
+
+
+    # Entry ids are never reused, so the words of removed entries are the ones without an entry
+    def sort(self):
+        self.name_words = [pair for pair in self.name_words if pair[1] in self.entries]
+        self.words = [pair for pair in self.words if pair[1] in self.entries]
+        self.name_words.sort()
+        self.words.sort()
+        self.is_sorted = True
+
+
+    # Adds an object or replaces its texts
+    def set(self, obj, texts):
+        if self.is_dirty:
+            return
+
+        entry_id = self.ids.get(obj)
+        if entry_id is not None and self.entries[entry_id][1] == [t.lower() for t in texts if t]:
+            return
+
+        self.remove(obj)
+        name_words, words = self.add_entry(obj, texts)
+        self.name_words.extend(name_words)
+        self.words.extend(words)
+        self.is_sorted = False
+
+
+    def remove(self, obj):
+        entry_id = self.ids.pop(obj, None)
+        if entry_id is None:
+            return
+
+        del self.entries[entry_id]
+        self.is_sorted = False
+
+
+    # Registers an entry and returns the (word, entry id) pairs the caller has to put into name_words and words
+    def add_entry(self, obj, texts):
+        texts = [t for t in texts if t]
+        entry_id = self.next_id
+        self.next_id += 1
+
+        name_words = tokenize(texts[0], True) if len(texts) else set()
+        words = set()
+        for text in texts[1:]:
+            words.update(tokenize(text))
+        words -= name_words
+
+        self.ids[obj] = entry_id
+        self.entries[entry_id] = (obj, [t.lower() for t in texts], name_words, words)
+        return [(w, entry_id) for w in name_words], [(w, entry_id) for w in words]
+
+
+    def count_prefix(self, prefix):
+        count = 0
+        for words in (self.name_words, self.words):
+            count += bisect.bisect_left(words, (prefix + '\x7f',)) - bisect.bisect_left(words, (prefix,))
+        return count
+
+
+    # Entries with a word starting with prefix that contain the query, shorter words first. Stops at limit results.
+    def scan(self, words, prefix, query, limit, found):
+        idx = bisect.bisect_left(words, (prefix,))
+        while idx < len(words) and len(found) < limit:
+            word, entry_id = words[idx]
+            if not word.startswith(prefix):
+                break
+            if entry_id not in found:
+                rank = self.rank(query, self.entries[entry_id][1])
+                if rank is not None:
+                    found[entry_id] = rank
+            idx += 1
+
+
+    # Returns up to limit objects, exact matches first, then prefix matches, then everything else
+    def search(self, query, limit=200):
+        self.ensure_built()
+
+        query = normalize_query(query)
+        query_words = WORD_RE.findall(query)
+        if not len(query_words):
+            return []
+
+        # Every word of the query starts where a word of the text does, so the rarest one is enough to find candidates
+        prefix = min(query_words, key=self.count_prefix)
+
+        found = {}
+        self.scan(self.name_words, prefix, query, limit, found)
+        name_matches = set(found)
+        self.scan(self.words, prefix, query, limit, found)
+
+        def sort_key(entry_id):
+            texts = self.entries[entry_id][1]
+            return (entry_id not in name_matches, found[entry_id], len(texts[0]), texts[0])
+
+        return [self.entries[entry_id][0] for entry_id in sorted(found, key=sort_key)]
+
+
+    @staticmethod
+    def rank(query, texts):
+        best = None
+        for text in texts:
+            if text == query:
+                return 0
+            if text.startswith(query):
+                best = 1
+            elif best is None and query in text:
+                best = 2
+        return best
@@ -4,9 +4,13 @@ from PyQt5 import QtWidgets, QtCore
 
 import classy.database as database
 import classy.itanium_mangler as itanium_mangler
+from classy.widgets import WordCompleter
 
 
 class SignatureDialog(QtWidgets.QDialog):
+
+    VALIDATION_DELAY = 200      # ms
+
     def __init__(self, return_type = 'void', owner_type='', name='', args='', is_const=False, ctor_type=1, dtor_type=1,
                  fixed_return_type=False, fixed_owner_type=False, fixed_name=False, fixed_args=False,
                  fixed_is_const=False, fixed_ctor_type=False, fixed_dtor_type=False):
@@ -33,6 +37,7 @@ class SignatureDialog(QtWidgets.QDialog):
         self.return_type_w.setText(self.return_type)
         self.return_type_w.setDisabled(fixed_return_type)
         self.return_type_w.textChanged.connect(self.update_signature)
+        self.return_type_completer = WordCompleter(self.return_type_w, self.complete_type)
         layout.addWidget(self.return_type_w, 1, 1)
 
         layout.addWidget(QtWidgets.QLabel('Owner type'), 2, 0)
@@ -40,6 +45,7 @@ class SignatureDialog(QtWidgets.QDialog):
         self.owner_type_w.setText(self.owner_type)
         self.owner_type_w.setDisabled(fixed_owner_type)
         self.owner_type_w.textChanged.connect(self.update_signature)
+        self.owner_type_completer = WordCompleter(self.owner_type_w, self.complete_type)
         layout.addWidget(self.owner_type_w, 2, 1)
 
         layout.addWidget(QtWidgets.QLabel('Name'), 3, 0)
@@ -54,6 +60,7 @@ class SignatureDialog(QtWidgets.QDialog):
         self.args_w.setText(self.args)
         self.args_w.setDisabled(fixed_args)
         self.args_w.textChanged.connect(self.update_signature)
+        self.args_completer = WordCompleter(self.args_w, self.complete_type)
         layout.addWidget(self.args_w, 4, 1)
 
         layout.addWidget(QtWidgets.QLabel('Const'), 5, 0)
@@ -102,7 +109,19 @@ class SignatureDialog(QtWidgets.QDialog):
         self.is_signature_valid = False
         self.mangled = None
         self.status = ''
+
+        # Inputs are only validated once typing pauses. Results are cached by input, against the typedefs as they were
+        # when the dialog opened, the compiled table is replaced and not changed when they change.
+        self.typedefs = database.get().typedef_table()
+        self.validation_cache = {}
+        self.validation_key = None
+        self.validation_timer = QtCore.QTimer(self)
+        self.validation_timer.setSingleShot(True)
+        self.validation_timer.setInterval(self.VALIDATION_DELAY)
+        self.validation_timer.timeout.connect(self.validate)
+
         self.update_signature()
+        self.validate()
 
     def update_signature(self):
         self.return_type = self.return_type_w.text().encode('ascii', 'replace').strip().decode() or 'void'
@@ -136,23 +155,55 @@ class SignatureDialog(QtWidgets.QDialog):
         if self.is_const:
             signature_segs.append(' const')
         self.signature = ''.join(signature_segs)
+
+        key = (self.name, self.signature, self.ctor_type, self.dtor_type)
+        if key == self.validation_key:
+            return
+        self.validation_key = key
         self.signature_w.setText(self.signature)
 
-        self.is_signature_valid = False
-        self.mangled = None
+        if key in self.validation_cache:
+            self.validation_timer.stop()
+            self.show_validation(self.validation_cache[key])
+        else:
+            self.is_signature_valid = False
+            self.status_w.setText('Checking...')
+            self.validation_timer.start()
+
+    @staticmethod
+    def complete_type(prefix):
+        return database.get().type_index.complete(prefix)
+
+    def validate(self):
+        self.validation_timer.stop()
+        key = self.validation_key
+        if key not in self.validation_cache:
+            self.validation_cache[key] = self.check_signature(*key)
+        self.show_validation(self.validation_cache[key])
+
+    # Returns the mangled name and None or None and the error
+    def check_signature(self, name, signature, ctor_type, dtor_type):
         try:
-            if not self.name or (' ' in self.name):
+            if not name or (' ' in name):
                 raise ValueError('Name is invalid')
-            self.mangled = itanium_mangler.mangle_function(self.signature, database.get().typedefs, self.ctor_type, self.dtor_type)
-            self.is_signature_valid = True
+            return itanium_mangler.mangle_function(signature, self.typedefs, ctor_type, dtor_type), None
+        except (ValueError, NotImplementedError) as e:
+            return None, str(e)
+
+    def show_validation(self, result):
+        self.mangled, error = result
+        self.is_signature_valid = error is None
+        if self.is_signature_valid:
             self.status = ''
             self.status_w.setText('Valid')
-        except (ValueError, NotImplementedError) as e:
-            self.status = str(e)
+        else:
+            self.status = error
             self.status_w.setText('Invalid: ' + self.status)
         self.mangled_w.setText(str(self.mangled))
 
     def handle_ok(self):
+        if self.validation_timer.isActive():
+            self.validate()
         if not self.is_signature_valid:
             idaapi.warning("The signature is not valid: " + self.status)
         else:
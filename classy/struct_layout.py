@@ -0,0 +1,100 @@
+from collections import namedtuple
+
+import idaapi
+import ida_typeinf
+
+
+# offset and size are in bytes (bits for bitfields), decl is the C declaration of the member
+StructMember = namedtuple('StructMember', ['offset', 'size', 'decl', 'type_name', 'is_base', 'is_padding'])
+StructLayout = namedtuple('StructLayout', ['name', 'size', 'ordinal', 'members'])
+
+
+def get_struct_tinfo(struct_id):
+    tif = ida_typeinf.tinfo_t()
+
+    # IDA 8.4 and newer can look up the type directly
+    if hasattr(tif, 'get_type_by_tid') and tif.get_type_by_tid(struct_id):
+        return tif
+
+    struct = idaapi.get_struc(struct_id)
+    if struct is None:
+        return None
+    if tif.get_numbered_type(ida_typeinf.get_idati(), struct.ordinal):
+        return tif
+    return None
+
+
+def padding_member(offset, size):
+    return StructMember(offset, size, 'unsigned char pad_%X[%d]' % (offset, size), '', False, True)
+
+
+# Reads the members of a struct through its type info. Gaps between members and at the end of the struct are
+# returned as padding members.
+def read_struct_layout(struct_id):
+    tif = get_struct_tinfo(struct_id)
+    if tif is None:
+        return None
+
+    udt = ida_typeinf.udt_type_data_t()
+    if not tif.get_udt_details(udt):
+        return None
+
+    members = []
+    next_bit = 0
+    for udm in udt:
+        gap = (udm.offset - next_bit) // 8
+        if gap > 0:
+            members.append(padding_member(next_bit // 8, gap))
+
+        decl = ida_typeinf.print_tinfo('', 0, 0, ida_typeinf.PRTYPE_1LINE, udm.type, udm.name, '')
+        if udm.is_bitfield():
+            members.append(StructMember(udm.offset, udm.size, decl, '', False, False))
+        else:
+            members.append(StructMember(udm.offset // 8, udm.size // 8, decl, udm.type.get_type_name() or '',
+                                        udm.is_baseclass(), False))
+        next_bit = udm.offset + udm.size
+
+    size = tif.get_size()
+    if size != idaapi.BADSIZE and size * 8 > next_bit and not tif.is_union():
+        tail = size - (next_bit + 7) // 8
+        if tail > 0:
+            members.append(padding_member((next_bit + 7) // 8, tail))
+
+    return StructLayout(tif.get_type_name(), size, tif.get_ordinal(), tuple(members))
+
+
+# Layouts are cached until IDA reports a change of the struct (see classy.idb_hooks)
+class StructLayoutCache(object):
+    def __init__(self):
+        self.layouts = {}
+
+
+    def get(self, struct_id):
+        try:
+            return self.layouts[struct_id]
+        except KeyError:
+            layout = read_struct_layout(struct_id)
+            self.layouts[struct_id] = layout
+            return layout
+
+
+    def invalidate(self, struct_id):
+        self.layouts.pop(struct_id, None)
+
+
+    def invalidate_ordinal(self, ordinal):
+        for struct_id, layout in list(self.layouts.items()):
+            if layout is None or layout.ordinal == ordinal:
+                del self.layouts[struct_id]
+
+
+    def clear(self):
+        self.layouts = {}
+
+
+
+cache = StructLayoutCache()
+
+
+def get_layout(struct_id):
+    return cache.get(struct_id)
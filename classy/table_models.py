@@ -0,0 +1,136 @@
+from PyQt5 import QtCore
+
+import idc
+
+
+SORT_ROLE = QtCore.Qt.UserRole + 1
+
+
+# Table over a list of methods. Cells are only formatted when a view asks for them, edits of single methods are
+# announced with refresh_method. The data role UserRole returns the method of a row.
+class MethodTableModel(QtCore.QAbstractTableModel):
+
+    COLUMNS = ['Address', 'Function']
+
+    def __init__(self, parent=None):
+        super(MethodTableModel, self).__init__(parent)
+        self.methods = []
+
+
+    # The list is copied, changes to it need another set_methods
+    def set_methods(self, methods):
+        self.beginResetModel()
+        self.methods = list(methods)
+        self.endResetModel()
+
+
+    def method_at(self, row):
+        if 0 <= row < len(self.methods):
+            return self.methods[row]
+        return None
+
+
+    def refresh_method(self, m):
+        for row, other in enumerate(self.methods):
+            if other == m:
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.COLUMNS) - 1))
+
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.methods)
+
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        m = self.methods[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return self.format(m, index.row(), index.column())
+        if role == SORT_ROLE:
+            return self.sort_key(m, index.row(), index.column())
+        if role == QtCore.Qt.UserRole:
+            return m
+        return None
+
+
+    def format(self, m, row, column):
+        if column == 0:
+            return ('0x%X' % m.ea) if m.ea != idc.BADADDR else '-'
+        return m.get_signature()
+
+
+    def sort_key(self, m, row, column):
+        if column == 0:
+            return '%016X' % m.ea       # QVariant cannot hold 64 bit unsigned ints
+        return m.get_signature()
+
+
+
+class VTableModel(MethodTableModel):
+
+    COLUMNS = ['ID', 'Address', 'Function', 'Type']
+
+    def format(self, vm, row, column):
+        if column == 0:
+            return str(row)
+        if column == 3:
+            return vm.type_name()
+        return MethodTableModel.format(self, vm, row, column - 1)
+
+
+    def sort_key(self, vm, row, column):
+        if column == 0:
+            return row
+        if column == 3:
+            return vm.type_name()
+        return MethodTableModel.sort_key(self, vm, row, column - 1)
+
+
+
+# Results of a search, classes and methods. The data role UserRole returns the class or method of a row.
+class SearchResultModel(QtCore.QAbstractListModel):
+    def __init__(self, parent=None):
+        super(SearchResultModel, self).__init__(parent)
+        self.results = []
+
+
+    def set_results(self, results):
+        self.beginResetModel()
+        self.results = list(results)
+        self.endResetModel()
+
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.results)
+
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        entry = self.results[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return self.format(entry)
+        if role == QtCore.Qt.UserRole:
+            return entry
+        return None
+
+
+    @staticmethod
+    def format(entry):
+        if not hasattr(entry, 'get_signature'):
+            return 'class %s' % entry.name
+        if entry.ea == idc.BADADDR:
+            return entry.get_signature()
+        return '0x%X  %s' % (entry.ea, entry.get_signature())
@@ -0,0 +1,66 @@
+import bisect
+
+
+# Sorted type names for completion, case insensitive. The same name can come from several sources, e.g. a class and a
+# typedef, so names are counted and only dropped once the last source removes them. The index is built from get_names
+# on the first query after invalidate, until then add and remove do nothing.
+class TypeNameIndex(object):
+    def __init__(self, get_names):
+        self.get_names = get_names
+        self.keys = []              # Sorted (lowercase name, name)
+        self.counts = {}
+        self.is_dirty = True
+
+
+    def __len__(self):
+        return len(self.counts)
+
+
+    def invalidate(self):
+        self.keys = []
+        self.counts = {}
+        self.is_dirty = True
+
+
+    def build(self):
+        self.invalidate()
+        for name in self.get_names():
+            self.counts[name] = self.counts.get(name, 0) + 1
+        self.keys = sorted((name.lower(), name) for name in self.counts)
+        self.is_dirty = False
+
+
+    def ensure_built(self):
+        if self.is_dirty:
+            self.build()
+
+
+    def add(self, name):
+        if self.is_dirty:
+            return
+        count = self.counts.get(name, 0)
+        self.counts[name] = count + 1
+        if count == 0:
+            bisect.insort(self.keys, (name.lower(), name))
+
+
+    def remove(self, name):
+        if self.is_dirty or name not in self.counts:
+            return
+        self.counts[name] -= 1
+        if self.counts[name] == 0:
+            del self.counts[name]
+            del self.keys[bisect.bisect_left(self.keys, (name.lower(), name))]
+
+
+    # Up to limit names starting with prefix, in alphabetical order
+    def complete(self, prefix, limit=50):
+        self.ensure_built()
+
+        prefix = prefix.lower()
+        found = []
+        idx = bisect.bisect_left(self.keys, (prefix,))
+        while idx < len(self.keys) and len(found) < limit and self.keys[idx][0].startswith(prefix):
+            found.append(self.keys[idx][1])
+            idx += 1
+        return found
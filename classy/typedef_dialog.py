@@ -82,7 +82,7 @@ class TypedefDialog(QtWidgets.QDialog):
             return
 
         t = item.data(QtCore.Qt.UserRole)
-        del database.get().typedefs[t]
+        database.get().remove_typedef(t)
 
         self.update_list()
 
@@ -99,5 +99,5 @@ class TypedefDialog(QtWidgets.QDialog):
             idaapi.warning('That value is invalid.')
             return
 
-        database.get().typedefs[t] = val.strip()
+        database.get().set_typedef(t, val.strip())
         self.update_list()
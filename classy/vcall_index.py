@@ -0,0 +1,81 @@
+# Resolves virtual calls to the virtual methods of the database. This module does not touch IDA or Hex-Rays, the
+# decompiler side (classy.hexrays_hooks) extracts (call ea, struct id, vtable offset) tuples and feeds them in here.
+# slot_size is the pointer size of the IDB, which is also the size of a vtable entry.
+class VCallIndex(object):
+
+    def __init__(self, get_classes_by_struct_id, get_classes_by_name, slot_size):
+        self.get_classes_by_struct_id = get_classes_by_struct_id
+        self.get_classes_by_name = get_classes_by_name
+        self.slot_size = slot_size
+        self.slot_maps = {}
+        self.classes_by_vtable_type = None
+        self.function_cache = {}
+        self.generation = 0
+
+
+    # Any change to the database invalidates the per function results, vtable changes also the slot maps
+    def invalidate(self, c=None):
+        self.generation += 1
+        if c is not None:
+            self.slot_maps.pop(c, None)
+            self.classes_by_vtable_type = None
+
+
+    def clear(self):
+        self.slot_maps = {}
+        self.classes_by_vtable_type = None
+        self.function_cache = {}
+        self.generation += 1
+
+
+    def slots_of(self, c):
+        try:
+            return self.slot_maps[c]
+        except KeyError:
+            slots = {}
+            for idx, vm in enumerate(c.vmethods):
+                if vm is not None:
+                    slots[idx * self.slot_size] = vm
+            self.slot_maps[c] = slots
+            return slots
+
+
+    def class_of_struct(self, struct_id):
+        return self.get_classes_by_struct_id().get(struct_id)
+
+
+    # Classes by the name of their vtable struct (see classy.vtable_types)
+    def class_of_vtable_type(self, type_name, suffix='_vtbl'):
+        if self.classes_by_vtable_type is None:
+            self.classes_by_vtable_type = dict((c.safe_name() + suffix, c) for c in self.get_classes_by_name().values())
+        return self.classes_by_vtable_type.get(type_name)
+
+
+    def resolve(self, c, offset):
+        if c is None:
+            return None
+        return self.slots_of(c).get(offset)
+
+
+    # calls is an iterable of (call ea, class, vtable offset) tuples. Returns a dict of virtual methods by call ea,
+    # which is cached per function until the database changes.
+    def resolve_function(self, func_ea, calls):
+        cached = self.function_cache.get(func_ea)
+        if cached is not None and cached[0] == self.generation:
+            return cached[1]
+
+        results = {}
+        for call_ea, c, offset in calls:
+            vm = self.resolve(c, offset)
+            if vm is not None:
+                results[call_ea] = vm
+
+        self.function_cache[func_ea] = (self.generation, results)
+        return results
+
+
+    def get_cached(self, func_ea):
+        cached = self.function_cache.get(func_ea)
+        if cached is not None and cached[0] == self.generation:
+            return cached[1]
+        return None
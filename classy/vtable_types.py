@@ -0,0 +1,123 @@
+import re
+
+import idc
+import ida_typeinf
+
+import classy.database as database
+import classy.database_entries as database_entries
+import classy.export as export
+
+
+VTBL_SUFFIX = '_vtbl'
+
+PARSE_FLAGS = ida_typeinf.PT_SIL | getattr(ida_typeinf, 'PT_REPLACE', 0)
+
+
+def vtable_type_name(c):
+    return c.safe_name() + VTBL_SUFFIX
+
+
+# Turns a C++ type or argument list into something the IDA C parser understands
+def to_c_types(txt):
+    return txt.replace('::', '_').replace('&', '*')
+
+
+def member_name(vm, owner_name, idx):
+    if vm.name.startswith('~'):
+        name = 'dtor'
+    else:
+        name = re.sub('[^A-Za-z0-9_]', '_', vm.name)
+    return name or ('vf%X' % (idx * 4))
+
+
+# The C declaration of the vtable struct, with one function pointer per slot, inherited slots included.
+# With generic set, all arguments are left out, which is used for signatures IDA cannot parse.
+def format_vtable_struct(c, generic=False):
+    this_type = 'void *'
+    if c.struct_id != idc.BADADDR:
+        this_type = '%s *' % idc.get_struc_name(c.struct_id)
+
+    lines = ['struct %s' % vtable_type_name(c), '{']
+
+    seen_names = set()
+    for idx, vm in enumerate(c.vmethods):
+        if vm is None:
+            continue
+
+        name = member_name(vm, vm.owner.name if vm.owner is not None else c.name, idx)
+        if name in seen_names:
+            name = '%s_%X' % (name, idx * 4)
+        seen_names.add(name)
+
+        if generic:
+            lines.append('  void *%s;' % name)
+            continue
+
+        args = vm.args.strip()
+        args = ', '.join(['%sthis' % this_type] + ([to_c_types(args)] if args and args != 'void' else []))
+        return_type = to_c_types(vm.return_type) if vm.return_type else 'void'
+        lines.append('  %s (*%s)(%s);' % (return_type, name, args))
+
+    lines.append('};')
+    return '\n'.join(lines) + '\n'
+
+
+# Forgets the hashes of classes that were removed, renamed or lost their vtable, and deletes the vtable structs that
+# were created for them, unless another class still uses that name
+def remove_stale_types(db):
+    type_names = set(vtable_type_name(c) for c in db.classes_by_name.values() if len(c.vmethods))
+    for name in list(db.vtable_type_hashes):
+        c = db.classes_by_name.get(name)
+        if c is not None and len(c.vmethods):
+            continue
+        del db.vtable_type_hashes[name]
+        type_name = database_entries.Class.s_safe_name(name) + VTBL_SUFFIX
+        if type_name not in type_names and type_exists(type_name):
+            ida_typeinf.del_named_type(ida_typeinf.get_idati(), type_name, ida_typeinf.NTF_TYPE)
+
+
+def parse_decls(txt):
+    return ida_typeinf.idc_parse_types(txt, PARSE_FLAGS)
+
+
+def type_exists(name):
+    return ida_typeinf.get_named_type(ida_typeinf.get_idati(), name, ida_typeinf.NTF_TYPE) is not None
+
+
+# Creates or updates the vtable structs of all classes whose slots changed since the last run, in a single parse of
+# all declarations. If that fails, the classes are parsed one by one to find the broken ones, which get a struct with
+# untyped slots instead. Returns (updated, failed) class name lists.
+def update_vtable_types(force=False):
+    db = database.get()
+
+    remove_stale_types(db)
+
+    decls = {}
+    hashes = {}
+    for c in db.hierarchy.iter_all():
+        if not len(c.vmethods):
+            continue
+        decl = format_vtable_struct(c)
+        decl_hash = export.hash_text(decl)
+        if not force and db.vtable_type_hashes.get(c.name) == decl_hash and type_exists(vtable_type_name(c)):
+            continue
+        decls[c] = decl
+        hashes[c] = decl_hash
+
+    if not len(decls):
+        return [], []
+
+    failed = []
+    if parse_decls(''.join(decls.values())) != 0:
+        for c, decl in decls.items():
+            if parse_decls(decl) != 0:
+                failed.append(c)
+                parse_decls(format_vtable_struct(c, True))
+
+    for c in decls:
+        if c in failed:
+            db.vtable_type_hashes.pop(c.name, None)
+        else:
+            db.vtable_type_hashes[c.name] = hashes[c]
+
+    return [c.name for c in decls if c not in failed], [c.name for c in failed]
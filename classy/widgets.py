@@ -0,0 +1,101 @@
+import re
+import idaapi
+from PyQt5 import QtWidgets, QtCore
+from classy.aboutwindow import AboutWindow
+
+
+def ask_yes_no(text, yes_is_default = True):
+    ret = QtWidgets.QMessageBox.question(None, "Classy", text,
+                                         QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
+                                         defaultButton=(QtWidgets.QMessageBox.Yes
+                                                        if yes_is_default else
+                                                        QtWidgets.QMessageBox.No))
+
+    return ret == QtWidgets.QMessageBox.Yes
+
+
+def show_about():
+    AboutWindow().exec_()
+
+
+
+class ClickableQLabel(QtWidgets.QLabel):
+    clicked = QtCore.pyqtSignal()
+    doubleClicked = QtCore.pyqtSignal()
+
+    def __init__(self, parent=None):
+        QtWidgets.QLabel.__init__(self, parent)
+
+    def mousePressEvent(self, ev):
+        self.clicked.emit()
+
+    def mouseDoubleClickEvent(self, ev):
+        self.doubleClicked.emit()
+
+
+
+class EnterPressQTableView(QtWidgets.QTableView):
+    enterPressed = QtCore.pyqtSignal(QtCore.QModelIndex)
+
+    def __init__(self, parent=None):
+        super(EnterPressQTableView, self).__init__(parent)
+
+    def keyPressEvent(self, event):
+        if event.key() in [QtCore.Qt.Key_Return, QtCore.Qt.Key_Enter]:
+            index = self.currentIndex()
+            if index.isValid():
+                self.enterPressed.emit(index)
+                return
+        super(EnterPressQTableView, self).keyPressEvent(event)
+
+
+
+# Completes the word before the cursor of a line edit, e.g. one type of an argument list. complete_word returns the
+# completions for a word.
+class WordCompleter(QtWidgets.QCompleter):
+
+    WORD_RE = re.compile(r'[A-Za-z0-9_:]*$')
+
+    def __init__(self, line_edit, complete_word):
+        super(WordCompleter, self).__init__(line_edit)
+        self.line_edit = line_edit
+        self.complete_word = complete_word
+        self.word_start = 0
+
+        self.list_model = QtCore.QStringListModel(self)
+        self.setModel(self.list_model)
+        self.setWidget(line_edit)
+        self.setCompletionMode(QtWidgets.QCompleter.UnfilteredPopupCompletion)
+        self.activated[str].connect(self.insert_completion)
+        line_edit.textEdited.connect(self.update_completions)
+
+    def update_completions(self, text):
+        before = text[:self.line_edit.cursorPosition()]
+        m = self.WORD_RE.search(before)
+        word = m.group(0)
+        self.word_start = m.start()
+
+        completions = self.complete_word(word) if word else []
+        if not len(completions) or completions == [word]:
+            self.popup().hide()
+            return
+
+        self.list_model.setStringList(completions)
+        self.complete()
+
+    def insert_completion(self, completion):
+        text = self.line_edit.text()
+        end = self.line_edit.cursorPosition()
+        self.line_edit.setText(text[:self.word_start] + completion + text[end:])
+        self.line_edit.setCursorPosition(self.word_start + len(completion))
+
+
+def main_window():
+    tform = idaapi.get_current_widget()
+
+    if not tform:
+        tform = idaapi.find_widget('Output window')
+
+    widget = idaapi.PluginForm.FormToPyQtWidget(tform)
+    window = widget.window()
+    return window
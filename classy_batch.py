@@ -0,0 +1,13 @@
+# Headless entry point for idat, see classy/batch.py:
+#   idat -A -L classy.log -S"classy_batch.py game.cdb" game.elf
+import os
+import sys
+
+import idc
+
+# Only run as a script, not when IDA loads this from the plugins directory
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from classy.batch import main_and_exit
+    main_and_exit(idc.ARGV[1:])
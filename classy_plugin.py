@@ -1,7 +1,13 @@
 #from __future__ import absolute_import, division, print_function
 from __future__ import division, print_function
+import sys
+import time
 
 
 def PLUGIN_ENTRY():
+    # Measured for the load time report (see ClassyPlugin.report_load_time)
+    load_start = time.time()
+    preloaded_modules = set(sys.modules)
+
     from classy.plugin import ClassyPlugin
-    return ClassyPlugin()
+    return ClassyPlugin(load_start, preloaded_modules)
@@ -0,0 +1,250 @@
+# Runs the Hex-Rays hooks outside of IDA. The IDA modules are replaced by fakes, the ctrees are built from fake
+# expressions the way Hex-Rays represents virtual calls.
+import os
+import sys
+import types
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BADADDR = 0xFFFFFFFF
+STRUCT_IDS = {'A': 0x100, 'B': 0x200}
+
+
+def install_fake_ida():
+    for name in ['idaapi', 'idc', 'ida_bytes', 'ida_funcs', 'ida_hexrays']:
+        sys.modules.setdefault(name, types.ModuleType(name))
+
+    idaapi = sys.modules['idaapi']
+    idaapi.BADADDR = BADADDR
+    idaapi.DEF_ADDRSIZE = 4
+
+    idc = sys.modules['idc']
+    idc.BADADDR = BADADDR
+    idc.get_struc_id = lambda name: STRUCT_IDS.get(name, BADADDR)
+
+    hr = sys.modules['ida_hexrays']
+    for i, op in enumerate(['cot_cast', 'cot_ptr', 'cot_memptr', 'cot_add', 'cot_num', 'cot_call', 'cot_var']):
+        setattr(hr, op, i)
+    hr.CMAT_FINAL = 8
+    hr.CV_FAST = 0
+    hr.ITP_SEMI = 69
+    hr.RETRIEVE_ALWAYS = 1
+
+    class treeloc_t(object):
+        pass
+
+    class Hexrays_Hooks(object):
+        def __init__(self):
+            pass
+
+    class ctree_visitor_t(object):
+        def __init__(self, flags):
+            pass
+
+        def apply_to(self, e, parent):
+            stack = [e]
+            while len(stack):
+                e = stack.pop()
+                self.visit_expr(e)
+                stack.extend(s for s in (e.x, e.y) if s is not None)
+                stack.extend(e.a)
+
+    hr.treeloc_t = treeloc_t
+    hr.Hexrays_Hooks = Hexrays_Hooks
+    hr.ctree_visitor_t = ctree_visitor_t
+
+
+install_fake_ida()
+
+import ida_hexrays                                  # noqa: E402
+import classy.hexrays_hooks as hexrays_hooks        # noqa: E402
+from classy.vcall_index import VCallIndex           # noqa: E402
+
+
+class FakeType(object):
+    def __init__(self, name=None, pointed=None, objsize=1):
+        self.name = name
+        self.pointed = pointed
+        self.objsize = objsize
+
+    def is_ptr(self):
+        return self.pointed is not None
+
+    def get_pointed_object(self):
+        return self.pointed
+
+    def get_type_name(self):
+        return self.name
+
+    def get_ptrarr_objsize(self):
+        return self.objsize
+
+
+def ptr_to(name, objsize=1):
+    return FakeType(pointed=FakeType(name), objsize=objsize)
+
+
+class FakeExpr(object):
+    def __init__(self, op, x=None, y=None, type=None, m=0, ea=BADADDR, num=0, a=()):
+        self.op = op
+        self.x = x
+        self.y = y
+        self.type = type or FakeType()
+        self.m = m
+        self.ea = ea
+        self.num = num
+        self.a = list(a)
+
+    def numval(self):
+        return self.num
+
+
+def this_of(class_name):
+    return FakeExpr(ida_hexrays.cot_var, type=ptr_to(class_name))
+
+
+# this->vftable->vfXX(this), with a typed vtable struct
+def typed_vcall(ea, class_name, offset):
+    vtbl = FakeExpr(ida_hexrays.cot_memptr, x=this_of(class_name), m=0, type=ptr_to(class_name + '_vtbl'))
+    target = FakeExpr(ida_hexrays.cot_memptr, x=vtbl, m=offset)
+    return FakeExpr(ida_hexrays.cot_call, x=target, ea=ea, a=[this_of(class_name)])
+
+
+# (*(*(_DWORD **)this + n))(this), without vtable types
+def raw_vcall(ea, class_name, n, slot_size):
+    this = this_of(class_name)
+    vtbl = FakeExpr(ida_hexrays.cot_ptr, x=FakeExpr(ida_hexrays.cot_cast, x=this), type=ptr_to('_DWORD', slot_size))
+    slot = FakeExpr(ida_hexrays.cot_add, x=vtbl, y=FakeExpr(ida_hexrays.cot_num, num=n))
+    target = FakeExpr(ida_hexrays.cot_ptr, x=slot)
+    return FakeExpr(ida_hexrays.cot_call, x=target, ea=ea, a=[this])
+
+
+class FakeMethod(object):
+    def __init__(self, signature, ea):
+        self.signature = signature
+        self.ea = ea
+
+    def get_signature(self):
+        return self.signature
+
+    def type_name(self):
+        return 'pure virtual'
+
+
+class FakeClass(object):
+    def __init__(self, name, vmethods):
+        self.name = name
+        self.struct_id = STRUCT_IDS[name]
+        self.vmethods = vmethods
+
+    def safe_name(self):
+        return self.name
+
+
+class FakeCFunc(object):
+    def __init__(self, entry_ea, calls):
+        self.entry_ea = entry_ea
+        self.body = FakeExpr(ida_hexrays.cot_var, a=calls)
+        self.cmts = {}
+        self.saved = {}
+        self.save_count = 0
+
+    def get_user_cmt(self, tl, rt):
+        return self.cmts.get((tl.ea, tl.itp))
+
+    def set_user_cmt(self, tl, cmt):
+        self.cmts[(tl.ea, tl.itp)] = cmt
+
+    def save_user_cmts(self):
+        self.saved = dict(self.cmts)
+        self.save_count += 1
+
+
+class FakeDatabase(object):
+    def __init__(self, classes, slot_size=4):
+        self.is_open = True
+        self.classes_by_name = dict((c.name, c) for c in classes)
+        self.classes_by_struct_id = dict((c.struct_id, c) for c in classes)
+        self.vcall_index = VCallIndex(lambda: self.classes_by_struct_id, lambda: self.classes_by_name, slot_size)
+
+
+class HexraysHooksTest(unittest.TestCase):
+    def setUp(self):
+        self.f = FakeMethod('A::f()', 0x1000)
+        self.g = FakeMethod('A::g(int)', 0x1010)
+        self.h = FakeMethod('B::h()', BADADDR)
+        self.a = FakeClass('A', [self.f, self.g])
+        self.b = FakeClass('B', [self.f, self.g, self.h])
+        self.hooks = hexrays_hooks.ClassyHexraysHooks()
+
+    def decompile(self, db, cfunc, maturity=None):
+        with mock.patch.object(hexrays_hooks.database, 'get', return_value=db):
+            return self.hooks.maturity(cfunc, ida_hexrays.CMAT_FINAL if maturity is None else maturity)
+
+    def test_typed_vtable_call(self):
+        db = FakeDatabase([self.a, self.b])
+        cfunc = FakeCFunc(0x2000, [typed_vcall(0x2004, 'A', 4), typed_vcall(0x2008, 'B', 8)])
+
+        self.assertEqual(self.decompile(db, cfunc), 0)
+        self.assertEqual(cfunc.saved, {(0x2004, ida_hexrays.ITP_SEMI): 'A::g(int) (0x1010)',
+                                       (0x2008, ida_hexrays.ITP_SEMI): 'B::h() (pure virtual)'})
+        self.assertEqual(cfunc.save_count, 1)
+
+    def test_raw_vtable_call(self):
+        db = FakeDatabase([self.a])
+        cfunc = FakeCFunc(0x2000, [raw_vcall(0x2004, 'A', 1, 4)])
+
+        self.decompile(db, cfunc)
+        self.assertEqual(cfunc.saved, {(0x2004, ida_hexrays.ITP_SEMI): 'A::g(int) (0x1010)'})
+
+    def test_slot_size_of_64bit_databases(self):
+        db = FakeDatabase([self.b], slot_size=8)
+        cfunc = FakeCFunc(0x2000, [typed_vcall(0x2004, 'B', 16), raw_vcall(0x2008, 'B', 1, 8)])
+
+        self.decompile(db, cfunc)
+        self.assertEqual(cfunc.saved, {(0x2004, ida_hexrays.ITP_SEMI): 'B::h() (pure virtual)',
+                                       (0x2008, ida_hexrays.ITP_SEMI): 'A::g(int) (0x1010)'})
+
+    def test_unknown_slot_and_class(self):
+        db = FakeDatabase([self.a])
+        cfunc = FakeCFunc(0x2000, [typed_vcall(0x2004, 'A', 8), typed_vcall(0x2008, 'B', 0)])
+
+        self.decompile(db, cfunc)
+        self.assertEqual(cfunc.cmts, {})
+        self.assertEqual(cfunc.save_count, 0)
+
+    def test_only_final_maturity(self):
+        db = FakeDatabase([self.a])
+        cfunc = FakeCFunc(0x2000, [typed_vcall(0x2004, 'A', 0)])
+
+        self.decompile(db, cfunc, ida_hexrays.CMAT_FINAL - 1)
+        self.assertEqual(cfunc.cmts, {})
+
+    def test_closed_database(self):
+        db = FakeDatabase([self.a])
+        db.is_open = False
+        cfunc = FakeCFunc(0x2000, [typed_vcall(0x2004, 'A', 0)])
+
+        self.decompile(db, cfunc)
+        self.assertEqual(cfunc.cmts, {})
+
+    def test_unchanged_comments_are_not_saved_again(self):
+        db = FakeDatabase([self.a])
+        cfunc = FakeCFunc(0x2000, [typed_vcall(0x2004, 'A', 0)])
+
+        self.decompile(db, cfunc)
+        self.decompile(db, cfunc)
+        self.assertEqual(cfunc.save_count, 1)
+
+        # A changed database resolves the call again and updates the comment
+        self.f.signature = 'A::f2()'
+        db.vcall_index.invalidate()
+        self.decompile(db, cfunc)
+        self.assertEqual(cfunc.saved, {(0x2004, ida_hexrays.ITP_SEMI): 'A::f2() (0x1000)'})
+        self.assertEqual(cfunc.save_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()